@@ -0,0 +1,8 @@
+# The capture scripts are run from this folder and import each other by module name. Appended
+# (not prepended), so importing them from the API does not shadow its own modules such as main
+import os
+import sys
+
+_DEPTH_DIR = os.path.dirname(os.path.abspath(__file__))
+if _DEPTH_DIR not in sys.path:
+    sys.path.append(_DEPTH_DIR)
@@ -0,0 +1,91 @@
+"""
+Benchmark of the lossless depth codecs: compression ratio, encode/decode time and the
+bandwidth needed to publish every frame at 30 fps.
+
+Usage: python benchmark_depth_codec.py [--frames DIR] [--count 60] [--repeat 3]
+
+DIR holds recorded depth ROIs as .npy files or 16 bit PNGs. Without it synthetic frames
+(a box on the table with sensor noise and holes) are used.
+"""
+
+import argparse
+import glob
+import os
+import time
+
+import cv2
+import numpy as np
+
+from depth_codec import CODEC_DELTA_ZLIB, CODEC_PNG16, CODEC_RAW, decode_depth, encode_depth
+
+
+def load_frames(directory):
+    frames = []
+    for path in sorted(glob.glob(os.path.join(directory, "*"))):
+        if path.endswith(".npy"):
+            frames.append(np.load(path))
+        elif path.endswith(".png"):
+            image = cv2.imread(path, cv2.IMREAD_UNCHANGED)
+            if image is not None and image.dtype == np.uint16 and image.ndim == 2:
+                frames.append(image)
+    return frames
+
+
+def synthetic_frames(count, width=348, height=348, seed=0):
+    rng = np.random.default_rng(seed)
+    frames = []
+    for index in range(count):
+        depth = np.full((height, width), 730.0)
+        x, y = 100 + index % 20, 120
+        depth[y:y+110, x:x+150] = 660.0
+        depth += rng.normal(scale=1.5, size=depth.shape)
+        depth[rng.random(depth.shape) < 0.02] = 0
+        frames.append(depth.astype(np.uint16))
+    return frames
+
+
+def best_of(repeat, function):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Lossless depth codec comparison")
+    parser.add_argument("--frames", help="directory of recorded depth ROIs (.npy or 16 bit .png)")
+    parser.add_argument("--count", type=int, default=60, help="number of synthetic frames")
+    parser.add_argument("--repeat", type=int, default=3, help="runs per measurement, the best one is reported")
+    parser.add_argument("--fps", type=int, default=30)
+    args = parser.parse_args()
+
+    frames = load_frames(args.frames) if args.frames else synthetic_frames(args.count)
+    if not frames:
+        parser.error(f"no depth frames in {args.frames}")
+    raw_bytes = sum(frame.nbytes for frame in frames)
+
+    cases = [
+        ("raw", {"codec": CODEC_RAW}),
+        ("delta+zlib", {"codec": CODEC_DELTA_ZLIB, "level": 1}),
+        ("png16", {"codec": CODEC_PNG16}),
+    ]
+
+    print(f"{len(frames)} frames of {frames[0].shape[1]}x{frames[0].shape[0]}, best of {args.repeat}")
+    print(f"{'codec':<22}{'ratio':>8}{'encode (ms)':>13}{'decode (ms)':>13}{f'MB/s @ {args.fps} fps':>16}")
+    for (name, options) in cases:
+        payloads = [encode_depth(frame, seq, **options) for (seq, frame) in enumerate(frames)]
+        # Lossless, or the timings mean nothing
+        for (frame, payload) in zip(frames, payloads):
+            assert np.array_equal(decode_depth(payload).depth, frame)
+
+        encode_time = best_of(args.repeat, lambda: [encode_depth(frame, seq, **options) for (seq, frame) in enumerate(frames)])
+        decode_time = best_of(args.repeat, lambda: [decode_depth(payload) for payload in payloads])
+        encoded_bytes = sum(len(payload) for payload in payloads)
+        print(f"{name:<22}{raw_bytes/encoded_bytes:>8.2f}{encode_time/len(frames)*1000:>13.2f}{decode_time/len(frames)*1000:>13.2f}"
+              f"{encoded_bytes/len(frames)*args.fps/1e6:>16.2f}")
+
+
+if __name__ == "__main__":
+    main()
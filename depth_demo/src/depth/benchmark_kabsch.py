@@ -0,0 +1,138 @@
+"""
+Benchmark of the batched Kabsch / quaternion / RMSD functions against the
+per-pair implementations they replaced, called once per point set pair.
+
+Usage: python benchmark_kabsch.py [--batch 1000] [--points 54] [--repeat 5]
+"""
+
+import argparse
+import time
+
+import numpy as np
+
+import calculate_rmsd_kabsch as rmsd
+from calibration_kabsch import calculate_transformation_kabsch, calculate_transformation_kabsch_batch
+
+
+# The per-pair code as it was before the batched rewrite: the speed-up is only meaningful
+# against the code that was replaced, the batched functions called with one pair are no faster
+def baseline_kabsch(P, Q):
+    V, S, W = np.linalg.svd(np.dot(np.transpose(P), Q))
+    if (np.linalg.det(V) * np.linalg.det(W)) < 0.0:
+        V[:, -1] = -V[:, -1]
+    return np.dot(V, W)
+
+
+def baseline_rmsd(V, W):
+    D = len(V[0])
+    N = len(V)
+    value = 0.0
+    for v, w in zip(V, W):
+        value += sum([(v[i] - w[i])**2.0 for i in range(D)])
+    return np.sqrt(value/N)
+
+
+def baseline_kabsch_rmsd(P, Q):
+    return baseline_rmsd(np.dot(P, baseline_kabsch(P, Q)), Q)
+
+
+def baseline_makeW(r1, r2, r3, r4=0):
+    return np.asarray([
+        [r4, r3, -r2, r1],
+        [-r3, r4, r1, r2],
+        [r2, -r1, r4, r3],
+        [-r1, -r2, -r3, r4]])
+
+
+def baseline_makeQ(r1, r2, r3, r4=0):
+    return np.asarray([
+        [r4, -r3, r2, r1],
+        [r3, r4, -r1, r2],
+        [-r2, r1, r4, r3],
+        [-r1, -r2, -r3, r4]])
+
+
+def baseline_quaternion_rotate(X, Y):
+    N = X.shape[0]
+    W = np.asarray([baseline_makeW(*Y[k]) for k in range(N)])
+    Q = np.asarray([baseline_makeQ(*X[k]) for k in range(N)])
+    Qt_dot_W = np.asarray([np.dot(Q[k].T, W[k]) for k in range(N)])
+    A = np.sum(Qt_dot_W, axis=0)
+    eigen = np.linalg.eigh(A)
+    r = eigen[1][:, eigen[0].argmax()]
+    return baseline_makeW(*r).T.dot(baseline_makeQ(*r))[:3, :3]
+
+
+def baseline_calculate_transformation_kabsch(src_points, dst_points):
+    src_points = src_points.transpose()
+    dst_points = dst_points.transpose()
+    src_points_centered = src_points - src_points.mean(axis=0)
+    dst_points_centered = dst_points - dst_points.mean(axis=0)
+    rotation_matrix = baseline_kabsch(src_points_centered, dst_points_centered)
+    rmsd_value = baseline_kabsch_rmsd(src_points_centered, dst_points_centered)
+    translation_vector = dst_points.mean(axis=0) - np.matmul(src_points.mean(axis=0), rotation_matrix)
+    return rotation_matrix.transpose(), translation_vector.transpose(), rmsd_value
+
+
+def random_rotations(rng, batch):
+    quaternions = rng.normal(size=(batch, 4))
+    quaternions /= np.linalg.norm(quaternions, axis=1, keepdims=True)
+    return rmsd.quaternion_transform(quaternions)
+
+
+def best_of(repeat, function):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Baseline per-pair vs batched point set alignment")
+    parser.add_argument("--batch", type=int, default=1000, help="number of point set pairs")
+    parser.add_argument("--points", type=int, default=54, help="points per set (54 = 9x6 chessboard)")
+    parser.add_argument("--repeat", type=int, default=5, help="runs per measurement, the best one is reported")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    P = rng.normal(size=(args.batch, args.points, 3))
+    Q = np.matmul(P, random_rotations(rng, args.batch)) + rng.normal(scale=1e-3, size=P.shape)
+    P -= rmsd.centroid(P)[:, np.newaxis, :]
+    Q -= rmsd.centroid(Q)[:, np.newaxis, :]
+
+    cases = [
+        ("kabsch",
+            lambda: [baseline_kabsch(P[b], Q[b]) for b in range(args.batch)],
+            lambda: rmsd.kabsch(P, Q)),
+        ("quaternion_rotate",
+            lambda: [baseline_quaternion_rotate(P[b], Q[b]) for b in range(args.batch)],
+            lambda: rmsd.quaternion_rotate(P, Q)),
+        ("kabsch_rmsd",
+            lambda: [baseline_kabsch_rmsd(P[b], Q[b]) for b in range(args.batch)],
+            lambda: rmsd.kabsch_rmsd(P, Q)),
+        ("calculate_transformation_kabsch",
+            lambda: [baseline_calculate_transformation_kabsch(P[b].T, Q[b].T) for b in range(args.batch)],
+            lambda: calculate_transformation_kabsch_batch(np.swapaxes(P, 1, 2), np.swapaxes(Q, 1, 2))),
+    ]
+
+    # The batched results have to match the baseline results before their speed means anything
+    assert np.allclose(rmsd.kabsch(P, Q), np.stack([baseline_kabsch(P[b], Q[b]) for b in range(args.batch)]))
+    assert np.allclose(rmsd.quaternion_rotate(P, Q), np.stack([baseline_quaternion_rotate(P[b], Q[b]) for b in range(args.batch)]))
+    assert np.allclose(rmsd.kabsch_rmsd(P, Q), [baseline_kabsch_rmsd(P[b], Q[b]) for b in range(args.batch)])
+    rotations, translations, rmsd_values = calculate_transformation_kabsch_batch(np.swapaxes(P, 1, 2), np.swapaxes(Q, 1, 2))
+    assert np.allclose(rmsd_values, [baseline_calculate_transformation_kabsch(P[b].T, Q[b].T)[2] for b in range(args.batch)])
+    # The current per-pair entry point still agrees with the code it replaced
+    assert np.allclose(calculate_transformation_kabsch(P[0].T, Q[0].T)[0], baseline_calculate_transformation_kabsch(P[0].T, Q[0].T)[0])
+
+    print(f"{args.batch} pairs of {args.points} points, best of {args.repeat}")
+    print(f"{'function':<34}{'baseline (ms)':>15}{'batched (ms)':>15}{'speed-up':>10}")
+    for (name, baseline, batched) in cases:
+        baseline_time = best_of(args.repeat, baseline)
+        batched_time = best_of(args.repeat, batched)
+        print(f"{name:<34}{baseline_time*1000:>15.2f}{batched_time*1000:>15.2f}{baseline_time/batched_time:>9.1f}x")
+
+
+if __name__ == "__main__":
+    main()
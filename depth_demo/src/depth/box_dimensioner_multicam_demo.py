@@ -21,8 +21,11 @@ import numpy as np
 from collections import defaultdict
 from realsense_device_manager import DeviceManager
 from calibration_kabsch import PoseEstimation
+from calibration_cache import load_calibration_cache, save_calibration_cache, verify_ground_plane
+from icp_refinement import refine_transformations_icp
 from helper_functions import get_boundary_corners_2D
 from measurement_task import calculate_boundingbox_points, calculate_cumulative_pointcloud, visualise_measurements
+from warmup import wait_for_stable_devices
 
 def run_demo():
 
@@ -31,12 +34,15 @@ def run_demo():
 	resolution_height = 720 # pixels
 	frame_rate = 15  # fps
 
-	dispose_frames_for_stablisation = 30  # frames
+	calibration_frames_per_device = 5  # framesets with a detected chessboard per device
 
 	chessboard_width = 6 # squares
 	chessboard_height = 9 	# squares
 	square_size = 0.0253 # meters
 
+	calibration_cache_path = "./calibration_cache.json"
+	refine_calibration_with_icp = True
+
 	try:
 		# Enable the streams from all the intel realsense devices
 		rs_config = rs.config()
@@ -48,52 +54,75 @@ def run_demo():
 		device_manager = DeviceManager(rs.context(), rs_config)
 		device_manager.enable_all_devices()
 
-		# Allow some frames for the auto-exposure controller to stablise
-		for frame in range(dispose_frames_for_stablisation):
-			frames = device_manager.poll_frames()
-
 		assert( len(device_manager._available_devices) > 0 )
 		"""
 		1: Calibration
 		Calibrate all the available devices to the world co-ordinates.
 		For this purpose, a chessboard printout for use with opencv based calibration process is needed.
+		The calibration of a previous run is reused as long as it still matches the ground plane.
 
 		"""
-		# Get the intrinsics of the realsense device
+		# Allow the auto-exposure controllers to stablise, the cache check needs settled depth as well
+		frames, warmup_reports = wait_for_stable_devices(device_manager)
+
+		# Get the intrinsics and the extrinsics of the realsense device
 		intrinsics_devices = device_manager.get_device_intrinsics(frames)
+		extrinsics_devices = device_manager.get_depth_to_color_extrinsics(frames)
 
-                # Set the chessboard parameters for calibration
-		chessboard_params = [chessboard_height, chessboard_width, square_size]
-
-		# Estimate the pose of the chessboard in the world coordinate using the Kabsch Method
-		calibrated_device_count = 0
-		while calibrated_device_count < len(device_manager._available_devices):
-			frames = device_manager.poll_frames()
-			pose_estimator = PoseEstimation(frames, intrinsics_devices, chessboard_params)
-			transformation_result_kabsch  = pose_estimator.perform_pose_estimation()
-			object_point = pose_estimator.get_chessboard_corners_in3d()
-			calibrated_device_count = 0
+		calibration = load_calibration_cache(calibration_cache_path, device_manager, intrinsics_devices, extrinsics_devices)
+		if calibration is not None and verify_ground_plane(frames, calibration[0], intrinsics_devices, calibration[1]):
+			transformation_devices, roi_2D, rmsd_devices = calibration
+			print("Using the cached calibration from", calibration_cache_path)
+
+		else:
+			# Set the chessboard parameters for calibration
+			chessboard_params = [chessboard_height, chessboard_width, square_size]
+
+			# Estimate the pose of the chessboard in the world coordinate using the robust Kabsch Method.
+			# Every device accumulates its own chessboard detections, they do not need to succeed on the same frameset
+			pose_estimator = PoseEstimation(None, intrinsics_devices, chessboard_params, calibration_frames_per_device)
+			try:
+				while True:
+					while not pose_estimator.is_ready():
+						frames = device_manager.poll_frames()
+						pose_estimator.add_frames(frames)
+						if pose_estimator.get_pending_devices():
+							print("Place the chessboard on the plane where the object needs to be detected..")
+					transformation_result_kabsch  = pose_estimator.perform_pose_estimation()
+					object_point = pose_estimator.get_chessboard_corners_in3d()
+					if all(transformation_result_kabsch[device_info[0]][0] for device_info in device_manager._available_devices):
+						break
+					# Start over with fresh detections if a device did not have enough valid corners
+					pose_estimator.close()
+					pose_estimator = PoseEstimation(None, intrinsics_devices, chessboard_params, calibration_frames_per_device)
+			finally:
+				pose_estimator.close()
+
+			# Save the transformation object for all devices in an array to use for measurements
+			transformation_devices={}
+			rmsd_devices={}
+			chessboard_points_cumulative_3d = np.array([-1,-1,-1]).transpose()
 			for device_info in device_manager._available_devices:
 				device = device_info[0]
-				if not transformation_result_kabsch[device][0]:
-					print("Place the chessboard on the plane where the object needs to be detected..")
-				else:
-					calibrated_device_count += 1
-
-		# Save the transformation object for all devices in an array to use for measurements
-		transformation_devices={}
-		chessboard_points_cumulative_3d = np.array([-1,-1,-1]).transpose()
-		for device_info in device_manager._available_devices:
-			device = device_info[0]
-			transformation_devices[device] = transformation_result_kabsch[device][1].inverse()
-			points3D = object_point[device][2][:,object_point[device][3]]
-			points3D = transformation_devices[device].apply_transformation(points3D)
-			chessboard_points_cumulative_3d = np.column_stack( (chessboard_points_cumulative_3d,points3D) )
-
-		# Extract the bounds between which the object's dimensions are needed
-		# It is necessary for this demo that the object's length and breath is smaller than that of the chessboard
-		chessboard_points_cumulative_3d = np.delete(chessboard_points_cumulative_3d, 0, 1)
-		roi_2D = get_boundary_corners_2D(chessboard_points_cumulative_3d)
+				transformation_devices[device] = transformation_result_kabsch[device][1].inverse()
+				rmsd_devices[device] = transformation_result_kabsch[device][3]
+				points3D = object_point[device][2][:,object_point[device][3]]
+				points3D = transformation_devices[device].apply_transformation(points3D)
+				chessboard_points_cumulative_3d = np.column_stack( (chessboard_points_cumulative_3d,points3D) )
+
+			# Extract the bounds between which the object's dimensions are needed
+			# It is necessary for this demo that the object's length and breath is smaller than that of the chessboard
+			chessboard_points_cumulative_3d = np.delete(chessboard_points_cumulative_3d, 0, 1)
+			roi_2D = get_boundary_corners_2D(chessboard_points_cumulative_3d)
+
+			# Optionally remove the remaining misalignment between the devices with ICP on their overlapping clouds
+			if refine_calibration_with_icp and len(transformation_devices) > 1:
+				frames = device_manager.poll_frames()
+				transformation_devices, icp_statistics = refine_transformations_icp(frames, transformation_devices, intrinsics_devices, roi_2D)
+				for (serial, statistics) in icp_statistics.items():
+					print("ICP refinement for device", serial, ": point-to-plane RMSE", statistics["rmse_before"], "->", statistics["rmse_after"], "m after", statistics["iterations"], "iterations")
+
+			save_calibration_cache(calibration_cache_path, device_manager, transformation_devices, intrinsics_devices, extrinsics_devices, roi_2D, rmsd_devices)
 
 		print("Calibration completed... \nPlace the box in the field of view of the devices...")
 
@@ -111,9 +140,6 @@ def run_demo():
 		# Load the JSON settings file in order to enable High Accuracy preset for the realsense
 		device_manager.load_settings_json("./HighResHighAccuracyPreset.json")
 
-		# Get the extrinsics of the device to be used later
-		extrinsics_devices = device_manager.get_depth_to_color_extrinsics(frames)
-
 		# Get the calibration info as a dictionary to help with display of the measurements onto the color image instead of infra red image
 		calibration_info_devices = defaultdict(list)
 		for calibration_info in (transformation_devices, intrinsics_devices, extrinsics_devices):
@@ -70,7 +70,7 @@ def kabsch_rotate(P, Q):
     U = kabsch(P, Q)
 
     # Rotate P
-    P = np.dot(P, U)
+    P = np.matmul(P, U)
     return P
 
 
@@ -91,17 +91,20 @@ def kabsch(P, Q):
 
     http://en.wikipedia.org/wiki/Kabsch_algorithm
 
+    Stacks of point sets are aligned at once: with (B,N,D) inputs the B
+    covariance matrices are decomposed by a single batched SVD.
+
     Parameters
     ----------
     P : array
-        (N,D) matrix, where N is points and D is dimension.
+        (N,D) or (B,N,D) matrix, where N is points and D is dimension.
     Q : array
-        (N,D) matrix, where N is points and D is dimension.
+        (N,D) or (B,N,D) matrix, where N is points and D is dimension.
 
     Returns
     -------
     U : matrix
-        Rotation matrix (D,D)
+        Rotation matrix (D,D), or (B,D,D) for stacked inputs
 
     Example
     -----
@@ -110,7 +113,7 @@ def kabsch(P, Q):
     """
 
     # Computation of the covariance matrix
-    C = np.dot(np.transpose(P), Q)
+    C = np.matmul(np.swapaxes(P, -1, -2), Q)
 
     # Computation of the optimal rotation matrix
     # This can be done using singular value decomposition (SVD)
@@ -122,12 +125,11 @@ def kabsch(P, Q):
     V, S, W = np.linalg.svd(C)
     d = (np.linalg.det(V) * np.linalg.det(W)) < 0.0
 
-    if d:
-        S[-1] = -S[-1]
-        V[:, -1] = -V[:, -1]
+    # Flip the last column of V wherever the result would be a reflection
+    V[..., :, -1] = np.where(d[..., np.newaxis], -V[..., :, -1], V[..., :, -1])
 
     # Create Rotation matrix U
-    U = np.dot(V, W)
+    U = np.matmul(V, W)
 
     return U
 
@@ -150,7 +152,7 @@ def quaternion_rmsd(P, Q):
     rmsd : float
     """
     rot = quaternion_rotate(P, Q)
-    P = np.dot(P, rot)
+    P = np.matmul(P, rot)
     return rmsd(P, Q)
 
 
@@ -159,35 +161,46 @@ def quaternion_transform(r):
     Get optimal rotation
     note: translation will be zero when the centroids of each molecule are the
     same
+
+    r may be a single quaternion (4,) or a stack of quaternions (B,4)
     """
-    Wt_r = makeW(*r).T
+    r = np.moveaxis(np.asarray(r), -1, 0)
+    Wt_r = np.swapaxes(makeW(*r), -1, -2)
     Q_r = makeQ(*r)
-    rot = Wt_r.dot(Q_r)[:3, :3]
+    rot = np.matmul(Wt_r, Q_r)[..., :3, :3]
     return rot
 
 
 def makeW(r1, r2, r3, r4=0):
     """
     matrix involved in quaternion rotation
+
+    The components may be arrays, the matrices are then stacked in the
+    trailing two dimensions
     """
+    r4 = np.zeros_like(r1) + r4
     W = np.asarray([
              [r4, r3, -r2, r1],
              [-r3, r4, r1, r2],
              [r2, -r1, r4, r3],
              [-r1, -r2, -r3, r4]])
-    return W
+    return np.moveaxis(W, (0, 1), (-2, -1))
 
 
 def makeQ(r1, r2, r3, r4=0):
     """
     matrix involved in quaternion rotation
+
+    The components may be arrays, the matrices are then stacked in the
+    trailing two dimensions
     """
+    r4 = np.zeros_like(r1) + r4
     Q = np.asarray([
              [r4, -r3, r2, r1],
              [r3, r4, -r1, r2],
              [-r2, r1, r4, r3],
              [-r1, -r2, -r3, r4]])
-    return Q
+    return np.moveaxis(Q, (0, 1), (-2, -1))
 
 
 def quaternion_rotate(X, Y):
@@ -197,23 +210,22 @@ def quaternion_rotate(X, Y):
     Parameters
     ----------
     X : array
-        (N,D) matrix, where N is points and D is dimension.
+        (N,D) or (B,N,D) matrix, where N is points and D is dimension.
     Y: array
-        (N,D) matrix, where N is points and D is dimension.
+        (N,D) or (B,N,D) matrix, where N is points and D is dimension.
 
     Returns
     -------
     rot : matrix
-        Rotation matrix (D,D)
+        Rotation matrix (D,D), or (B,D,D) for stacked inputs
     """
-    N = X.shape[0]
-    W = np.asarray([makeW(*Y[k]) for k in range(N)])
-    Q = np.asarray([makeQ(*X[k]) for k in range(N)])
-    Qt_dot_W = np.asarray([np.dot(Q[k].T, W[k]) for k in range(N)])
-    W_minus_Q = np.asarray([W[k] - Q[k] for k in range(N)])
-    A = np.sum(Qt_dot_W, axis=0)
-    eigen = np.linalg.eigh(A)
-    r = eigen[1][:, eigen[0].argmax()]
+    W = makeW(*np.moveaxis(Y, -1, 0))
+    Q = makeQ(*np.moveaxis(X, -1, 0))
+    # Sum of Q[k].T . W[k] over all points k
+    A = np.einsum('...kji,...kjl->...il', Q, W)
+    eigen_values, eigen_vectors = np.linalg.eigh(A)
+    index = np.argmax(eigen_values, axis=-1)[..., np.newaxis, np.newaxis]
+    r = np.take_along_axis(eigen_vectors, index, axis=-1)[..., 0]
     rot = quaternion_transform(r)
     return rot
 
@@ -231,15 +243,15 @@ def centroid(X):
     Parameters
     ----------
     X : array
-        (N,D) matrix, where N is points and D is dimension.
+        (N,D) or (B,N,D) matrix, where N is points and D is dimension.
 
     Returns
     -------
     C : float
-        centeroid
+        centeroid, (D,) or (B,D) for stacked inputs
 
     """
-    C = X.mean(axis=0)
+    C = X.mean(axis=-2)
     return C
 
 
@@ -250,22 +262,18 @@ def rmsd(V, W):
     Parameters
     ----------
     V : array
-        (N,D) matrix, where N is points and D is dimension.
+        (N,D) or (B,N,D) matrix, where N is points and D is dimension.
     W : array
-        (N,D) matrix, where N is points and D is dimension.
+        (N,D) or (B,N,D) matrix, where N is points and D is dimension.
 
     Returns
     -------
     rmsd : float
-        Root-mean-square deviation
+        Root-mean-square deviation, (B,) for stacked inputs
 
     """
-    D = len(V[0])
-    N = len(V)
-    rmsd = 0.0
-    for v, w in zip(V, W):
-        rmsd += sum([(v[i] - w[i])**2.0 for i in range(D)])
-    return np.sqrt(rmsd/N)
+    diff = np.asarray(V) - np.asarray(W)
+    return np.sqrt(np.mean(np.sum(diff*diff, axis=-1), axis=-1))
 
 
 def write_coordinates(atoms, V, title=""):
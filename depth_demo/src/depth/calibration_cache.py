@@ -0,0 +1,205 @@
+##################################################################################################
+##       License: Apache 2.0. See LICENSE file in root directory.		                      ####
+##################################################################################################
+##                  Box Dimensioner with multiple cameras: Calibration cache 				  ####
+##################################################################################################
+
+import json
+import os
+
+import numpy as np
+import pyrealsense2 as rs
+
+from calibration_kabsch import Transformation
+from helper_functions import convert_depth_frame_to_pointcloud, get_clipped_pointcloud
+
+# Bump whenever the layout of the cache file changes, older files are then ignored
+CALIBRATION_CACHE_VERSION = 1
+
+
+def _intrinsics_to_dict(intrinsics):
+	return {
+		"width": intrinsics.width,
+		"height": intrinsics.height,
+		"ppx": intrinsics.ppx,
+		"ppy": intrinsics.ppy,
+		"fx": intrinsics.fx,
+		"fy": intrinsics.fy,
+		"model": str(intrinsics.model),
+		"coeffs": list(intrinsics.coeffs),
+	}
+
+
+def _extrinsics_to_dict(extrinsics):
+	return {
+		"rotation": list(extrinsics.rotation),
+		"translation": list(extrinsics.translation),
+	}
+
+
+def _stream_key(key):
+	"""
+	Stream keys are either rs.stream or (rs.stream, index) tuples, see DeviceManager.poll_frames()
+	"""
+	if isinstance(key, tuple):
+		return str(key[0]) + "_" + str(key[1])
+	return str(key)
+
+
+def _device_fingerprint(stream_profiles, intrinsics, extrinsics):
+	"""
+	Everything which has to be unchanged for a cached pose to be reused
+	"""
+	return {
+		"profile": stream_profiles,
+		"intrinsics": {_stream_key(key): _intrinsics_to_dict(value) for (key, value) in intrinsics.items()},
+		"extrinsics": _extrinsics_to_dict(extrinsics),
+	}
+
+
+def _same_values(cached, current, tolerance=1e-6):
+	"""
+	Compares two json-like structures, numbers with a tolerance
+	"""
+	if isinstance(cached, dict) and isinstance(current, dict):
+		return cached.keys() == current.keys() and all(_same_values(cached[key], current[key], tolerance) for key in cached)
+	if isinstance(cached, list) and isinstance(current, list):
+		return len(cached) == len(current) and all(_same_values(a, b, tolerance) for (a, b) in zip(cached, current))
+	if isinstance(cached, (int, float)) and isinstance(current, (int, float)):
+		return abs(cached - current) <= tolerance
+	return cached == current
+
+
+def save_calibration_cache(path, device_manager, transformation_devices, intrinsics_devices, extrinsics_devices, roi_2d, rmsd_devices):
+	"""
+	Serialises the result of the chessboard calibration, keyed by the serial number of the devices
+
+	Parameters:
+	-----------
+	path                   : str
+	                         The file the calibration is written to
+	device_manager         : DeviceManager
+	                         The device manager of the enabled devices
+	transformation_devices : dict
+	                         Transformation from the device to the world coordinates per serial number
+	intrinsics_devices     : dict
+	                         Intrinsics per serial number, see DeviceManager.get_device_intrinsics()
+	extrinsics_devices     : dict
+	                         Depth to colour extrinsics per serial number
+	roi_2d                 : array
+	                         The region of interest given in the following order [minX, maxX, minY, maxY]
+	rmsd_devices           : dict
+	                         RMSD of the calibration per serial number
+
+	"""
+	stream_profiles = device_manager.get_stream_profiles()
+	devices = {}
+	for (serial, transformation) in transformation_devices.items():
+		devices[serial] = _device_fingerprint(stream_profiles[serial], intrinsics_devices[serial], extrinsics_devices[serial])
+		devices[serial]["pose_mat"] = transformation.pose_mat.tolist()
+		devices[serial]["rmsd"] = float(rmsd_devices[serial])
+
+	calibration = {
+		"version": CALIBRATION_CACHE_VERSION,
+		"roi_2d": [float(value) for value in roi_2d],
+		"devices": devices,
+	}
+
+	# Write to a temporary file first, so an interrupted write never leaves a corrupt cache behind
+	temporary_path = path + ".tmp"
+	with open(temporary_path, 'w') as file:
+		json.dump(calibration, file, indent=2)
+	os.replace(temporary_path, path)
+
+
+def load_calibration_cache(path, device_manager, intrinsics_devices, extrinsics_devices):
+	"""
+	Loads a calibration written by save_calibration_cache(). The cache is only used if it has the
+	current version, covers exactly the enabled devices and was taken with the same stream profiles,
+	intrinsics and depth to colour extrinsics
+
+	Parameters:
+	-----------
+	path               : str
+	                     The file the calibration is read from
+	device_manager     : DeviceManager
+	                     The device manager of the enabled devices
+	intrinsics_devices : dict
+	                     Current intrinsics per serial number
+	extrinsics_devices : dict
+	                     Current depth to colour extrinsics per serial number
+
+	Return:
+	----------
+	calibration : tuple or None
+		(transformation_devices, roi_2d, rmsd_devices), None if there is no usable cache
+	"""
+	if not os.path.exists(path):
+		return None
+	try:
+		with open(path, 'r') as file:
+			calibration = json.load(file)
+	except (OSError, ValueError):
+		return None
+
+	if calibration.get("version") != CALIBRATION_CACHE_VERSION:
+		return None
+
+	stream_profiles = device_manager.get_stream_profiles()
+	devices = calibration["devices"]
+	if set(devices.keys()) != set(stream_profiles.keys()):
+		return None
+
+	transformation_devices = {}
+	rmsd_devices = {}
+	for (serial, device) in devices.items():
+		fingerprint = _device_fingerprint(stream_profiles[serial], intrinsics_devices[serial], extrinsics_devices[serial])
+		if not all(_same_values(device[key], value) for (key, value) in fingerprint.items()):
+			return None
+		pose_mat = np.array(device["pose_mat"])
+		transformation_devices[serial] = Transformation(pose_mat[:3,:3], pose_mat[:3,3])
+		rmsd_devices[serial] = device["rmsd"]
+
+	return transformation_devices, calibration["roi_2d"], rmsd_devices
+
+
+def verify_ground_plane(frames_devices, transformation_devices, intrinsics_devices, roi_2d, tolerance=0.005, min_inlier_ratio=0.5):
+	"""
+	Cheap check that a cached calibration still matches the scene: inside the region of interest
+	the depth of every device, transformed to the world coordinates, has to lie on the z = 0 plane
+
+	Parameters:
+	-----------
+	frames_devices         : dict
+	                         Frames of the devices as returned by DeviceManager.poll_frames()
+	transformation_devices : dict
+	                         Transformation from the device to the world coordinates per serial number
+	intrinsics_devices     : dict
+	                         Intrinsics per serial number
+	roi_2d                 : array
+	                         The region of interest given in the following order [minX, maxX, minY, maxY]
+	tolerance              : double
+	                         Maximal distance (metres) of a point to the plane to count as on the plane
+	min_inlier_ratio       : double
+	                         Minimal share of the points which have to be on the plane.
+	                         Objects left on the table reduce the share, but not the median
+
+	Return:
+	----------
+	valid : bool
+	"""
+	for (device_info, frameset) in frames_devices.items():
+		serial = device_info[0]
+		depth_image = np.asanyarray(frameset[rs.stream.depth].get_data())
+		point_cloud = np.asanyarray(convert_depth_frame_to_pointcloud(depth_image, intrinsics_devices[serial][rs.stream.depth]))
+		point_cloud = transformation_devices[serial].apply_transformation(point_cloud)
+		point_cloud = get_clipped_pointcloud(point_cloud, roi_2d)
+		if point_cloud.shape[1] == 0:
+			print("Cached calibration rejected for device", serial, ": no depth inside the region of interest")
+			return False
+		distances = np.abs(point_cloud[2,:])
+		inlier_ratio = np.count_nonzero(distances < tolerance) / distances.size
+		if np.median(distances) > tolerance or inlier_ratio < min_inlier_ratio:
+			print("Cached calibration rejected for device", serial, ": median distance to the ground plane", np.median(distances), "m,", inlier_ratio*100, "% on the plane")
+			return False
+	return True
@@ -4,11 +4,15 @@
 ##                  Box Dimensioner with multiple cameras: Helper files 					  ####
 ##################################################################################################
 
+import collections
+from concurrent.futures import ThreadPoolExecutor
+
 import pyrealsense2 as rs
 import calculate_rmsd_kabsch as rmsd
 import numpy as np
-from helper_functions import cv_find_chessboard, get_chessboard_points_3D, get_depth_at_pixel, convert_depth_pixel_to_metric_coordinate
+from helper_functions import cv_find_chessboard, get_chessboard_points_3D, get_depth_at_pixels, convert_depth_pixel_to_metric_coordinate
 from realsense_device_manager import post_process_depth_frame
+from camera_model import get_camera_model
 
 """
   _   _        _                      _____                     _    _
@@ -63,6 +67,147 @@ def calculate_transformation_kabsch(src_points, dst_points):
 
 
 
+def calculate_transformation_kabsch_batch(src_points, dst_points):
+	"""
+	Calculates the optimal rigid transformations for a stack of B point set pairs
+	at once, e.g. the hypotheses of a RANSAC or the frames of a sequence
+
+	Parameters:
+	-----------
+	src_points: array
+		(B,3,N) matrix
+	dst_points: array
+		(B,3,N) matrix
+
+	Returns:
+	-----------
+	rotation_matrix: array
+		(B,3,3) matrix
+
+	translation_vector: array
+		(B,3) matrix
+
+	rmsd_value: array
+		(B,) vector
+
+	"""
+	assert src_points.shape == dst_points.shape
+	if src_points.shape[-2] != 3:
+		raise Exception("The input data matrix had to be transposed in order to compute transformation.")
+
+	src_points = np.swapaxes(src_points, -1, -2)
+	dst_points = np.swapaxes(dst_points, -1, -2)
+
+	src_centroid = rmsd.centroid(src_points)
+	dst_centroid = rmsd.centroid(dst_points)
+	src_points_centered = src_points - src_centroid[:, np.newaxis, :]
+	dst_points_centered = dst_points - dst_centroid[:, np.newaxis, :]
+
+	rotation_matrix = rmsd.kabsch(src_points_centered, dst_points_centered)
+	rmsd_value = rmsd.rmsd(np.matmul(src_points_centered, rotation_matrix), dst_points_centered)
+
+	translation_vector = dst_centroid - np.matmul(src_centroid[:, np.newaxis, :], rotation_matrix)[:, 0, :]
+
+	return np.swapaxes(rotation_matrix, -1, -2), translation_vector, rmsd_value
+
+
+
+def calculate_transformation_residuals(src_points, dst_points, rotation_matrix, translation_vector):
+	"""
+	Calculates the distance of every transformed src point to its dst point
+
+	Parameters:
+	-----------
+	src_points, dst_points: array
+		(3,N) matrices
+	rotation_matrix: array
+		(3,3) matrix
+	translation_vector: array
+		(3,) vector
+
+	Returns:
+	-----------
+	residuals: array
+		(N,) vector of distances in the units of the points
+	"""
+	transformed_points = np.matmul(rotation_matrix, src_points) + np.reshape(translation_vector, (3,1))
+	return np.linalg.norm(transformed_points - dst_points, axis=0)
+
+
+
+def calculate_transformation_kabsch_robust(src_points, dst_points, inlier_threshold=0.005, iterations=100, trim_factor=3.0, seed=0):
+	"""
+	Calculates the rigid transformation from src_points to dst_points like
+	calculate_transformation_kabsch, but rejects outlier correspondences (e.g. corners
+	with a wrong depth value). Minimal three point hypotheses are scored RANSAC style,
+	the best consensus set is refined with Kabsch and finally trimmed by the residual median
+
+	Parameters:
+	-----------
+	src_points: array
+		(3,N) matrix
+	dst_points: array
+		(3,N) matrix
+	inlier_threshold: double
+		Maximal residual (metres) of an inlier
+	iterations: int
+		Number of RANSAC hypotheses
+	trim_factor: double
+		Points with a residual above trim_factor times the inlier median are trimmed
+	seed: int
+		Seed of the hypothesis sampling, which keeps the calibration repeatable
+
+	Returns:
+	-----------
+	rotation_matrix: array
+		(3,3) matrix
+
+	translation_vector: array
+		(3,1) matrix
+
+	rmsd_value: float
+		RMSD of the inliers
+
+	inliers: array
+		(N,) bool vector of the correspondences used for the final fit
+
+	residuals: array
+		(N,) vector of the residual of every correspondence after the final fit
+	"""
+	assert src_points.shape == dst_points.shape
+	N = src_points.shape[1]
+	rng = np.random.default_rng(seed)
+
+	inliers = np.ones(N, dtype=bool)
+	if N > 3:
+		# Draw all three point hypotheses at once and fit them with a single batched Kabsch
+		samples = np.argsort(rng.random((iterations, N)), axis=1)[:,:3]
+		src_samples = np.moveaxis(src_points[:,samples], 1, 0)
+		dst_samples = np.moveaxis(dst_points[:,samples], 1, 0)
+
+		# Skip (nearly) collinear samples, they do not define a rotation
+		edges = src_samples[:,:,1:] - src_samples[:,:,[0]]
+		usable = np.linalg.norm(np.cross(edges[:,:,0], edges[:,:,1]), axis=1) > 1e-9
+		if np.any(usable):
+			rotation_matrices, translation_vectors, _ = calculate_transformation_kabsch_batch(src_samples[usable], dst_samples[usable])
+			transformed_points = np.matmul(rotation_matrices, src_points) + translation_vectors[:,:,np.newaxis]
+			hypothesis_inliers = np.linalg.norm(transformed_points - dst_points, axis=1) < inlier_threshold
+			counts = np.count_nonzero(hypothesis_inliers, axis=1)
+			if np.max(counts) >= 3:
+				inliers = hypothesis_inliers[np.argmax(counts)]
+
+	for _ in range(3):
+		rotation_matrix, translation_vector, rmsd_value = calculate_transformation_kabsch(src_points[:,inliers], dst_points[:,inliers])
+		residuals = calculate_transformation_residuals(src_points, dst_points, rotation_matrix, translation_vector)
+		trimmed_inliers = residuals < max(inlier_threshold, trim_factor*np.median(residuals[inliers]))
+		if np.count_nonzero(trimmed_inliers) < 3 or np.array_equal(trimmed_inliers, inliers):
+			break
+		inliers = trimmed_inliers
+
+	return rotation_matrix, translation_vector, rmsd_value, inliers, residuals
+
+
+
 """
   __  __         _           ____               _                _
  |  \/  |  __ _ (_) _ __    / ___| ___   _ __  | |_  ___  _ __  | |_
@@ -120,57 +265,138 @@ class Transformation:
 
 class PoseEstimation:
 
-	def __init__(self, frames, intrinsic, chessboard_params):
+	def __init__(self, frames, intrinsic, chessboard_params, frames_per_device=1):
+		"""
+		Estimates the pose of every device relative to the chessboard
+
+		Parameters:
+		-----------
+		frames            : dict
+		                    Frames of the devices as returned by DeviceManager.poll_frames(), may be None
+		intrinsic         : dict
+		                    Intrinsics of the devices as returned by DeviceManager.get_device_intrinsics()
+		chessboard_params : [height, width, square_size]
+		frames_per_device : int
+		                    Number of framesets with a detected chessboard which are accumulated per device.
+		                    The corner positions and depths are the median over these framesets
+
+		"""
 		assert(len(chessboard_params) == 3)
-		self.frames = frames
+		self.frames = {}
 		self.intrinsic = intrinsic
 		self.chessboard_params = chessboard_params
+		self.frames_per_device = frames_per_device
+		self._observations = {}
+		# The devices are searched in parallel on every poll, the threads are kept until close()
+		self._executor = ThreadPoolExecutor(max_workers=max(1, len(intrinsic)), thread_name_prefix="PoseEstimation")
+		if frames is not None:
+			self.add_frames(frames)
+
+	def close(self):
+		"""
+		Stops the threads which search the chessboard, add_frames() cannot be called afterwards
+		"""
+		self._executor.shutdown()
+
+	def add_frames(self, frames):
+		"""
+		Searches the chessboard corners in the infrared image of every device of the frameset and
+		samples the depth at the sub-pixel corner positions. The devices accumulate their detections
+		independently, so the board does not have to be found by all devices in the same frameset.
+		Only the latest frames_per_device detections of every device are kept
+
+		Parameters:
+		-----------
+		frames : dict
+		         Frames of the devices as returned by DeviceManager.poll_frames()
+		"""
+		# The detection is dominated by OpenCV and librealsense calls which release the GIL,
+		# so the devices are searched in parallel
+		detections = list(self._executor.map(self._detect_chessboard, frames.items()))
+
+		for (info, frameset, found_corners, points2D, depths) in detections:
+			serial = info[0]
+			self.frames[info] = frameset
+			observations = self._observations.setdefault(serial, collections.deque(maxlen=self.frames_per_device))
+			if not found_corners:
+				continue
+			# The corner order of a detection may be flipped by 180 degrees, keep all detections in the order of the first one
+			if len(observations) > 0:
+				reference = observations[0][0]
+				if np.linalg.norm(points2D[:,0] - reference[:,0]) > np.linalg.norm(points2D[:,-1] - reference[:,0]):
+					points2D = points2D[:,::-1]
+					depths = depths[::-1]
+			observations.append((points2D, depths))
+
+	def _detect_chessboard(self, item):
+		"""
+		Searches the chessboard in one frameset and samples the depth at the sub-pixel corner positions
+		"""
+		(info, frameset) = item
+		serial = info[0]
+		depth_frame = post_process_depth_frame(frameset[rs.stream.depth])
+		infrared_frame = frameset[(rs.stream.infrared, 1)]
+		infrared_model = get_camera_model(self.intrinsic[serial][(rs.stream.infrared, 1)])
+		found_corners, points2D = cv_find_chessboard(depth_frame, infrared_frame, self.chessboard_params, infrared_model)
+		if not found_corners:
+			return info, frameset, False, None, None
+		points2D = points2D.reshape(2, -1)
+		depth_image = np.asanyarray(depth_frame.get_data())
+		depths = get_depth_at_pixels(depth_image, points2D[0], points2D[1], depth_frame.as_depth_frame().get_units())
+		return info, frameset, True, points2D, depths
+
+	def is_ready(self):
+		"""
+		Returns True once every device has accumulated frames_per_device chessboard detections
+		"""
+		return len(self._observations) > 0 and all(len(observations) == self.frames_per_device for observations in self._observations.values())
+
+	def get_pending_devices(self):
+		"""
+		Returns the serial numbers of the devices which still need chessboard detections
+		"""
+		return [serial for (serial, observations) in self._observations.items() if len(observations) < self.frames_per_device]
 
 	def get_chessboard_corners_in3d(self):
 		"""
-		Searches the chessboard corners in the infrared images of
-		every connected device and uses the information in the
-		corresponding depth image to calculate the 3d
-		coordinates of the chessboard corners in the coordinate system of
-		the camera
+		Uses the accumulated chessboard detections of every device to calculate the 3d
+		coordinates of the chessboard corners in the coordinate system of the camera.
+		Corner positions and depths are the median over the accumulated framesets, a corner
+		is only valid if the majority of the framesets had a valid depth for it
 
 		Returns:
 		-----------
 		corners3D : dict
 			keys: str
 				Serial number of the device
-			values: [success, points3D, validDepths]
+			values: [success, points2D, points3D, validDepths]
 				success: bool
 					Indicates wether the operation was successfull
+				points2D: array
+					(2,N) matrix with the image coordinates of the chessboard corners
 				points3d: array
 					(3,N) matrix with the coordinates of the chessboard corners
 					in the coordinate system of the camera. N is the number of corners
 					in the chessboard. May contain points with invalid depth values
-				validDephts: [bool]*
-					Sequence with length N indicating which point in points3D has a valid depth value
+				validDephts: array
+					(N,) bool vector indicating which point in points3D has a valid depth value
 		"""
 		corners3D = {}
-		for (info, frameset) in self.frames.items():
-			serial = info[0]
-			product_line = info[1]
-			depth_frame = post_process_depth_frame(frameset[rs.stream.depth])
-			infrared_frame = frameset[(rs.stream.infrared, 1)]
+		for (serial, observations) in self._observations.items():
+			corners3D[serial] = [False, None, None, None]
+			if len(observations) == 0:
+				continue
 			depth_intrinsics = self.intrinsic[serial][rs.stream.depth]
-			found_corners, points2D = cv_find_chessboard(depth_frame, infrared_frame, self.chessboard_params)
-			corners3D[serial] = [found_corners, None, None, None]
-			if found_corners:
-				points3D = np.zeros((3, len(points2D[0])))
-				validPoints = [False] * len(points2D[0])
-				for index in range(len(points2D[0])):
-					corner = points2D[:,index].flatten()
-					depth = get_depth_at_pixel(depth_frame, corner[0], corner[1])
-					if depth != 0 and depth is not None:
-						validPoints[index] = True
-						[X,Y,Z] = convert_depth_pixel_to_metric_coordinate(depth, corner[0], corner[1], depth_intrinsics)
-						points3D[0, index] = X
-						points3D[1, index] = Y
-						points3D[2, index] = Z
-				corners3D[serial] = found_corners, points2D, points3D, validPoints
+			points2D = np.median(np.stack([observation[0] for observation in observations]), axis=0)
+			depths = np.stack([observation[1] for observation in observations])
+
+			validPoints = np.count_nonzero(depths > 0, axis=0)*2 > len(observations)
+			depth = np.zeros(points2D.shape[1])
+			depth[validPoints] = np.nanmedian(np.where(depths > 0, depths, np.nan)[:,validPoints], axis=0)
+
+			[X,Y,Z] = convert_depth_pixel_to_metric_coordinate(depth, points2D[0], points2D[1], depth_intrinsics)
+			points3D = np.vstack((X, Y, Z))
+			corners3D[serial] = True, points2D, points3D, validPoints
 		return corners3D
 
 
@@ -178,7 +404,7 @@ class PoseEstimation:
 		"""
 		Calculates the extrinsic calibration from the coordinate space of the camera to the
 		coordinate space spanned by a chessboard by retrieving the 3d coordinates of the
-		chessboard with the depth information and subsequently using the kabsch algortihm
+		chessboard with the depth information and subsequently using the robust kabsch algortihm
 		for finding the optimal rigid transformation between the two coordinate spaces
 
 		Returns:
@@ -186,7 +412,7 @@ class PoseEstimation:
 		retval : dict
 		keys: str
 			Serial number of the device
-		values: [success, transformation, points2D, rmsd]
+		values: [success, transformation, points2D, rmsd, residuals]
 			success: bool
 			transformation: Transformation
 				Rigid transformation from the coordinate system of the camera to
@@ -196,12 +422,14 @@ class PoseEstimation:
 			rmsd:
 				Root mean square deviation between the observed chessboard corners and
 				the corners in the local coordinate system after transformation
+			residuals: array
+				(N,) residual of every corner in metres, NaN for corners without a valid depth
 		"""
 		corners3D = self.get_chessboard_corners_in3d()
 		retval = {}
 		for (serial, [found_corners, points2D, points3D, validPoints] ) in corners3D.items():
 			objectpoints = get_chessboard_points_3D(self.chessboard_params)
-			retval[serial] = [False, None, None, None]
+			retval[serial] = [False, None, None, None, None]
 			if found_corners == True:
 				#initial vectors are just for correct dimension
 				valid_object_points = objectpoints[:,validPoints]
@@ -212,21 +440,26 @@ class PoseEstimation:
 					print("Not enough points have a valid depth for calculating the transformation")
 
 				else:
-					[rotation_matrix, translation_vector, rmsd_value] = calculate_transformation_kabsch(valid_object_points, valid_observed_object_points)
-					retval[serial] =[True, Transformation(rotation_matrix, translation_vector), points2D, rmsd_value]
+					[rotation_matrix, translation_vector, rmsd_value, inliers, valid_residuals] = calculate_transformation_kabsch_robust(valid_object_points, valid_observed_object_points)
+					residuals = np.full(objectpoints.shape[1], np.nan)
+					residuals[validPoints] = valid_residuals
+					retval[serial] =[True, Transformation(rotation_matrix, translation_vector), points2D, rmsd_value, residuals]
 					print("RMS error for calibration with device number", serial, "is :", rmsd_value, "m")
+					print("Device", serial, "used", np.count_nonzero(inliers), "of", objectpoints.shape[1], "corners, max residual :", np.max(valid_residuals[inliers]), "m")
 		return retval
 
 
 	def find_chessboard_boundary_for_depth_image(self):
+		"""
+		Returns the bounding box [minX, maxX, minY, maxY] of the chessboard in the image of every
+		device. The latest detection of add_frames() is reused instead of searching the board again
+		"""
 		boundary = {}
 
-		for (info, frameset) in self.frames.items():
-			serial = info[0]
-			product_line = info[1]
-			depth_frame = post_process_depth_frame(frameset[rs.stream.depth])
-			infrared_frame = frameset[(rs.stream.infrared, 1)]
-			found_corners, points2D = cv_find_chessboard(depth_frame, infrared_frame, self.chessboard_params)
+		for (serial, observations) in self._observations.items():
+			if len(observations) == 0:
+				continue
+			points2D = observations[-1][0]
 			boundary[serial] = [np.floor(np.amin(points2D[0,:])).astype(int), np.floor(np.amax(points2D[0,:])).astype(int), np.floor(np.amin(points2D[1,:])).astype(int), np.floor(np.amax(points2D[1,:])).astype(int)]
 
 		return boundary
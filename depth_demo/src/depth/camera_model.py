@@ -0,0 +1,289 @@
+##################################################################################################
+##       License: Apache 2.0. See LICENSE file in root directory.		                      ####
+##################################################################################################
+##                  Box Dimensioner with multiple cameras: Camera model 					  ####
+##################################################################################################
+
+# Distortion aware camera model with per-intrinsics lookup tables
+import threading
+
+import cv2
+import numpy as np
+import pyrealsense2 as rs
+
+
+# Number of fixed-point iterations used to invert the distortion polynomial.
+# The RealSense lenses are only mildly distorted so this converges well below 1e-6 px.
+UNDISTORT_ITERATIONS = 10
+
+
+def _brown_conrady(x, y, coeffs):
+	"""
+	Apply the Brown-Conrady polynomial (OpenCV / librealsense ordering k1, k2, p1, p2, k3)
+	to normalised image coordinates
+	"""
+	k1, k2, p1, p2, k3 = coeffs
+	r2 = x*x + y*y
+	f = 1 + k1*r2 + k2*r2*r2 + k3*r2*r2*r2
+	xy = x*y
+	dx = x*f + 2*p1*xy + p2*(r2 + 2*x*x)
+	dy = y*f + 2*p2*xy + p1*(r2 + 2*y*y)
+	return dx, dy
+
+
+def _modified_brown_conrady(x, y, coeffs):
+	"""
+	Apply the modified Brown-Conrady polynomial used by librealsense, where the tangential
+	terms are evaluated on the radially scaled coordinates
+	"""
+	k1, k2, p1, p2, k3 = coeffs
+	r2 = x*x + y*y
+	f = 1 + k1*r2 + k2*r2*r2 + k3*r2*r2*r2
+	x = x*f
+	y = y*f
+	xy = x*y
+	dx = x + 2*p1*xy + p2*(r2 + 2*x*x)
+	dy = y + 2*p2*xy + p1*(r2 + 2*y*y)
+	return dx, dy
+
+
+def _invert(polynomial, x, y, coeffs):
+	"""
+	Solve polynomial(u, v) == (x, y) for (u, v) by fixed-point iteration
+	"""
+	u = x.copy()
+	v = y.copy()
+	for _ in range(UNDISTORT_ITERATIONS):
+		pu, pv = polynomial(u, v, coeffs)
+		u -= pu - x
+		v -= pv - y
+	return u, v
+
+
+class CameraModel:
+	def __init__(self, intrinsics, width=None, height=None):
+		"""
+		Distortion aware model of one imager. All lookup tables are built lazily on first use
+		and reused for every following frame, use get_camera_model() to share them between callers
+
+		Parameters:
+		-----------
+		intrinsics : rs.intrinsics
+		             The intrinsics of the imager (fx, fy, ppx, ppy, model, coeffs)
+		width      : int
+		             Width of the images the model is applied to. Defaults to intrinsics.width
+		height     : int
+		             Height of the images the model is applied to. Defaults to intrinsics.height
+
+		"""
+		self.width = int(width if width is not None else intrinsics.width)
+		self.height = int(height if height is not None else intrinsics.height)
+		self.fx = float(intrinsics.fx)
+		self.fy = float(intrinsics.fy)
+		self.ppx = float(intrinsics.ppx)
+		self.ppy = float(intrinsics.ppy)
+		self.coeffs = tuple(float(c) for c in list(intrinsics.coeffs)[:5])
+		self.model = intrinsics.model
+
+		self.is_distorted = any(c != 0 for c in self.coeffs) and self.model in (
+			rs.distortion.brown_conrady, rs.distortion.modified_brown_conrady, rs.distortion.inverse_brown_conrady)
+
+		self._ray_grid = None
+		self._undistort_maps = None
+		self._lock = threading.Lock()
+
+	@property
+	def camera_matrix(self):
+		return np.array([[self.fx, 0, self.ppx], [0, self.fy, self.ppy], [0, 0, 1]])
+
+	def _to_undistorted(self, x, y):
+		"""
+		Map normalised coordinates of the raw (distorted) image to normalised ray coordinates
+		"""
+		if not self.is_distorted:
+			return x, y
+		if self.model == rs.distortion.inverse_brown_conrady:
+			return _brown_conrady(x, y, self.coeffs)
+		if self.model == rs.distortion.modified_brown_conrady:
+			return _invert(_modified_brown_conrady, x, y, self.coeffs)
+		return _invert(_brown_conrady, x, y, self.coeffs)
+
+	def _to_distorted(self, x, y):
+		"""
+		Map normalised ray coordinates to normalised coordinates of the raw (distorted) image
+		"""
+		if not self.is_distorted:
+			return x, y
+		if self.model == rs.distortion.inverse_brown_conrady:
+			return _invert(_brown_conrady, x, y, self.coeffs)
+		if self.model == rs.distortion.modified_brown_conrady:
+			return _modified_brown_conrady(x, y, self.coeffs)
+		return _brown_conrady(x, y, self.coeffs)
+
+	@property
+	def ray_grid(self):
+		"""
+		Normalised ray coordinates (x/z, y/z) of every pixel of the raw image
+
+		Returns:
+		-----------
+		ray_x, ray_y : array
+		               (height, width) float32 matrices
+		"""
+		if self._ray_grid is None:
+			with self._lock:
+				if self._ray_grid is None:
+					u, v = np.meshgrid(np.arange(self.width, dtype=np.float64), np.arange(self.height, dtype=np.float64))
+					ray_x, ray_y = self._to_undistorted((u - self.ppx)/self.fx, (v - self.ppy)/self.fy)
+					self._ray_grid = (ray_x.astype(np.float32), ray_y.astype(np.float32))
+		return self._ray_grid
+
+	@property
+	def undistort_maps(self):
+		"""
+		initUndistortRectifyMap style lookup tables mapping every pixel of the undistorted image
+		to its source position in the raw image, in the fixed point format used by cv2.remap
+
+		Returns:
+		-----------
+		map1, map2 : array
+		             (height, width, 2) int16 and (height, width) uint16 matrices
+		"""
+		if self._undistort_maps is None:
+			with self._lock:
+				if self._undistort_maps is None:
+					u, v = np.meshgrid(np.arange(self.width, dtype=np.float64), np.arange(self.height, dtype=np.float64))
+					x, y = self._to_distorted((u - self.ppx)/self.fx, (v - self.ppy)/self.fy)
+					map_x = (x*self.fx + self.ppx).astype(np.float32)
+					map_y = (y*self.fy + self.ppy).astype(np.float32)
+					self._undistort_maps = cv2.convertMaps(map_x, map_y, cv2.CV_16SC2)
+		return self._undistort_maps
+
+	def deproject_pixels(self, pixel_x, pixel_y, depth):
+		"""
+		Convert raw image coordinates and their depth to metric coordinates
+
+		Parameters:
+		-----------
+		pixel_x, pixel_y : array or double
+		                   The image coordinates in the raw image
+		depth            : array or double
+		                   The depth values of the image points
+
+		Return:
+		----------
+		X, Y, Z : array or double
+		          The metric coordinates in the coordinate system of the imager
+		"""
+		x = (np.asarray(pixel_x, dtype=np.float64) - self.ppx)/self.fx
+		y = (np.asarray(pixel_y, dtype=np.float64) - self.ppy)/self.fy
+		x, y = self._to_undistorted(x, y)
+		return x*depth, y*depth, depth
+
+	def distort_pixels(self, points):
+		"""
+		Convert coordinates of the undistorted image back to coordinates in the raw image
+
+		Parameters:
+		-----------
+		points : array
+		         (N, 2) matrix of undistorted image coordinates
+
+		Return:
+		----------
+		points : array
+		         (N, 2) matrix of raw image coordinates
+		"""
+		points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+		if not self.is_distorted:
+			return points
+		x, y = self._to_distorted((points[:,0] - self.ppx)/self.fx, (points[:,1] - self.ppy)/self.fy)
+		return np.column_stack((x*self.fx + self.ppx, y*self.fy + self.ppy))
+
+	def undistort_roi(self, image, roi, interpolation=cv2.INTER_LINEAR):
+		"""
+		Undistort only the region of interest of an image. Without distortion the ROI is
+		returned as a view of the input image, without any copy
+
+		Parameters:
+		-----------
+		image         : array
+		                The raw image with the size of the model
+		roi           : tuple
+		                (start_x, start_y, end_x, end_y) in undistorted image coordinates
+		interpolation : int
+		                cv2 interpolation flag, use cv2.INTER_NEAREST for depth images
+
+		Return:
+		----------
+		roi_image : array
+		            The undistorted region of interest
+		"""
+		start_x, start_y, end_x, end_y = roi
+		if not self.is_distorted:
+			return image[start_y:end_y, start_x:end_x]
+		map1, map2 = self.undistort_maps
+		return cv2.remap(image, map1[start_y:end_y, start_x:end_x], map2[start_y:end_y, start_x:end_x], interpolation)
+
+	def pointcloud(self, depth_image, depth_scale=0.001, roi=None):
+		"""
+		Convert a depth map (or a region of it) to a 3D point cloud using the cached ray grid
+
+		Parameters:
+		-----------
+		depth_image : array
+		              The raw depth map with the size of the model
+		depth_scale : double
+		              Metres per depth unit
+		roi         : tuple
+		              Optional (start_x, start_y, end_x, end_y) region of the raw image
+
+		Return:
+		----------
+		x, y, z : array
+		          The coordinates in metres of all pixels with a valid depth
+		"""
+		ray_x, ray_y = self.ray_grid
+		if roi is not None:
+			start_x, start_y, end_x, end_y = roi
+			depth_image = depth_image[start_y:end_y, start_x:end_x]
+			ray_x = ray_x[start_y:end_y, start_x:end_x]
+			ray_y = ray_y[start_y:end_y, start_x:end_x]
+		depth = depth_image.ravel()
+		valid = np.flatnonzero(depth)
+		z = depth[valid] * depth_scale
+		x = ray_x.ravel()[valid] * z
+		y = ray_y.ravel()[valid] * z
+		return x, y, z
+
+
+_camera_models = {}
+_camera_models_lock = threading.Lock()
+
+
+def get_camera_model(intrinsics, width=None, height=None):
+	"""
+	Returns the shared CameraModel for the given intrinsics, so that the lookup tables are
+	built only once per imager and resolution
+
+	Parameters:
+	-----------
+	intrinsics : rs.intrinsics
+	width      : int
+	             Width of the images the model is applied to. Defaults to intrinsics.width
+	height     : int
+	             Height of the images the model is applied to. Defaults to intrinsics.height
+
+	Return:
+	----------
+	camera_model : CameraModel
+	"""
+	width = int(width if width is not None else intrinsics.width)
+	height = int(height if height is not None else intrinsics.height)
+	key = (width, height, intrinsics.fx, intrinsics.fy, intrinsics.ppx, intrinsics.ppy,
+		str(intrinsics.model), tuple(intrinsics.coeffs))
+	camera_model = _camera_models.get(key)
+	if camera_model is None:
+		with _camera_models_lock:
+			camera_model = _camera_models.setdefault(key, CameraModel(intrinsics, width, height))
+	return camera_model
@@ -0,0 +1,229 @@
+import functools
+import os
+import time
+import typing
+
+import cv2
+import numpy as np
+import pyrealsense2 as rs
+
+from camera_model import get_camera_model
+from depth_codec import DepthIntrinsics, encode_depth
+from ground_plane import load_ground_map
+from measurement import measure_object, measure_objects
+from warmup import WarmupDetector
+
+ADVANCED_MODE_JSON = os.path.join(os.path.dirname(os.path.abspath(__file__)), "jeff_test.json")
+# Written by ground_plane.py, without it the table is taken to be level at FIXED_GROUND_DISTANCE
+GROUND_CALIBRATION = os.path.join(os.path.dirname(os.path.abspath(__file__)), "ground_calibration.npz")
+
+
+class CaptureResult(typing.NamedTuple):
+    # Full colour frame with the measured box drawn in
+    color_image: np.ndarray
+    jpeg: bytes
+    # Only the dimensions which could be measured on this frame
+    measurement: dict[str, float]
+    # Undistorted raw depth ROI
+    depth_roi: np.ndarray
+    color_roi: np.ndarray
+    views: dict[str, np.ndarray]
+    # Multi object mode: the measurements of all objects, largest first (see measure_objects())
+    objects: list[dict[str, float]] | None = None
+    # Their rotated rectangles in ROI coordinates
+    rects: list[tuple] | None = None
+
+
+class CapturePipeline:
+    """
+    Single camera capture and measurement loop: RealSense set up, post-processing filters,
+    undistortion of the ROI, measurement and JPEG encoding of the annotated frame.
+
+    With multi_object every object on the table is measured, CaptureResult.measurement then
+    holds the dimensions of the largest one.
+
+    The heights are measured against the calibrated table plane of ground_calibration (see
+    ground_plane.py) if the file exists.
+
+    Used by depth/main.py and, in embedded capture mode, by the API process.
+    """
+
+    def __init__(self, roi=(254, 56, 602, 404), width=848, height=480, fps=30, advanced_mode_json=ADVANCED_MODE_JSON, verbose=True, multi_object=False,
+                 ground_calibration=GROUND_CALIBRATION):
+        self.roi = roi
+        self.width = width
+        self.height = height
+        self.fps = fps
+        self.advanced_mode_json = advanced_mode_json
+        self.verbose = verbose
+        self.multi_object = multi_object
+        self.ground_calibration = ground_calibration
+        self.ground = None
+        self.pipeline = None
+        # Filled in by start() and by the first measurement, in seconds since start()
+        self.startup_report = None
+        self.time_to_first_measurement = None
+
+    def start(self):
+        self.started_at = time.perf_counter()
+        self.time_to_first_measurement = None
+        self.pipeline = rs.pipeline()
+        config = rs.config()
+
+        # Resolve the device up front, the advanced mode preset is loaded into it
+        pipeline_wrapper = rs.pipeline_wrapper(self.pipeline)
+        pipeline_profile = config.resolve(pipeline_wrapper)
+        device = pipeline_profile.get_device()
+
+        config.enable_stream(rs.stream.depth, self.width, self.height, rs.format.z16, self.fps)
+        config.enable_stream(rs.stream.color, self.width, self.height, rs.format.bgr8, self.fps)
+
+        profile = self.pipeline.start(config)
+
+        # Depth is aligned to colour, so both ROIs are undistorted with the colour lookup tables
+        color_intrinsics = profile.get_stream(rs.stream.color).as_video_stream_profile().get_intrinsics()
+        self.intrinsics = color_intrinsics
+        self.camera_model = get_camera_model(color_intrinsics)
+
+        with open(self.advanced_mode_json, 'r') as file:
+            json_data = file.read()
+
+        advanced_mode = rs.rs400_advanced_mode(device)
+        advanced_mode.load_json(json_data)
+
+        # Give the Auto-Exposure time to adjust: wait until exposure, gain and depth fill rate settled
+        warmup = WarmupDetector(roi=self.roi)
+        while not warmup.is_ready():
+            frames = self.pipeline.wait_for_frames()
+            warmup.update(frames.get_depth_frame(), frames.get_color_frame())
+        self.startup_report = {**warmup.report(), "startup_seconds": round(time.perf_counter() - self.started_at, 3)}
+        print("Stream settled:", self.startup_report)
+
+        depth_sensor = device.first_depth_sensor()
+        self.depth_scale = depth_sensor.get_depth_scale()
+
+        self.ground = load_ground_map(self.ground_calibration, self.roi, self.depth_scale)
+        if self.ground is not None:
+            print("Measuring against the", self.ground.description)
+
+        align_to = rs.stream.color
+        self.align = rs.align(align_to)
+
+        threshold_filter = rs.threshold_filter()
+        threshold_filter.set_option(rs.option.min_distance, 0.5)
+        threshold_filter.set_option(rs.option.max_distance, 1.4)
+        dec_filter = rs.decimation_filter()
+        dec_filter.set_option(rs.option.filter_magnitude, 1.0)
+        hdr_filter = rs.hdr_merge()
+        depth_to_disparity_filter = rs.disparity_transform(True)
+        disparity_to_depth_filter = rs.disparity_transform(False)
+        spatial_filter = rs.spatial_filter()
+        spatial_filter.set_option(rs.option.filter_magnitude, 3.0)
+        spatial_filter.set_option(rs.option.filter_smooth_alpha, 0.6)
+        spatial_filter.set_option(rs.option.filter_smooth_delta, 30)
+        temporal_filter = rs.temporal_filter()
+        temporal_filter.set_option(rs.option.filter_smooth_alpha, 0.3)
+
+        self.filters = [
+            dec_filter,
+            hdr_filter,
+            depth_to_disparity_filter,
+            spatial_filter,
+            temporal_filter,
+            disparity_to_depth_filter,
+            threshold_filter
+        ]
+
+    def stop(self):
+        if self.pipeline is not None:
+            self.pipeline.stop()
+            self.pipeline = None
+
+    def filter_config(self):
+        """
+        Options of the post-processing filters in the order they are applied
+        """
+        config = []
+        for depth_filter in self.filters:
+            options = {str(option).split(".")[-1]: depth_filter.get_option(option) for option in depth_filter.get_supported_options()}
+            config.append({"filter": type(depth_filter).__name__, "options": options})
+        return config
+
+    def recording_meta(self):
+        """
+        Settings of the started pipeline, stored with a recording (see recorder.py)
+        """
+        return {
+            "roi": list(self.roi),
+            "width": self.width,
+            "height": self.height,
+            "fps": self.fps,
+            "depth_scale": self.depth_scale,
+            # Of the full frame, the recorded ROIs are undistorted
+            "intrinsics": DepthIntrinsics.from_rs(self.intrinsics, undistorted=True)._asdict(),
+            "filters": self.filter_config(),
+            # The ground map can be computed again from the plane, the ROI and the intrinsics
+            "ground_plane": self.ground.plane._asdict() if self.ground is not None else None,
+        }
+
+    def depth_encoder(self, **options):
+        """
+        encode_depth() bound to the depth scale, intrinsics and ROI of the started pipeline, for
+        ValkeyPublisher(depth_encoder=...). The depth ROI is undistorted, so no distortion is recorded
+        """
+        intrinsics = DepthIntrinsics.from_rs(self.intrinsics, undistorted=True)
+        return functools.partial(encode_depth, depth_scale=self.depth_scale, intrinsics=intrinsics, roi_origin=self.roi[:2], **options)
+
+    def process_next(self, timeout_ms=5000):
+        """
+        Waits for the next frameset and measures it
+
+        Return:
+        ----------
+        result : CaptureResult
+                 None if the frameset did not contain a depth and a colour frame
+        """
+        frames = self.pipeline.wait_for_frames(timeout_ms)
+
+        aligned_frames = self.align.process(frames)
+
+        depth_frame = aligned_frames.get_depth_frame()
+        color_frame = aligned_frames.get_color_frame()
+
+        if not depth_frame or not color_frame:
+            return None
+
+        for depth_filter in self.filters:
+            depth_frame = depth_filter.process(depth_frame)
+
+        depth_image = np.asanyarray(depth_frame.get_data())
+        color_image_raw = np.asanyarray(color_frame.get_data())
+
+        depth_image = self.camera_model.undistort_roi(depth_image, self.roi, cv2.INTER_NEAREST)
+        color_image = self.camera_model.undistort_roi(color_image_raw, self.roi)
+        color_image_copy = color_image.copy()
+
+        if self.multi_object:
+            result = measure_objects(depth_image, color_image, self.depth_scale, verbose=self.verbose, ground=self.ground)
+            objects, rects = result.measurements, result.rects
+            measurement = {key: value for (key, value) in objects[0].items() if key in ("width", "length", "height")} if objects else {}
+        else:
+            result = measure_object(depth_image, color_image, self.depth_scale, self.verbose, ground=self.ground)
+            objects, rects = None, [result.rect] if result.rect is not None else []
+            measurement = result.measurement
+
+        if self.time_to_first_measurement is None and "height" in measurement:
+            self.time_to_first_measurement = round(time.perf_counter() - self.started_at, 3)
+            print(f"First complete measurement {self.time_to_first_measurement}s after start")
+
+        for rect in rects:
+            # draw box on color image raw, shifted from ROI to image coordinates
+            (center_x, center_y), (width, length), angle = rect
+            rect = ((center_x + self.roi[0], center_y + self.roi[1]), (width, length), angle)
+            box = self.camera_model.distort_pixels(cv2.boxPoints(rect))
+            box = np.intp(box)
+            cv2.drawContours(color_image_raw, [box], 0, (0, 255, 0), 2)
+
+        return_value, encoded_image = cv2.imencode('.jpg', color_image_raw)
+
+        return CaptureResult(color_image_raw, encoded_image.tobytes(), measurement, depth_image, color_image_copy, result.views, objects, rects if self.multi_object else None)
@@ -0,0 +1,175 @@
+import struct
+import time
+import typing
+import zlib
+
+import cv2
+import numpy as np
+
+# Codecs, all of them lossless
+CODEC_RAW = 0
+# Difference to the left neighbour per row, split into low and high byte planes, then deflate
+# with run length matching only (Z_RLE), faster than and as small as the full match search here
+CODEC_DELTA_ZLIB = 1
+# 16 bit PNG, slower but readable by any image library
+CODEC_PNG16 = 2
+
+_MAGIC = b"DPC1"
+_VERSION = 1
+_FLAG_INTRINSICS = 0x1
+# magic, version, codec, flags, height, width, ROI origin x/y, depth scale, sequence number, timestamp, payload length
+_HEADER = struct.Struct("<4sBBHHHHHfQdI")
+# width, height, ppx, ppy, fx, fy, distortion model, 5 distortion coefficients
+_INTRINSICS = struct.Struct("<HHffffB5f")
+
+
+class DepthIntrinsics(typing.NamedTuple):
+    width: int
+    height: int
+    ppx: float
+    ppy: float
+    fx: float
+    fy: float
+    # Value of the rs.distortion enum
+    model: int
+    coeffs: tuple[float, float, float, float, float]
+
+    @classmethod
+    def from_rs(cls, intrinsics, undistorted=False):
+        """
+        Parameters:
+        -----------
+        intrinsics  : rs.intrinsics
+                      Intrinsics of the stream the depth was taken from
+        undistorted : bool
+                      The depth was undistorted (see camera_model.py), the distortion is dropped
+        """
+        model = getattr(intrinsics.model, "value", intrinsics.model)
+        coeffs = tuple(float(c) for c in intrinsics.coeffs)
+        if undistorted:
+            model, coeffs = 0, (0.0,) * 5
+        return cls(intrinsics.width, intrinsics.height, intrinsics.ppx, intrinsics.ppy, intrinsics.fx, intrinsics.fy, int(model), coeffs)
+
+    def to_rs(self):
+        import pyrealsense2 as rs
+
+        intrinsics = rs.intrinsics()
+        intrinsics.width, intrinsics.height = self.width, self.height
+        intrinsics.ppx, intrinsics.ppy = self.ppx, self.ppy
+        intrinsics.fx, intrinsics.fy = self.fx, self.fy
+        intrinsics.model = rs.distortion(self.model)
+        intrinsics.coeffs = list(self.coeffs)
+        return intrinsics
+
+
+class DepthPacket(typing.NamedTuple):
+    depth: np.ndarray
+    depth_scale: float
+    seq: int
+    timestamp: float
+    # Position of the ROI in the full frame, the intrinsics refer to the full frame
+    roi_origin: tuple[int, int]
+    intrinsics: DepthIntrinsics | None
+    codec: int
+
+
+def _delta_planes(depth):
+    # Neighbouring depth values are close, so the row differences (modulo 2^16) are small and
+    # their high bytes almost all 0x00 or 0xFF. Separate byte planes let zlib see those runs.
+    delta = depth.copy()
+    delta[:, 1:] -= depth[:, :-1]
+    return delta.view(np.uint8).reshape(depth.shape + (2,)).transpose(2, 0, 1).tobytes()
+
+
+def _undelta_planes(data, height, width):
+    planes = np.frombuffer(data, dtype=np.uint8).reshape(2, height, width)
+    delta = np.ascontiguousarray(planes.transpose(1, 2, 0)).view("<u2").reshape(height, width)
+    # The running sum wraps around like the differences did
+    return np.cumsum(delta, axis=1, dtype=np.uint16)
+
+
+def encode_depth(depth, seq=0, depth_scale=0.001, intrinsics=None, roi_origin=(0, 0), codec=CODEC_DELTA_ZLIB, level=1, timestamp=None):
+    """
+    Encodes a uint16 depth image with a header describing it
+
+    Parameters:
+    -----------
+    depth       : array
+                  Raw uint16 depth image, usually the undistorted ROI
+    seq         : int
+                  Sequence number of the frame, see ValkeyPublisher
+    depth_scale : double
+                  Metres per depth unit
+    intrinsics  : DepthIntrinsics
+                  Intrinsics of the full frame, optional
+    roi_origin  : tuple
+                  (x, y) of the depth image in the full frame
+    codec       : int
+                  CODEC_DELTA_ZLIB, CODEC_PNG16 or CODEC_RAW
+    level       : int
+                  zlib compression level of CODEC_DELTA_ZLIB, 1 is the fastest
+
+    Return:
+    ----------
+    payload : bytes
+    """
+    depth = np.ascontiguousarray(depth, dtype="<u2")
+    if depth.ndim != 2:
+        raise ValueError("depth has to be a single channel image")
+    height, width = depth.shape
+
+    if codec == CODEC_RAW:
+        data = depth.tobytes()
+    elif codec == CODEC_DELTA_ZLIB:
+        compressor = zlib.compressobj(level, zlib.DEFLATED, 15, 9, zlib.Z_RLE)
+        data = compressor.compress(_delta_planes(depth)) + compressor.flush()
+    elif codec == CODEC_PNG16:
+        success, encoded = cv2.imencode(".png", depth, [cv2.IMWRITE_PNG_COMPRESSION, 1])
+        if not success:
+            raise ValueError("PNG encoding failed")
+        data = encoded.tobytes()
+    else:
+        raise ValueError(f"unknown depth codec {codec}")
+
+    flags = _FLAG_INTRINSICS if intrinsics is not None else 0
+    header = _HEADER.pack(_MAGIC, _VERSION, codec, flags, height, width, roi_origin[0], roi_origin[1], depth_scale, seq,
+                          time.time() if timestamp is None else timestamp, len(data))
+    if intrinsics is not None:
+        header += _INTRINSICS.pack(intrinsics.width, intrinsics.height, intrinsics.ppx, intrinsics.ppy, intrinsics.fx, intrinsics.fy,
+                                   intrinsics.model, *intrinsics.coeffs)
+    return header + data
+
+
+def decode_depth(payload):
+    """
+    Decodes a payload of encode_depth()
+
+    Return:
+    ----------
+    packet : DepthPacket
+    """
+    payload = memoryview(payload)
+    magic, version, codec, flags, height, width, roi_x, roi_y, depth_scale, seq, timestamp, length = _HEADER.unpack_from(payload, 0)
+    if magic != _MAGIC or version != _VERSION:
+        raise ValueError(f"not a version {_VERSION} depth payload")
+
+    position = _HEADER.size
+    intrinsics = None
+    if flags & _FLAG_INTRINSICS:
+        values = _INTRINSICS.unpack_from(payload, position)
+        intrinsics = DepthIntrinsics(*values[:7], tuple(values[7:]))
+        position += _INTRINSICS.size
+    data = payload[position:position + length]
+    if len(data) != length:
+        raise ValueError("truncated depth payload")
+
+    if codec == CODEC_RAW:
+        depth = np.frombuffer(data, dtype="<u2").reshape(height, width).copy()
+    elif codec == CODEC_DELTA_ZLIB:
+        depth = _undelta_planes(zlib.decompress(data), height, width)
+    elif codec == CODEC_PNG16:
+        depth = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_UNCHANGED)
+    else:
+        raise ValueError(f"unknown depth codec {codec}")
+
+    return DepthPacket(depth, depth_scale, seq, timestamp, (roi_x, roi_y), intrinsics, codec)
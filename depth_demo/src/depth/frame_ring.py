@@ -0,0 +1,163 @@
+import json
+import os
+import struct
+import sys
+import time
+import typing
+from multiprocessing import resource_tracker, shared_memory
+
+import numpy as np
+
+FRAME_RING_NAME = "depth_frame_ring"
+
+_MAGIC = 0x474E5246  # "FRNG"
+_VERSION = 1
+# magic, version, slot count, slot capacity, latest sequence number
+_HEADER = struct.Struct("<IIIIQ")
+_HEADER_SIZE = 64
+# Behind the uint64 lock: sequence number, timestamp, jpeg length, measurement length, depth height, depth width
+_SLOT_HEADER = struct.Struct("<QdIIII")
+_SLOT_HEADER_SIZE = 64
+
+
+class RingFrame(typing.NamedTuple):
+    seq: int
+    timestamp: float
+    jpeg: bytes
+    depth: np.ndarray | None
+    measurement: dict | None
+
+
+class FrameRing:
+    """
+    Ring of fixed size slots in shared memory, written by the capture process and read by the
+    API workers on the same host.
+
+    Every slot holds the JPEG, the raw uint16 depth ROI and the measurement record of one frame
+    and is guarded by a seqlock: the writer makes the slot's lock counter odd while it writes and
+    even again afterwards, a reader copies the slot and only accepts the copy if the counter was
+    even and unchanged. Readers never block the writer, the ring only has to be deep enough that
+    the writer does not come around to a slot while it is being copied.
+    """
+
+    def __init__(self, shm: shared_memory.SharedMemory, owner: bool):
+        self.shm = shm
+        self.owner = owner
+        magic, version, self.slot_count, self.slot_capacity, _ = _HEADER.unpack_from(shm.buf, 0)
+        if magic != _MAGIC or version != _VERSION:
+            raise ValueError(f"shared memory {shm.name} is not a version {_VERSION} frame ring")
+        self.slot_size = _SLOT_HEADER_SIZE + self.slot_capacity
+        # Aligned uint64 views of the counters, plain integer stores/loads from Python
+        self._latest = np.ndarray((1,), dtype=np.uint64, buffer=shm.buf, offset=16)
+        self._locks = [np.ndarray((1,), dtype=np.uint64, buffer=shm.buf, offset=self._slot_offset(index)) for index in range(self.slot_count)]
+
+    @classmethod
+    def create(cls, name: str = FRAME_RING_NAME, slot_count: int = 8, slot_capacity: int = 4 * 1024 * 1024) -> "FrameRing":
+        try:
+            # Left behind by a capture process which did not shut down cleanly
+            stale = shared_memory.SharedMemory(name=name)
+            stale.close()
+            stale.unlink()
+        except FileNotFoundError:
+            pass
+
+        shm = shared_memory.SharedMemory(name=name, create=True, size=_HEADER_SIZE + slot_count * (_SLOT_HEADER_SIZE + slot_capacity))
+        shm.buf[:_HEADER_SIZE + slot_count * _SLOT_HEADER_SIZE] = bytes(_HEADER_SIZE + slot_count * _SLOT_HEADER_SIZE)
+        _HEADER.pack_into(shm.buf, 0, _MAGIC, _VERSION, slot_count, slot_capacity, 0)
+
+        return cls(shm, owner=True)
+
+    @classmethod
+    def attach(cls, name: str = FRAME_RING_NAME) -> "FrameRing":
+        """
+        Raises FileNotFoundError when no capture process on this host created the ring, and
+        ValueError while the capture process has created it but not yet written its header
+        """
+        if sys.version_info >= (3, 13):
+            shm = shared_memory.SharedMemory(name=name, track=False)
+        else:
+            shm = shared_memory.SharedMemory(name=name)
+            # Otherwise the resource tracker unlinks the ring when this reader exits, it only
+            # tracks shared memory on POSIX
+            if os.name == "posix":
+                resource_tracker.unregister(shm._name, "shared_memory")
+
+        try:
+            return cls(shm, owner=False)
+        except ValueError:
+            shm.close()
+            raise
+
+    def close(self) -> None:
+        self._latest = None
+        self._locks = []
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
+
+    def _slot_offset(self, index: int) -> int:
+        return _HEADER_SIZE + index * self.slot_size
+
+    def latest_seq(self) -> int:
+        return int(self._latest[0])
+
+    def write(self, seq: int, jpeg: bytes, depth: np.ndarray | None = None, measurement: dict | None = None) -> None:
+        measurement_bytes = json.dumps(measurement).encode("utf-8") if measurement is not None else b""
+        depth = np.ascontiguousarray(depth, dtype=np.uint16) if depth is not None else None
+        depth_height, depth_width = depth.shape if depth is not None else (0, 0)
+        if len(jpeg) + 2 * depth_height * depth_width + len(measurement_bytes) > self.slot_capacity:
+            raise ValueError("frame does not fit into a ring slot")
+
+        index = seq % self.slot_count
+        offset = self._slot_offset(index)
+        lock = self._locks[index]
+        lock[0] += 1
+
+        position = offset + _SLOT_HEADER_SIZE
+        self.shm.buf[position:position + len(jpeg)] = jpeg
+        position += len(jpeg)
+        if depth is not None:
+            self.shm.buf[position:position + depth.nbytes] = depth.reshape(-1).view(np.uint8)
+            position += depth.nbytes
+        self.shm.buf[position:position + len(measurement_bytes)] = measurement_bytes
+        _SLOT_HEADER.pack_into(self.shm.buf, offset + 8, seq, time.time(), len(jpeg), len(measurement_bytes), depth_height, depth_width)
+
+        lock[0] += 1
+        self._latest[0] = seq
+
+    def read(self, seq: int | None = None, with_depth: bool = True, retries: int = 3) -> RingFrame | None:
+        """
+        Copies the frame with the given sequence number, the latest one by default. Returns None
+        if there is no such frame (not written yet or already overwritten)
+        """
+        if seq is None:
+            seq = self.latest_seq()
+        if seq == 0:
+            return None
+
+        index = seq % self.slot_count
+        offset = self._slot_offset(index)
+        lock = self._locks[index]
+        for attempt in range(retries):
+            lock_before = int(lock[0])
+            if lock_before % 2:
+                time.sleep(0)
+                continue
+
+            slot_seq, timestamp, jpeg_length, measurement_length, depth_height, depth_width = _SLOT_HEADER.unpack_from(self.shm.buf, offset + 8)
+            if slot_seq != seq:
+                return None
+
+            position = offset + _SLOT_HEADER_SIZE
+            jpeg = bytes(self.shm.buf[position:position + jpeg_length])
+            position += jpeg_length
+            depth = None
+            if depth_height and with_depth:
+                depth = np.frombuffer(self.shm.buf, dtype=np.uint16, count=depth_height * depth_width, offset=position).reshape(depth_height, depth_width).copy()
+            position += 2 * depth_height * depth_width
+            measurement_bytes = bytes(self.shm.buf[position:position + measurement_length])
+
+            if int(lock[0]) == lock_before:
+                return RingFrame(slot_seq, timestamp, jpeg, depth, json.loads(measurement_bytes) if measurement_length else None)
+
+        return None
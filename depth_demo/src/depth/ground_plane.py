@@ -0,0 +1,278 @@
+"""
+Calibration of the table plane under the camera, replacing the fixed table distance of the
+measurement (FIXED_GROUND_DISTANCE in measurement.py) when the camera is tilted or the table
+is not level.
+
+Usage: python ground_plane.py [--frames 30] [--output ground_calibration.npz]
+
+The table has to be empty. The median of --frames depth ROIs is deprojected to points, a plane
+is fitted to them with RANSAC and refined by least squares on its inliers. From the plane the
+expected raw depth of the table is computed for every pixel of the ROI and saved with the
+height per depth unit along the plane normal (GroundMap). The measurement then gets the height
+of every pixel above the table with one subtraction and one multiplication per frame.
+
+CapturePipeline loads the calibration from ground_calibration.npz next to this file on start.
+"""
+
+import argparse
+import json
+import os
+import typing
+import warnings
+
+import numpy as np
+
+from depth_codec import DepthIntrinsics
+
+# Pixels of the empty table farther from the fitted plane are taken for outliers, at least this
+# fraction of the pixels has to lie on the plane
+MIN_INLIER_RATIO = 0.9
+
+
+class GroundPlane(typing.NamedTuple):
+    # Unit normal in camera coordinates, pointing away from the camera
+    normal: tuple[float, float, float]
+    # Distance of the plane from the camera in metres, points p on the table have normal . p = distance
+    distance: float
+    # Root mean square distance of the inliers from the plane in metres
+    rms: float
+    # Fraction of the fitted pixels within the inlier threshold
+    inlier_ratio: float
+
+    @property
+    def tilt_degrees(self):
+        """
+        Angle between the optical axis and the table normal
+        """
+        return float(np.degrees(np.arccos(min(abs(self.normal[2]), 1.0))))
+
+
+class GroundMap(typing.NamedTuple):
+    # Expected raw depth of the table per ROI pixel, a scalar for a level table
+    table_depth: np.ndarray
+    # Height above the table in mm per depth unit the pixel is closer than the table
+    mm_per_unit: np.ndarray
+    depth_scale: float
+    # Calibrated plane with the ROI and the intrinsics of the map, None for a level table
+    plane: GroundPlane | None = None
+    roi: tuple[int, int, int, int] | None = None
+    intrinsics: DepthIntrinsics | None = None
+
+    @classmethod
+    def flat(cls, distance, depth_scale):
+        """
+        Level table `distance` metres in front of the camera, the uncalibrated fallback
+        """
+        return cls(np.float32(distance / depth_scale), np.float32(depth_scale * 1000), depth_scale)
+
+    @classmethod
+    def from_plane(cls, plane, intrinsics, roi, depth_scale):
+        """
+        Parameters:
+        -----------
+        plane       : GroundPlane
+        intrinsics  : DepthIntrinsics
+                      Of the full frame, the depth ROI has to be undistorted
+        roi         : tuple
+                      (start_x, start_y, end_x, end_y) the map is computed for
+        depth_scale : double
+                      Metres per depth unit
+        """
+        start_x, start_y, end_x, end_y = roi
+        u, v = np.meshgrid(np.arange(start_x, end_x, dtype=np.float64), np.arange(start_y, end_y, dtype=np.float64))
+        normal_x, normal_y, normal_z = plane.normal
+        # Cosine between the ray of every pixel (per metre of depth) and the normal
+        factor = normal_x * (u - intrinsics.ppx) / intrinsics.fx + normal_y * (v - intrinsics.ppy) / intrinsics.fy + normal_z
+        table_depth = plane.distance / factor / depth_scale
+        mm_per_unit = factor * depth_scale * 1000
+        return cls(table_depth.astype(np.float32), mm_per_unit.astype(np.float32), depth_scale, plane, tuple(roi), intrinsics)
+
+    @property
+    def label(self):
+        return "FIXED GROUND" if self.plane is None else "CALIBRATED GROUND"
+
+    @property
+    def description(self):
+        if self.plane is None:
+            return f"fixed ground at {float(self.table_depth) * self.depth_scale * 1000:.2f}mm"
+        return f"calibrated ground plane at {self.plane.distance * 1000:.2f}mm, tilted {self.plane.tilt_degrees:.2f}°"
+
+    def heights_mm(self, depth_image):
+        """
+        Height of every pixel above the table in mm, NaN where the depth is missing (0)
+
+        Parameters:
+        -----------
+        depth_image : array
+                      Raw depth of the ROI the map was computed for
+        """
+        heights = (self.table_depth - depth_image) * self.mm_per_unit
+        return np.where(depth_image > 0, heights, np.float32(np.nan))
+
+    def save(self, path):
+        meta = {
+            "plane": self.plane._asdict() if self.plane is not None else None,
+            "roi": list(self.roi) if self.roi is not None else None,
+            "intrinsics": self.intrinsics._asdict() if self.intrinsics is not None else None,
+            "depth_scale": self.depth_scale,
+        }
+        # The file name is kept as given, np.savez() would append .npz
+        with open(path, "wb") as file:
+            np.savez(file, table_depth=self.table_depth, mm_per_unit=self.mm_per_unit, meta=json.dumps(meta))
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            meta = json.loads(str(data["meta"]))
+            table_depth, mm_per_unit = data["table_depth"], data["mm_per_unit"]
+        plane = GroundPlane(**{**meta["plane"], "normal": tuple(meta["plane"]["normal"])}) if meta["plane"] is not None else None
+        roi = tuple(meta["roi"]) if meta["roi"] is not None else None
+        intrinsics = meta["intrinsics"]
+        intrinsics = DepthIntrinsics(**{**intrinsics, "coeffs": tuple(intrinsics["coeffs"])}) if intrinsics is not None else None
+        return cls(table_depth, mm_per_unit, meta["depth_scale"], plane, roi, intrinsics)
+
+
+def load_ground_map(path, roi, depth_scale):
+    """
+    Ground calibration for the ROI, None if there is no calibration file
+
+    Raises a ValueError if the calibration was made for another ROI or depth scale, the camera
+    has to be calibrated again then
+    """
+    if path is None or not os.path.exists(path):
+        return None
+    ground = GroundMap.load(path)
+    if ground.roi is not None and tuple(ground.roi) != tuple(roi):
+        raise ValueError(f"Ground calibration {path} is for the ROI {ground.roi}, not {tuple(roi)}, run ground_plane.py again")
+    if not np.isclose(ground.depth_scale, depth_scale, rtol=1e-6):
+        raise ValueError(f"Ground calibration {path} is for the depth scale {ground.depth_scale}, not {depth_scale}, run ground_plane.py again")
+    return ground
+
+
+def median_depth(depth_images):
+    """
+    Per pixel median of several raw depth images, missing depth (0) is left out, 0 where no image has depth
+    """
+    stack = np.stack(depth_images).astype(np.float32)
+    stack[stack == 0] = np.nan
+    with warnings.catch_warnings():
+        # All-NaN pixels, they stay without depth
+        warnings.simplefilter("ignore", RuntimeWarning)
+        median = np.nanmedian(stack, axis=0)
+    return np.nan_to_num(np.round(median), nan=0).astype(np.uint16)
+
+
+def _refine(points, normal, distance, inlier_threshold):
+    """
+    Least squares plane through the points within inlier_threshold of the plane
+    """
+    inliers = np.abs(points @ normal - distance) < inlier_threshold
+    centroid = points[inliers].mean(axis=0)
+    # The normal is the direction of least variance of the inliers
+    normal = np.linalg.svd(points[inliers] - centroid, full_matrices=False)[2][2]
+    return normal, float(normal @ centroid)
+
+
+def fit_ground_plane(depth_image, intrinsics, roi_origin, depth_scale, inlier_threshold=0.003, iterations=200, stride=4, seed=0):
+    """
+    Fits the table plane to the depth of an empty table
+
+    Every iteration of the RANSAC takes a plane through three random pixels, the distances of
+    all pixels to all candidate planes are computed as one matrix product. The plane with the
+    most inliers is then refined by least squares on its inliers.
+
+    Parameters:
+    -----------
+    depth_image      : array
+                       Undistorted raw depth ROI, e.g. the median_depth() of several frames
+    intrinsics       : DepthIntrinsics
+                       Of the full frame
+    roi_origin       : tuple
+                       (x, y) of the ROI in the full frame
+    depth_scale      : double
+                       Metres per depth unit
+    inlier_threshold : double
+                       Distance from the plane in metres up to which a pixel lies on it
+    iterations       : int
+                       Candidate planes
+    stride           : int
+                       Only every stride-th pixel in x and y is fitted
+    seed             : int
+                       Of the random pixel triplets, the fit is repeatable
+
+    Return:
+    ----------
+    plane : GroundPlane
+    """
+    depth = depth_image[::stride, ::stride]
+    rows, columns = np.nonzero(depth)
+    if len(rows) < 100:
+        raise ValueError("Not enough valid depth to fit the ground plane")
+    z = depth[rows, columns] * depth_scale
+    u = columns * stride + roi_origin[0]
+    v = rows * stride + roi_origin[1]
+    points = np.column_stack(((u - intrinsics.ppx) / intrinsics.fx * z, (v - intrinsics.ppy) / intrinsics.fy * z, z))
+
+    rng = np.random.default_rng(seed)
+    triplets = points[rng.integers(0, len(points), size=(iterations, 3))]
+    normals = np.cross(triplets[:, 1] - triplets[:, 0], triplets[:, 2] - triplets[:, 0])
+    lengths = np.linalg.norm(normals, axis=1)
+    # Triplets on a line have no plane
+    candidates = lengths > 1e-9
+    normals = normals[candidates] / lengths[candidates, None]
+    distances = np.einsum("ij,ij->i", normals, triplets[candidates, 0])
+    # float32 halves the memory of the points x candidates matrix, the threshold is well above its precision
+    residuals = np.abs(points.astype(np.float32) @ normals.T.astype(np.float32) - distances.astype(np.float32))
+    best = np.argmax(np.count_nonzero(residuals < inlier_threshold, axis=0))
+
+    normal, distance = normals[best], float(distances[best])
+    for _ in range(2):
+        normal, distance = _refine(points, normal, distance, inlier_threshold)
+    # Normal away from the camera, the table lies at a positive distance
+    if distance < 0:
+        normal, distance = -normal, -distance
+
+    residuals = np.abs(points @ normal - distance)
+    inliers = residuals < inlier_threshold
+    rms = float(np.sqrt(np.mean(residuals[inliers] ** 2)))
+    return GroundPlane(tuple(float(n) for n in normal), distance, rms, float(np.count_nonzero(inliers) / len(points)))
+
+
+def main():
+    from capture_pipeline import GROUND_CALIBRATION, CapturePipeline
+    from measurement import FIXED_GROUND_DISTANCE
+
+    parser = argparse.ArgumentParser(description="Calibrate the table plane on an empty table")
+    parser.add_argument("--frames", type=int, default=30, help="depth frames to take the median of")
+    parser.add_argument("--output", default=GROUND_CALIBRATION, help="calibration file, CapturePipeline loads it on start")
+    args = parser.parse_args()
+
+    # The calibration to be replaced is not loaded
+    capture = CapturePipeline(verbose=False, ground_calibration=None)
+    capture.start()
+    try:
+        depth_images = []
+        while len(depth_images) < args.frames:
+            result = capture.process_next()
+            if result is not None:
+                depth_images.append(result.depth_roi)
+    finally:
+        capture.stop()
+
+    intrinsics = DepthIntrinsics.from_rs(capture.intrinsics, undistorted=True)
+    plane = fit_ground_plane(median_depth(depth_images), intrinsics, capture.roi[:2], capture.depth_scale)
+    ground = GroundMap.from_plane(plane, intrinsics, capture.roi, capture.depth_scale)
+    ground.save(args.output)
+
+    table_depth = ground.table_depth * capture.depth_scale * 1000
+    print(f"Table plane:          {plane.distance * 1000:.2f}mm from the camera, tilted {plane.tilt_degrees:.2f}°")
+    print(f"Fit:                  {plane.rms * 1000:.2f}mm RMS, {plane.inlier_ratio * 100:.1f}% of the pixels on the plane")
+    print(f"Table depth in ROI:   {table_depth.min():.2f}mm to {table_depth.max():.2f}mm "
+          f"(FIXED_GROUND_DISTANCE {FIXED_GROUND_DISTANCE * 1000:.2f}mm)")
+    print(f"Saved to {args.output}")
+    if plane.inlier_ratio < MIN_INLIER_RATIO:
+        print(f"Warning: only {plane.inlier_ratio * 100:.1f}% of the pixels lie on the plane, clear the table and calibrate again")
+
+
+if __name__ == "__main__":
+    main()
@@ -8,6 +8,8 @@
 import cv2
 import numpy as np
 
+from camera_model import get_camera_model
+
 """
   _   _        _                      _____                     _    _
  | | | |  ___ | | _ __    ___  _ __  |  ___|_   _  _ __    ___ | |_ (_)  ___   _ __   ___
@@ -33,20 +35,18 @@ def calculate_rmsd(points1, points2, validPoints=None):
 	assert(points1.shape == points2.shape)
 	N = points1.shape[1]
 
-	if validPoints == None:
+	if validPoints is None:
 		validPoints = [True]*N
 
 	assert(len(validPoints) == N)
 
-	points1 = points1[:,validPoints]
-	points2 = points2[:,validPoints]
+	points1 = np.asarray(points1)[:,validPoints]
+	points2 = np.asarray(points2)[:,validPoints]
 
 	N = points1.shape[1]
 
 	dist = points1 - points2
-	rmsd = 0
-	for col in range(N):
-		rmsd += np.matmul(dist[:,col].transpose(), dist[:,col]).flatten()[0]
+	rmsd = np.sum(dist*dist)
 
 	return np.sqrt(rmsd/N)
 
@@ -70,10 +70,20 @@ def get_chessboard_points_3D(chessboard_params):
 	return objp.transpose() * square_size
 
 
-def cv_find_chessboard(depth_frame, infrared_frame, chessboard_params):
+def cv_find_chessboard(depth_frame, infrared_frame, chessboard_params, camera_model=None, pyramid_levels=1):
 	"""
 	Searches the chessboard corners using the set infrared image and the
-	checkerboard size
+	checkerboard size. The search runs coarse-to-fine: the board is detected
+	with the fast check on a downscaled pyramid level, and the corners are only
+	refined with cornerSubPix on the full resolution image
+
+	Parameters:
+	-----------
+	camera_model   : CameraModel
+	                 Optional model of the infrared imager. If the imager is distorted the search runs
+	                 on the undistorted image and the corners are mapped back to raw image coordinates
+	pyramid_levels : int
+	                 Number of times the image is halved before the detection, 0 searches at full resolution
 
 	Returns:
 	-----------
@@ -84,13 +94,27 @@ def cv_find_chessboard(depth_frame, infrared_frame, chessboard_params):
 	"""
 	assert(len(chessboard_params) == 3)
 	infrared_image = np.asanyarray(infrared_frame.get_data())
+	undistort = camera_model is not None and camera_model.is_distorted
+	if undistort:
+		infrared_image = camera_model.undistort_roi(infrared_image, (0, 0, camera_model.width, camera_model.height))
 	criteria = (cv2.TERM_CRITERIA_EPS + cv2.TERM_CRITERIA_MAX_ITER, 30, 0.001)
+	flags = cv2.CALIB_CB_ADAPTIVE_THRESH + cv2.CALIB_CB_NORMALIZE_IMAGE + cv2.CALIB_CB_FAST_CHECK
+
+	coarse_image = infrared_image
+	for level in range(pyramid_levels):
+		coarse_image = cv2.pyrDown(coarse_image)
+
 	chessboard_found = False
-	chessboard_found, corners = cv2.findChessboardCorners(infrared_image, (
-	chessboard_params[0], chessboard_params[1]))
+	chessboard_found, corners = cv2.findChessboardCorners(coarse_image, (
+	chessboard_params[0], chessboard_params[1]), flags=flags)
 
 	if chessboard_found:
+		# Map the pixel centres of the pyramid level back to the full resolution image
+		scale = 2 ** pyramid_levels
+		corners = (corners.reshape(-1, 1, 2) + 0.5) * scale - 0.5
 		corners = cv2.cornerSubPix(infrared_image, corners, (11,11),(-1,-1), criteria)
+		if undistort:
+			corners = camera_model.distort_pixels(corners).reshape(-1, 1, 2).astype(np.float32)
 		corners = np.transpose(corners, (2,0,1))
 	return chessboard_found, corners
 
@@ -118,9 +142,53 @@ def get_depth_at_pixel(depth_frame, pixel_x, pixel_y):
 
 
 
+def get_depth_at_pixels(depth_image, pixels_x, pixels_y, depth_scale):
+	"""
+	Get the bilinearly interpolated depth values at many sub-pixel image points at once
+
+	Parameters:
+	-----------
+	depth_image 	 : array
+						   (H, W) raw depth map
+	pixels_x 	  	 : array
+						   The x values of the image coordinates
+	pixels_y 	  	 : array
+							The y values of the image coordinates
+	depth_scale 	 : double
+							Metres per depth unit
+
+	Return:
+	----------
+	depths : array
+		Depth values in metres. Points whose four neighbouring pixels do not all carry a valid
+		depth, or which lie outside the image, are returned as 0
+
+	"""
+	height, width = depth_image.shape
+	pixels_x = np.asarray(pixels_x, dtype=np.float64)
+	pixels_y = np.asarray(pixels_y, dtype=np.float64)
+	inside = (pixels_x >= 0) & (pixels_x <= width - 1) & (pixels_y >= 0) & (pixels_y <= height - 1)
+
+	x0 = np.clip(np.floor(pixels_x).astype(int), 0, width - 2)
+	y0 = np.clip(np.floor(pixels_y).astype(int), 0, height - 2)
+	ax = pixels_x - x0
+	ay = pixels_y - y0
+
+	d00 = depth_image[y0, x0].astype(np.float64)
+	d01 = depth_image[y0, x0 + 1].astype(np.float64)
+	d10 = depth_image[y0 + 1, x0].astype(np.float64)
+	d11 = depth_image[y0 + 1, x0 + 1].astype(np.float64)
+
+	depths = (d00*(1 - ax) + d01*ax)*(1 - ay) + (d10*(1 - ax) + d11*ax)*ay
+	valid = inside & (d00 > 0) & (d01 > 0) & (d10 > 0) & (d11 > 0)
+	return np.where(valid, depths*depth_scale, 0.0)
+
+
+
 def convert_depth_pixel_to_metric_coordinate(depth, pixel_x, pixel_y, camera_intrinsics):
 	"""
-	Convert the depth and image point information to metric coordinates
+	Convert the depth and image point information to metric coordinates.
+	The lens distortion given by the coeffs of the intrinsics is taken into account
 
 	Parameters:
 	-----------
@@ -142,15 +210,14 @@ def convert_depth_pixel_to_metric_coordinate(depth, pixel_x, pixel_y, camera_int
 		The z value in meters
 
 	"""
-	X = (pixel_x - camera_intrinsics.ppx)/camera_intrinsics.fx *depth
-	Y = (pixel_y - camera_intrinsics.ppy)/camera_intrinsics.fy *depth
-	return X, Y, depth
+	X, Y, Z = get_camera_model(camera_intrinsics).deproject_pixels(pixel_x, pixel_y, depth)
+	return X, Y, Z
 
 
 
 def convert_depth_frame_to_pointcloud(depth_image, camera_intrinsics ):
 	"""
-	Convert the depthmap to a 3D point cloud
+	Convert the depthmap to a 3D point cloud, taking the lens distortion into account
 
 	Parameters:
 	-----------
@@ -171,19 +238,8 @@ def convert_depth_frame_to_pointcloud(depth_image, camera_intrinsics ):
 	
 	[height, width] = depth_image.shape
 
-	nx = np.linspace(0, width-1, width)
-	ny = np.linspace(0, height-1, height)
-	u, v = np.meshgrid(nx, ny)
-	x = (u.flatten() - camera_intrinsics.ppx)/camera_intrinsics.fx
-	y = (v.flatten() - camera_intrinsics.ppy)/camera_intrinsics.fy
-
-	z = depth_image.flatten() / 1000;
-	x = np.multiply(x,z)
-	y = np.multiply(y,z)
-
-	x = x[np.nonzero(z)]
-	y = y[np.nonzero(z)]
-	z = z[np.nonzero(z)]
+	# The normalised ray of every pixel is computed once per intrinsics and cached
+	x, y, z = get_camera_model(camera_intrinsics, width, height).pointcloud(depth_image, depth_scale=1/1000)
 
 	return x, y, z
 
@@ -0,0 +1,268 @@
+##################################################################################################
+##       License: Apache 2.0. See LICENSE file in root directory.		                      ####
+##################################################################################################
+##                  Box Dimensioner with multiple cameras: ICP refinement 					  ####
+##################################################################################################
+
+# Point-to-plane ICP between the clouds of the calibrated devices, using a NumPy voxel hash
+import cv2
+import numpy as np
+import pyrealsense2 as rs
+
+from calibration_kabsch import Transformation
+from helper_functions import convert_depth_frame_to_pointcloud, get_clipped_pointcloud
+
+# Voxel coordinates are packed into one int64 key with 21 bits per axis
+_KEY_BITS = 21
+_KEY_BIAS = 1 << (_KEY_BITS - 1)
+_NEIGHBOUR_OFFSETS = np.array([(dx << (2*_KEY_BITS)) + (dy << _KEY_BITS) + dz
+	for dx in (-1, 0, 1) for dy in (-1, 0, 1) for dz in (-1, 0, 1)], dtype=np.int64)
+
+
+def _voxel_keys(points, voxel_size):
+	"""
+	Packs the voxel coordinates of the (3,N) points into int64 keys. Neighbouring voxels differ by
+	the constant offsets in _NEIGHBOUR_OFFSETS
+	"""
+	voxels = np.floor(points / voxel_size).astype(np.int64) + _KEY_BIAS
+	return (voxels[0] << (2*_KEY_BITS)) + (voxels[1] << _KEY_BITS) + voxels[2]
+
+
+def voxel_downsample(points, voxel_size):
+	"""
+	Replaces all points within a voxel by their centroid
+
+	Parameters:
+	-----------
+	points     : array
+	             (3,N) matrix
+	voxel_size : double
+	             Edge length of the voxels in metres
+
+	Return:
+	----------
+	keys   : array
+	         (M,) sorted voxel keys
+	points : array
+	         (3,M) matrix of the voxel centroids
+	"""
+	keys, inverse, counts = np.unique(_voxel_keys(points, voxel_size), return_inverse=True, return_counts=True)
+	centroids = np.vstack([np.bincount(inverse, weights=points[axis], minlength=keys.size) for axis in range(3)]) / counts
+	return keys, centroids
+
+
+class VoxelHashIndex:
+	def __init__(self, points, voxel_size):
+		"""
+		Nearest neighbour index over a voxel downsampled cloud. Every voxel holds exactly one point,
+		so a query only has to look at the 27 voxels around it, which is done for all queries at once
+		with binary searches in the sorted voxel keys
+
+		Parameters:
+		-----------
+		points     : array
+		             (3,N) matrix of the cloud to index
+		voxel_size : double
+		             Edge length of the voxels in metres, also the guaranteed search radius
+
+		"""
+		self.voxel_size = voxel_size
+		self.keys, self.points = voxel_downsample(points, voxel_size)
+		self.normals, self.normal_valid = self._estimate_normals()
+
+	def _neighbours(self, keys):
+		"""
+		Returns the (K,27) indices of the points in the voxels around the given keys, -1 for empty voxels.
+		The three voxels along z have consecutive keys, so one binary search finds all of them
+		"""
+		columns = keys[:,np.newaxis] + _NEIGHBOUR_OFFSETS[np.newaxis,::3]
+		if not self.keys.size:
+			return np.full((keys.size, _NEIGHBOUR_OFFSETS.size), -1)
+		# The voxels of a column are the (up to three) keys from the first one not below its start
+		indices = np.searchsorted(self.keys, columns)[:,:,np.newaxis] + np.arange(3)
+		in_column = indices < self.keys.size
+		indices = np.minimum(indices, self.keys.size - 1)
+		in_column &= self.keys[indices] <= columns[:,:,np.newaxis] + 2
+		return np.where(in_column, indices, -1).reshape(keys.size, -1)
+
+	def _estimate_normals(self):
+		"""
+		Normals from the covariance of the 27-voxel neighbourhood of every point
+		"""
+		neighbours = self._neighbours(self.keys)
+		valid = neighbours >= 0
+		count = np.count_nonzero(valid, axis=1)
+		neighbour_points = np.where(valid[:,:,np.newaxis], self.points.T[np.maximum(neighbours, 0)], 0.0)
+		mean = neighbour_points.sum(axis=1) / np.maximum(count, 1)[:,np.newaxis]
+		# Batched matmul, several times faster than the equivalent einsum
+		covariance = np.matmul(neighbour_points.transpose(0,2,1), neighbour_points) / np.maximum(count, 1)[:,np.newaxis,np.newaxis]
+		covariance -= np.einsum('ki,kj->kij', mean, mean)
+		eigen_values, eigen_vectors = np.linalg.eigh(covariance)
+		return eigen_vectors[:,:,0].T, count >= 3
+
+	def query(self, points):
+		"""
+		Finds the nearest indexed point of every query point
+
+		Parameters:
+		-----------
+		points : array
+		         (3,K) query points
+
+		Return:
+		----------
+		distances : array
+		            (K,) distances in metres, inf if there is no indexed point in the neighbouring voxels
+		indices   : array
+		            (K,) indices into self.points, -1 if there is no indexed point in the neighbouring voxels
+		"""
+		neighbours = self._neighbours(_voxel_keys(points, self.voxel_size))
+		differences = self.points.T[np.maximum(neighbours, 0)] - points.T[:,np.newaxis,:]
+		distances = np.where(neighbours >= 0, np.einsum('kni,kni->kn', differences, differences), np.inf)
+		nearest = np.argmin(distances, axis=1)
+		rows = np.arange(nearest.size)
+		return np.sqrt(distances[rows, nearest]), np.where(np.isfinite(distances[rows, nearest]), neighbours[rows, nearest], -1)
+
+
+def point_to_plane_icp(source_points, target_index, max_iterations=30, max_correspondence_distance=None, damping=1e-6, tolerance=1e-4):
+	"""
+	Aligns the source cloud to the indexed target cloud by minimising the point-to-plane distances.
+	Directions which the scene does not constrain (e.g. the in-plane shift over an empty table) are
+	kept at their initial value by the damping of the normal equations
+
+	Parameters:
+	-----------
+	source_points               : array
+	                              (3,N) matrix
+	target_index                : VoxelHashIndex
+	max_iterations              : int
+	max_correspondence_distance : double
+	                              Correspondences further apart are rejected, defaults to the voxel size
+	damping                     : double
+	                              Levenberg damping of the 6x6 normal equations
+	tolerance                   : double
+	                              The iteration stops once the update is smaller than this or the
+	                              point-to-plane RMSE no longer decreases
+
+	Return:
+	----------
+	pose_mat   : array
+	             (4,4) transformation which has to be applied to the source cloud
+	statistics : dict
+	             rmse_before, rmse_after (point-to-plane, metres), inlier_ratio, iterations
+	"""
+	if max_correspondence_distance is None:
+		max_correspondence_distance = target_index.voxel_size
+
+	def correspondences(pose_mat):
+		"""
+		Source points under pose_mat with a target point and normal, their normals and point-to-plane residuals
+		"""
+		points = np.matmul(pose_mat[:3,:3], source_points) + pose_mat[:3,[3]]
+		distances, indices = target_index.query(points)
+		valid = (distances < max_correspondence_distance) & (indices >= 0)
+		valid[valid] = target_index.normal_valid[indices[valid]]
+		p = points[:,valid]
+		n = target_index.normals[:,indices[valid]]
+		residuals = np.sum(n * (p - target_index.points[:,indices[valid]]), axis=0)
+		return p, n, residuals, np.count_nonzero(valid) / max(valid.size, 1)
+
+	pose_mat = np.eye(4)
+	best_pose_mat, best_rmse = pose_mat, np.inf
+	statistics = {"rmse_before": None, "rmse_after": None, "inlier_ratio": 0.0, "iterations": 0}
+	for iteration in range(max_iterations):
+		p, n, residuals, _ = correspondences(pose_mat)
+		rmse = float(np.sqrt(np.mean(residuals*residuals))) if residuals.size >= 6 else np.inf
+		# Near the optimum the correspondences flip between neighbouring voxels and the updates
+		# oscillate, the pose before an update which made the alignment worse is returned
+		if rmse >= best_rmse:
+			pose_mat = best_pose_mat
+			break
+		best_pose_mat, best_rmse = pose_mat, rmse
+
+		if statistics["rmse_before"] is None:
+			statistics["rmse_before"] = rmse
+		statistics["iterations"] = iteration + 1
+
+		# Linearised point-to-plane problem in the twist (rotation vector, translation)
+		jacobian = np.vstack((np.cross(p, n, axis=0), n)).T
+		hessian = np.matmul(jacobian.T, jacobian) + damping*np.eye(6)
+		twist = -np.linalg.solve(hessian, np.matmul(jacobian.T, residuals))
+
+		update = np.eye(4)
+		update[:3,:3] = cv2.Rodrigues(twist[:3])[0]
+		update[:3,3] = twist[3:]
+		pose_mat = np.matmul(update, pose_mat)
+		if np.linalg.norm(twist) < tolerance:
+			break
+
+	# Residuals of the returned pose, the loop usually ends with an update it did not measure
+	if statistics["iterations"]:
+		p, n, residuals, statistics["inlier_ratio"] = correspondences(pose_mat)
+		statistics["rmse_after"] = float(np.sqrt(np.mean(residuals*residuals))) if residuals.size else None
+
+	return pose_mat, statistics
+
+
+def refine_transformations_icp(frames_devices, transformation_devices, intrinsics_devices, roi_2d=None, voxel_size=0.01, point_stride=4, max_iterations=30):
+	"""
+	Refines the chessboard calibration of all devices by aligning their clouds to each other.
+	The first device is kept fixed, every further device is aligned to the merged cloud of the
+	devices refined before it. Devices without points (e.g. outside roi_2d) keep their
+	calibration, the first device with points is the fixed one
+
+	Parameters:
+	-----------
+	frames_devices         : dict
+	                         Frames of the devices as returned by DeviceManager.poll_frames()
+	transformation_devices : dict
+	                         Transformation from the device to the world coordinates per serial number
+	intrinsics_devices     : dict
+	                         Intrinsics per serial number
+	roi_2d                 : array
+	                         Optional region [minX, maxX, minY, maxY] the clouds are clipped to
+	voxel_size             : double
+	                         Voxel size (metres) of the downsampling and of the hash index
+	point_stride           : int
+	                         Only every point_stride-th point of a cloud is used
+	max_iterations         : int
+	                         ICP iterations per device
+
+	Return:
+	----------
+	refined_transformations : dict
+	                          Refined Transformation per serial number
+	statistics              : dict
+	                          ICP statistics per serial number, see point_to_plane_icp()
+	"""
+	clouds = {}
+	for (device_info, frameset) in frames_devices.items():
+		serial = device_info[0]
+		depth_image = np.asanyarray(frameset[rs.stream.depth].get_data())
+		point_cloud = np.asanyarray(convert_depth_frame_to_pointcloud(depth_image, intrinsics_devices[serial][rs.stream.depth]))
+		point_cloud = transformation_devices[serial].apply_transformation(point_cloud[:,::point_stride])
+		if roi_2d is not None:
+			point_cloud = get_clipped_pointcloud(point_cloud, roi_2d)
+		clouds[serial] = voxel_downsample(point_cloud, voxel_size)[1]
+
+	refined_transformations = {}
+	statistics = {}
+	for (serial, cloud) in clouds.items():
+		if not cloud.shape[1]:
+			refined_transformations[serial] = transformation_devices[serial]
+			statistics[serial] = {"rmse_before": None, "rmse_after": None, "inlier_ratio": 0.0, "iterations": 0}
+	serials = [serial for (serial, cloud) in clouds.items() if cloud.shape[1]]
+	if not serials:
+		return refined_transformations, statistics
+
+	refined_transformations[serials[0]] = transformation_devices[serials[0]]
+	statistics[serials[0]] = {"rmse_before": 0.0, "rmse_after": 0.0, "inlier_ratio": 1.0, "iterations": 0}
+	target_points = clouds[serials[0]]
+	for serial in serials[1:]:
+		correction, statistics[serial] = point_to_plane_icp(clouds[serial], VoxelHashIndex(target_points, voxel_size), max_iterations)
+		pose_mat = np.matmul(correction, transformation_devices[serial].pose_mat)
+		refined_transformations[serial] = Transformation(pose_mat[:3,:3], pose_mat[:3,3])
+		aligned_points = np.matmul(correction[:3,:3], clouds[serial]) + correction[:3,[3]]
+		target_points = np.column_stack((target_points, aligned_points))
+
+	return refined_transformations, statistics
@@ -0,0 +1,334 @@
+import typing
+
+import cv2
+import numpy as np
+
+from ground_plane import GroundMap
+
+# ============================================
+# HEIGHT MEASUREMENT CONFIGURATION
+# ============================================
+# Choose filtering mode: "percentile" or "median_region"
+FILTERING_MODE = "median_region"  # Change this to switch methods
+
+# Fixed ground distance (table surface) in meters, used for a level table without ground calibration (see ground_plane.py)
+FIXED_GROUND_DISTANCE = 0.730  # 730mm from camera to table surface
+
+# Percentile mode settings
+PERCENTILE_MIN = 1   # Use 1st percentile of the depth, the 99th of the heights, for object top (filters closest 1% as noise)
+PERCENTILE_MAX = 99  # Use 99th percentile for table surface (filters highest 1% as noise)
+
+# Median region mode settings
+REGION_PERCENT = 5   # Use top/bottom 5% of pixels for median calculation
+
+# Height above the table (mm) above which a pixel belongs to an object on the table
+MIN_OBJECT_HEIGHT = 5.0
+
+# Multi object mode: smaller regions of the depth mask are noise, not objects (pixels)
+MIN_OBJECT_AREA = 400
+# ============================================
+
+
+class MeasurementResult(typing.NamedTuple):
+    # width/length (pixels) and height (mm), only the dimensions which could be measured
+    measurement: dict[str, float]
+    # Rotated rectangle of the object in ROI coordinates, None if no object was found
+    rect: tuple | None
+    # Intermediate images for the debug windows
+    views: dict[str, np.ndarray]
+
+
+class MultiMeasurementResult(typing.NamedTuple):
+    # Per object, largest first: width/length and the footprint centre x/y (pixels, ROI
+    # coordinates) and the height (mm) if it could be measured
+    measurements: list[dict[str, float]]
+    # Rotated rectangles of the objects in ROI coordinates, in the order of measurements
+    rects: list[tuple]
+    views: dict[str, np.ndarray]
+
+
+def estimate_height(height_area, ground, verbose=True):
+    """
+    Height of the object above the table from the heights of its area
+
+    Parameters:
+    -----------
+    height_area : array
+                  Height of every pixel of the object area above the table in mm, NaN without depth
+    ground      : GroundMap
+                  Table the heights were taken against, for the measurement details
+    verbose     : bool
+                  Prints the measurement details
+
+    Return:
+    ----------
+    height_mm : double
+                None if the area does not hold enough valid depth values
+    """
+    # Filter out zero/invalid depths
+    valid_heights = height_area[~np.isnan(height_area)]
+
+    if len(valid_heights) <= 100:  # Ensure enough data points
+        if verbose:
+            print("Warning: Not enough valid depth data for measurement")
+        return None
+
+    # Sort all heights, highest first
+    sorted_heights = np.sort(valid_heights)[::-1]
+
+    # Get absolute min/max for comparison
+    absolute_max = sorted_heights[0]
+    absolute_min = sorted_heights[-1]
+
+    # Apply selected filtering method for object top only
+    if FILTERING_MODE == "percentile":
+        # METHOD 1: PERCENTILE FILTERING
+        # Use percentiles to filter out extreme outliers
+        object_top = np.percentile(valid_heights, 100 - PERCENTILE_MIN)
+
+        method_name = f"PERCENTILE ({PERCENTILE_MIN}th) + {ground.label}"
+        extra_info = f"Filtering highest {PERCENTILE_MIN}% as noise, using {ground.description}"
+
+    elif FILTERING_MODE == "median_region":
+        # METHOD 2: MEDIAN OF TOP/BOTTOM REGIONS
+        # Take median of highest N% of pixels
+        region_size = int(len(sorted_heights) * REGION_PERCENT / 100)
+        if region_size < 1:
+            region_size = 1
+
+        # Get median of highest region (object top)
+        top_region = sorted_heights[:region_size]
+        object_top = np.median(top_region)
+
+        method_name = f"MEDIAN OF TOP {REGION_PERCENT}% + {ground.label}"
+        extra_info = f"Using median of {region_size} top pixels, {ground.description}"
+
+    else:
+        # Fallback to simple max if mode is invalid
+        object_top = absolute_max
+        method_name = f"SIMPLE MAX + {ground.label}"
+        extra_info = f"Warning: Using unfiltered object top, {ground.description}"
+
+    # The heights are taken from the table surface already
+    height_mm = object_top
+
+    # DEBUG OUTPUT
+    if verbose:
+        print(f"\n{'='*50}")
+        print(f"HEIGHT MEASUREMENT - {method_name}")
+        print(f"{'='*50}")
+        print(f"Total valid depth pixels: {len(valid_heights)}")
+        print(f"{extra_info}")
+        print(f"-" * 50)
+        print(f"Absolute max (raw):       {absolute_max:.2f}mm above table")
+        print(f"Object top (filtered):    {object_top:.2f}mm above table ✓")
+        print(f"Absolute min (raw):       {absolute_min:.2f}mm above table")
+        print(f"Table surface:            {ground.description} ✓")
+        print(f"-" * 50)
+        print(f"Height calculated:        {height_mm:.2f}mm")
+        print(f"Expected:                 70.00mm")
+        print(f"Error:                    {height_mm - 70:.2f}mm ({(height_mm/70 - 1)*100:.1f}%)")
+        print(f"{'='*50}\n")
+
+    return float(height_mm)
+
+
+def measure_object(depth_image, color_image, depth_scale, verbose=True, ground=None):
+    """
+    Finds the largest object on the table in the undistorted depth and colour ROIs and measures
+    its footprint (minimum area rectangle of the colour contour) and its height
+
+    Parameters:
+    -----------
+    depth_image : array
+                  Raw depth ROI, aligned to colour
+    color_image : array
+                  Colour ROI
+    depth_scale : double
+                  Metres per depth unit
+    verbose     : bool
+                  Prints the height measurement details
+    ground      : GroundMap
+                  Calibrated table of the ROI (see ground_plane.py), a level table at FIXED_GROUND_DISTANCE by default
+
+    Return:
+    ----------
+    result : MeasurementResult
+    """
+    if ground is None:
+        ground = GroundMap.flat(FIXED_GROUND_DISTANCE, depth_scale)
+    heights = ground.heights_mm(depth_image)
+    # Holes in the depth are taken for the object, they lie mostly along its edges
+    find_object_location = (heights > MIN_OBJECT_HEIGHT) | (depth_image == 0)
+    object_mask = np.zeros_like(depth_image, dtype=np.uint8)
+    object_mask[find_object_location] = 255
+    contours, _ = cv2.findContours(object_mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+
+    measurement = {}
+    views = {"Object Mask": object_mask}
+    if not contours:
+        return MeasurementResult(measurement, None, views)
+
+    largest_contour = max(contours, key=cv2.contourArea)
+    depth_x, depth_y, depth_w, depth_h = cv2.boundingRect(largest_contour)
+
+    # double filering - extract the object from color image
+    object_image = color_image[depth_y:depth_y+depth_h, depth_x:depth_x+depth_w]
+    gray = cv2.cvtColor(object_image, cv2.COLOR_BGR2GRAY)
+    blur = cv2.GaussianBlur(gray, (3, 3), 0)
+    thresh = cv2.adaptiveThreshold(blur, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C, cv2.THRESH_BINARY_INV, 35, 2)
+    kernel = np.ones((3, 3), np.uint8)
+    closing = cv2.morphologyEx(thresh, cv2.MORPH_CLOSE, kernel,iterations=2)
+    contours, _ = cv2.findContours(closing, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+
+    views["Closing"] = closing
+    if not contours:
+        return MeasurementResult(measurement, None, views)
+
+    largest_contour = max(contours, key=cv2.contourArea)
+    object_x, object_y, object_w, object_h = cv2.boundingRect(largest_contour)
+    rect = cv2.minAreaRect(largest_contour)
+    (center_x, center_y), (width, length), angle = rect
+    measurement["width"] = float(width)
+    measurement["length"] = float(length)
+    views["Object"] = object_image
+
+    # extract the depth area
+    depth_object_x = object_x + depth_x
+    depth_object_y = object_y + depth_y
+    depth_area = depth_image[depth_object_y:depth_object_y+object_h, depth_object_x:depth_object_x+object_w]
+    height_area = heights[depth_object_y:depth_object_y+object_h, depth_object_x:depth_object_x+object_w]
+
+    height_mm = estimate_height(height_area, ground, verbose)
+    if height_mm is not None:
+        measurement["height"] = height_mm
+        # Visualize the depth area
+        views["Depth Area"] = np.uint8(cv2.normalize(depth_area, None, 0, 255, cv2.NORM_MINMAX))
+
+    # Rectangle in ROI coordinates
+    rect = ((center_x + depth_x, center_y + depth_y), (width, length), angle)
+
+    return MeasurementResult(measurement, rect, views)
+
+
+def estimate_heights(heights, labels, label_count):
+    """
+    estimate_height() for all labelled objects at once, with one sort of the object pixels by
+    (label, height) instead of one sort per object
+
+    Parameters:
+    -----------
+    heights     : array
+                  Height of every pixel of the ROI above the table in mm, NaN without depth
+    labels      : array
+                  Object label per pixel, 0 is the background
+    label_count : int
+                  Number of labels including the background
+
+    Return:
+    ----------
+    heights_mm : array
+                 Height per label, NaN where the object does not hold enough valid depth values
+    """
+    valid = (labels > 0) & ~np.isnan(heights)
+    object_labels = labels[valid].astype(np.int64)
+    # Heights in micrometres subtracted from 2^31 fit into the low 32 bits, sorting the combined
+    # key groups the labels and sorts the heights within each highest first
+    keys = np.sort((object_labels << 32) | (2**31 - np.round(heights[valid] * 1000).astype(np.int64)))
+    sorted_heights = (2**31 - (keys & 0xFFFFFFFF)) / 1000
+
+    counts = np.bincount(object_labels, minlength=label_count)
+    starts = np.cumsum(counts) - counts
+    # Same minimum as estimate_height()
+    measurable = counts > 100
+    last = np.maximum(counts - 1, 0)
+
+    if FILTERING_MODE == "percentile":
+        # Linear interpolation between the closest ranks, like np.percentile()
+        rank = last * PERCENTILE_MIN / 100
+        lower = np.floor(rank).astype(np.int64)
+        upper = np.minimum(lower + 1, last)
+        fraction = rank - lower
+        below, above = sorted_heights[np.minimum(starts + lower, len(keys) - 1)], sorted_heights[np.minimum(starts + upper, len(keys) - 1)]
+        object_tops = below + fraction * (above - below)
+
+    elif FILTERING_MODE == "median_region":
+        region_size = np.maximum((counts * REGION_PERCENT / 100).astype(np.int64), 1)
+        middle_low = np.minimum(starts + (region_size - 1) // 2, len(keys) - 1)
+        middle_high = np.minimum(starts + region_size // 2, len(keys) - 1)
+        object_tops = (sorted_heights[middle_low] + sorted_heights[middle_high]) / 2
+
+    else:
+        object_tops = sorted_heights[np.minimum(starts, len(keys) - 1)]
+
+    return np.where(measurable, object_tops, np.nan)
+
+
+def measure_objects(depth_image, color_image, depth_scale, min_area=MIN_OBJECT_AREA, verbose=True, ground=None):
+    """
+    Measures every object on the table in the undistorted depth ROI. The objects are labelled
+    in one pass over the depth mask with cv2.connectedComponentsWithStats(), regions smaller
+    than min_area are dropped. The footprint of every object is the minimum area rectangle of
+    its region, found within the bounding box of the label, the heights are estimated for all
+    objects together.
+
+    Parameters:
+    -----------
+    depth_image : array
+                  Raw depth ROI, aligned to colour
+    color_image : array
+                  Colour ROI, only shown in the debug views
+    depth_scale : double
+                  Metres per depth unit
+    min_area    : int
+                  Smallest object region in pixels
+    verbose     : bool
+                  Prints the number of objects found
+    ground      : GroundMap
+                  Calibrated table of the ROI (see ground_plane.py), a level table at FIXED_GROUND_DISTANCE by default
+
+    Return:
+    ----------
+    result : MultiMeasurementResult
+    """
+    if ground is None:
+        ground = GroundMap.flat(FIXED_GROUND_DISTANCE, depth_scale)
+    heights = ground.heights_mm(depth_image)
+    # Unlike in measure_object() holes in the depth (NaN heights) are not taken for objects
+    object_mask = (heights > MIN_OBJECT_HEIGHT).astype(np.uint8) * 255
+    label_count, labels, stats, _ = cv2.connectedComponentsWithStats(object_mask, connectivity=8, ltype=cv2.CV_32S)
+
+    views = {"Object Mask": object_mask}
+    areas = stats[:, cv2.CC_STAT_AREA]
+    objects = np.flatnonzero(areas >= min_area)
+    objects = objects[objects > 0]
+    # Largest first, like measure_object() picks the largest contour
+    objects = objects[np.argsort(-areas[objects], kind="stable")]
+
+    object_heights = estimate_heights(heights, labels, label_count) if len(objects) else None
+
+    measurements = []
+    rects = []
+    for label in objects:
+        x, y, w, h = stats[label, :4]
+        region = (labels[y:y+h, x:x+w] == label).astype(np.uint8)
+        contours, _ = cv2.findContours(region, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+        (center_x, center_y), (width, length), angle = cv2.minAreaRect(np.concatenate(contours))
+        rect = ((center_x + x, center_y + y), (width, length), angle)
+
+        measurement = {"width": float(width), "length": float(length), "x": float(center_x + x), "y": float(center_y + y)}
+        if not np.isnan(object_heights[label]):
+            measurement["height"] = float(object_heights[label])
+        measurements.append(measurement)
+        rects.append(rect)
+
+    if verbose:
+        print(f"{len(measurements)} objects of {label_count - 1} regions measured")
+
+    if measurements:
+        objects_image = color_image.copy()
+        for rect in rects:
+            cv2.drawContours(objects_image, [np.intp(cv2.boxPoints(rect))], 0, (0, 255, 0), 1)
+        views["Objects"] = objects_image
+
+    return MultiMeasurementResult(measurements, rects, views)
@@ -123,7 +123,7 @@ def calculate_boundingbox_points(point_cloud, calibration_info_devices, depth_th
 
 		# Get the upper and lower bounding box corner points in 3D
 		height_array = np.array([[-height], [-height], [-height], [-height], [0], [0], [0], [0]])
-		bounding_box_world_3d = np.column_stack((np.row_stack((bounding_box_world_2d,bounding_box_world_2d)), height_array))
+		bounding_box_world_3d = np.column_stack((np.vstack((bounding_box_world_2d,bounding_box_world_2d)), height_array))
 
 		# Get the bounding box points in the image coordinates
 		bounding_box_points_color_image={}
@@ -138,7 +138,7 @@ def calculate_boundingbox_points(point_cloud, calibration_info_devices, depth_th
 				bounding_box_color_image_point = rs.rs2_transform_point_to_point(calibration_info[2], bounding_box_point)			
 				color_pixel.append(rs.rs2_project_point_to_pixel(calibration_info[1][rs.stream.color], bounding_box_color_image_point))
 			
-			bounding_box_points_color_image[device] = np.row_stack( color_pixel )
+			bounding_box_points_color_image[device] = np.vstack( color_pixel )
 		return bounding_box_points_color_image, min_area_rectangle[1][0], min_area_rectangle[1][1], height
 	else : 
 		return {},0,0,0
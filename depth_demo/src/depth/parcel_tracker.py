@@ -0,0 +1,253 @@
+"""
+Tracking of the parcels passing a conveyor through the ROI, for one measurement per parcel
+instead of one per frame.
+
+The objects measured on every frame (measure_objects() in measurement.py) are associated with
+the tracked parcels by the overlap of their bounding boxes with the boxes predicted from the
+parcels' velocities. While a parcel is fully inside the ROI its measurements are collected,
+once it was not seen for max_missed frames it has left and a single event with the median of
+its measurements is emitted. A parcel which was never fully inside the ROI, e.g. one larger
+than the ROI, has no measurements and gets no event.
+"""
+
+import typing
+
+import numpy as np
+
+# Measurement axes collected per parcel
+AXES = ("width", "length", "height")
+
+
+class ParcelEvent(typing.NamedTuple):
+    parcel_id: int
+    first_seq: int
+    last_seq: int
+    first_timestamp: float
+    last_timestamp: float
+    # Frames measured while the parcel was fully inside the ROI
+    samples: int
+    # Median of those frames, only the dimensions measured at least once. The rotated rectangle
+    # of a parcel may swap its sides between frames, length is always the longer one
+    measurement: dict[str, float]
+
+    def to_record(self):
+        return {"parcel_id": self.parcel_id, "first_seq": self.first_seq, "last_seq": self.last_seq, "first_timestamp": self.first_timestamp,
+                "last_timestamp": self.last_timestamp, "samples": self.samples, **self.measurement}
+
+
+def bounding_boxes(rects):
+    """
+    Axis aligned bounding boxes (x0, y0, x1, y1) of cv2 rotated rectangles, as an (N, 4) array
+    """
+    if not rects:
+        return np.zeros((0, 4), dtype=np.float32)
+    rects = np.array([(center_x, center_y, width, length, angle) for ((center_x, center_y), (width, length), angle) in rects], dtype=np.float32)
+    angles = np.radians(rects[:, 4])
+    cos, sin = np.abs(np.cos(angles)), np.abs(np.sin(angles))
+    half_x = (rects[:, 2] * cos + rects[:, 3] * sin) / 2
+    half_y = (rects[:, 2] * sin + rects[:, 3] * cos) / 2
+    return np.column_stack((rects[:, 0] - half_x, rects[:, 1] - half_y, rects[:, 0] + half_x, rects[:, 1] + half_y))
+
+
+def _sample(measurement):
+    sides = sorted((measurement.get("width", np.nan), measurement.get("length", np.nan)))
+    return [sides[0], sides[1], measurement.get("height", np.nan)]
+
+
+def overlaps(boxes_a, boxes_b):
+    """
+    Intersection over union of every box of boxes_a with every box of boxes_b
+    """
+    top_left = np.maximum(boxes_a[:, None, :2], boxes_b[None, :, :2])
+    bottom_right = np.minimum(boxes_a[:, None, 2:], boxes_b[None, :, 2:])
+    intersection = np.prod(np.clip(bottom_right - top_left, 0, None), axis=2)
+    area_a = np.prod(boxes_a[:, 2:] - boxes_a[:, :2], axis=1)
+    area_b = np.prod(boxes_b[:, 2:] - boxes_b[:, :2], axis=1)
+    return intersection / np.maximum(area_a[:, None] + area_b[None, :] - intersection, 1e-9)
+
+
+class ParcelTracker:
+    """
+    The parcels in view are held in fixed size arrays with one slot per parcel, a slot is freed
+    when its parcel's event was emitted. Every parcel ID is emitted at most once, tracks shorter
+    than min_frames and parcels never measured fully inside the ROI are dropped without an event.
+    """
+
+    def __init__(self, roi_shape, first_id=1, max_parcels=32, max_samples=64, min_overlap=0.1, max_missed=3, min_frames=3,
+                 edge_margin=2, velocity_smoothing=0.5):
+        """
+        Parameters:
+        -----------
+        roi_shape          : tuple
+                             (height, width) of the ROI the objects are measured in
+        first_id           : int
+                             ID of the first parcel, continue the IDs of a previous run with it
+        max_parcels        : int
+                             Parcels tracked at the same time, further objects are ignored until a slot is free
+        max_samples        : int
+                             Measurements kept per parcel, the latest ones
+        min_overlap        : double
+                             Smallest intersection over union of a detection with the predicted box of a parcel
+        max_missed         : int
+                             Frames a parcel may go undetected before it counts as gone
+        min_frames         : int
+                             Frames a parcel has to be seen in, shorter tracks are noise and are dropped without an event
+        edge_margin        : double
+                             Pixels a parcel has to stay away from the ROI border to be fully inside
+        velocity_smoothing : double
+                             Weight of the latest displacement in the velocity estimate
+        """
+        self.roi_height, self.roi_width = roi_shape
+        self.next_id = first_id
+        self.max_samples = max_samples
+        self.min_overlap = min_overlap
+        self.max_missed = max_missed
+        self.min_frames = min_frames
+        self.edge_margin = edge_margin
+        self.velocity_smoothing = velocity_smoothing
+
+        self.active = np.zeros(max_parcels, dtype=bool)
+        self.ids = np.zeros(max_parcels, dtype=np.int64)
+        # Bounding box at the last detection and velocity in pixels per frame
+        self.boxes = np.zeros((max_parcels, 4), dtype=np.float32)
+        self.velocities = np.zeros((max_parcels, 2), dtype=np.float32)
+        self.first_seqs = np.zeros(max_parcels, dtype=np.int64)
+        self.last_seqs = np.zeros(max_parcels, dtype=np.int64)
+        self.first_timestamps = np.zeros(max_parcels, dtype=np.float64)
+        self.last_timestamps = np.zeros(max_parcels, dtype=np.float64)
+        self.frames = np.zeros(max_parcels, dtype=np.int32)
+        # Ring of the latest measurements (width, length, height), NaN for a missing dimension
+        self.samples = np.full((max_parcels, max_samples, len(AXES)), np.nan, dtype=np.float32)
+        self.sample_counts = np.zeros(max_parcels, dtype=np.int64)
+        # Objects which found no free slot
+        self.overflow = 0
+        # Parcels tracked for min_frames or longer which were never fully inside the ROI
+        self.unmeasured = 0
+
+    def __len__(self):
+        return int(np.count_nonzero(self.active))
+
+    def _inside(self, boxes):
+        return ((boxes[:, 0] >= self.edge_margin) & (boxes[:, 1] >= self.edge_margin) &
+                (boxes[:, 2] <= self.roi_width - self.edge_margin) & (boxes[:, 3] <= self.roi_height - self.edge_margin))
+
+    def _associate(self, slots, predicted, boxes):
+        """
+        Greedy assignment by decreasing overlap, returns (slot, detection) pairs
+        """
+        if not len(slots) or not len(boxes):
+            return []
+        overlap = overlaps(predicted, boxes)
+        candidates = np.argwhere(overlap >= self.min_overlap)
+        candidates = candidates[np.argsort(-overlap[candidates[:, 0], candidates[:, 1]], kind="stable")]
+        pairs = []
+        used_slots, used_detections = set(), set()
+        for (track, detection) in candidates:
+            if track in used_slots or detection in used_detections:
+                continue
+            used_slots.add(track)
+            used_detections.add(detection)
+            pairs.append((slots[track], detection))
+        return pairs
+
+    def _event(self, slot):
+        measurement = {}
+        count = min(self.sample_counts[slot], self.max_samples)
+        if count:
+            samples = self.samples[slot, :count]
+            for (axis, name) in enumerate(AXES):
+                values = samples[:, axis][~np.isnan(samples[:, axis])]
+                if len(values):
+                    measurement[name] = float(np.median(values))
+        return ParcelEvent(int(self.ids[slot]), int(self.first_seqs[slot]), int(self.last_seqs[slot]), float(self.first_timestamps[slot]),
+                           float(self.last_timestamps[slot]), int(self.sample_counts[slot]), measurement)
+
+    def _finish(self, slots):
+        tracked = slots[self.frames[slots] >= self.min_frames]
+        measured = tracked[self.sample_counts[tracked] > 0]
+        self.unmeasured += len(tracked) - len(measured)
+        events = [self._event(slot) for slot in measured]
+        self.active[slots] = False
+        return sorted(events, key=lambda event: event.parcel_id)
+
+    def update(self, objects, rects, seq, timestamp):
+        """
+        Adds the objects measured on one frame
+
+        Parameters:
+        -----------
+        objects   : list
+                    Measurements of the objects as returned by measure_objects()
+        rects     : list
+                    Their rotated rectangles in ROI coordinates
+        seq       : int
+                    Sequence number of the frame, gaps (dropped frames) are allowed for
+        timestamp : double
+
+        Return:
+        ----------
+        events : [ParcelEvent]
+                 Parcels which left the ROI with this frame
+        """
+        boxes = bounding_boxes(rects)
+        slots = np.flatnonzero(self.active)
+        # Positions predicted for this frame from the velocities
+        elapsed = (seq - self.last_seqs[slots]).astype(np.float32)
+        shift = self.velocities[slots] * elapsed[:, None]
+        predicted = self.boxes[slots] + np.hstack((shift, shift))
+
+        pairs = self._associate(slots, predicted, boxes)
+        matched = np.array([slot for (slot, _) in pairs], dtype=np.int64)
+        detections = np.array([detection for (_, detection) in pairs], dtype=np.int64)
+
+        if len(pairs):
+            displacement = ((boxes[detections, :2] + boxes[detections, 2:]) - (self.boxes[matched, :2] + self.boxes[matched, 2:])) / 2
+            steps = (seq - self.last_seqs[matched]).astype(np.float32)[:, None]
+            fresh = self.frames[matched] == 1
+            smoothing = np.where(fresh, 1.0, self.velocity_smoothing)[:, None]
+            self.velocities[matched] = smoothing * displacement / steps + (1 - smoothing) * self.velocities[matched]
+            self.boxes[matched] = boxes[detections]
+            self.last_seqs[matched] = seq
+            self.last_timestamps[matched] = timestamp
+            self.frames[matched] += 1
+
+            inside = self._inside(boxes[detections])
+            for (slot, detection) in zip(matched[inside], detections[inside]):
+                self.samples[slot, self.sample_counts[slot] % self.max_samples] = _sample(objects[detection])
+                self.sample_counts[slot] += 1
+
+        # Parcels not seen for longer than max_missed frames have left
+        gone = slots[seq - self.last_seqs[slots] > self.max_missed]
+        events = self._finish(gone)
+
+        unmatched = np.ones(len(boxes), dtype=bool)
+        unmatched[detections] = False
+        new = np.flatnonzero(unmatched)
+        free = np.flatnonzero(~self.active)
+        if len(new) > len(free):
+            self.overflow += len(new) - len(free)
+            new = new[:len(free)]
+        if len(new):
+            slots = free[:len(new)]
+            self.active[slots] = True
+            self.ids[slots] = np.arange(self.next_id, self.next_id + len(new))
+            self.next_id += len(new)
+            self.boxes[slots] = boxes[new]
+            self.velocities[slots] = 0
+            self.first_seqs[slots] = self.last_seqs[slots] = seq
+            self.first_timestamps[slots] = self.last_timestamps[slots] = timestamp
+            self.frames[slots] = 1
+            self.samples[slots] = np.nan
+            self.sample_counts[slots] = 0
+            inside = self._inside(boxes[new])
+            for (slot, detection) in zip(slots[inside], new[inside]):
+                self.samples[slot, 0] = _sample(objects[detection])
+                self.sample_counts[slot] = 1
+
+        return events
+
+    def flush(self):
+        """
+        Ends the tracking of all parcels in view, e.g. on shutdown, and returns their events
+        """
+        return self._finish(np.flatnonzero(self.active))
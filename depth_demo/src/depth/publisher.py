@@ -0,0 +1,127 @@
+import base64
+import json
+import time
+import typing
+
+import numpy as np
+import valkey
+
+from frame_ring import FrameRing
+
+
+class ValkeyPublisher:
+    """
+    Publishes the results of the capture loop to Valkey.
+
+    Every published frame gets the next sequence number. The image, the measurement record
+    tagged with the same sequence number and "stream_seq" are written in one transaction, so
+    readers can poll the cheap sequence key and then fetch a matching image and measurement.
+    The sequence is continued from Valkey on start up, there must be only one capture process
+    publishing per Valkey instance.
+
+    Every measurement is also appended to the "measurement_history" stream, capped at roughly
+    history_maxlen entries, and published on the "measurement_events" channel.
+
+    In the multi object mode the measurements of all objects are published with every frame as
+    the "objects" list of the measurement record and as the JSON "objects" key, the record's own
+    dimensions are those of the largest object.
+
+    Parcel events of the conveyor tracking (see parcel_tracker.py) are appended to the
+    "parcel_history" stream and published on the "parcel_events" channel, the parcel IDs are
+    continued from "parcel_seq" on start up like the frame sequence.
+
+    With a frame_ring the frame, the depth ROI and the measurement are additionally written to
+    shared memory first, for API workers on the same host. Valkey stays the source for all others.
+
+    With a depth_encoder (see depth_codec.py) the depth ROI is also published, as "depth_frame"
+    and appended to the short "depth_frames" stream for remote measurement workers. Depth frames
+    are dropped whenever they would exceed depth_budget bytes per second on average.
+    """
+
+    HISTORY_KEY = "measurement_history"
+    EVENTS_CHANNEL = "measurement_events"
+    DEPTH_KEY = "depth_frame"
+    DEPTH_STREAM_KEY = "depth_frames"
+    PARCEL_HISTORY_KEY = "parcel_history"
+    PARCEL_EVENTS_CHANNEL = "parcel_events"
+
+    def __init__(self, valkey_client: valkey.Valkey, history_maxlen: int = 1_000_000, frame_ring: FrameRing | None = None,
+                 depth_encoder: typing.Callable[[np.ndarray, int], bytes] | None = None, depth_budget: float = 4_000_000, depth_maxlen: int = 90):
+        self.valkey_client = valkey_client
+        self.frame_ring = frame_ring
+        self.history_maxlen = history_maxlen
+        self.frame_seq = int(valkey_client.get("stream_seq") or 0)
+        self.parcel_seq = int(valkey_client.get("parcel_seq") or 0)
+        self.depth_encoder = depth_encoder
+        self.depth_budget = depth_budget
+        self.depth_maxlen = depth_maxlen
+        # Token bucket holding at most a quarter of a second of the budget, so bursts stay short
+        self.depth_allowance = depth_budget / 4
+        self.depth_refilled_at = time.monotonic()
+        self.depth_dropped = 0
+
+    def _encode_depth(self, depth_roi: np.ndarray) -> bytes | None:
+        now = time.monotonic()
+        self.depth_allowance = min(self.depth_budget / 4, self.depth_allowance + (now - self.depth_refilled_at) * self.depth_budget)
+        self.depth_refilled_at = now
+        if self.depth_allowance <= 0:
+            self.depth_dropped += 1
+            return None
+
+        payload = self.depth_encoder(depth_roi, self.frame_seq)
+        # May go negative, the following frames are dropped until the bucket refilled
+        self.depth_allowance -= len(payload)
+        return payload
+
+    def publish_frame(self, encoded_image: bytes, measurement: dict[str, float] | None = None, depth_roi: np.ndarray | None = None,
+                      objects: list[dict[str, float]] | None = None) -> int:
+        self.frame_seq += 1
+        record = {"seq": self.frame_seq, "timestamp": time.time(), **measurement} if measurement is not None else None
+        if record is not None and objects is not None:
+            record["objects"] = objects
+
+        if self.frame_ring is not None:
+            self.frame_ring.write(self.frame_seq, encoded_image, depth_roi, record)
+
+        depth_payload = None
+        if self.depth_encoder is not None and depth_roi is not None:
+            depth_payload = self._encode_depth(depth_roi)
+
+        pipeline = self.valkey_client.pipeline(transaction=True)
+        pipeline.set("stream_image", base64.b64encode(encoded_image).decode("utf-8"))
+        if depth_payload is not None:
+            pipeline.set(self.DEPTH_KEY, depth_payload)
+            pipeline.xadd(self.DEPTH_STREAM_KEY, {"seq": self.frame_seq, "depth": depth_payload}, maxlen=self.depth_maxlen, approximate=True)
+        if measurement is not None:
+            pipeline.set("measurement", json.dumps(record))
+            # Cheap key for readers checking whether their cached measurement is still current
+            pipeline.set("measurement_seq", self.frame_seq)
+            # Stream fields are flat, the object list is stored as JSON
+            history_record = {**record, "objects": json.dumps(objects)} if objects is not None else record
+            pipeline.xadd(self.HISTORY_KEY, history_record, maxlen=self.history_maxlen, approximate=True)
+            pipeline.publish(self.EVENTS_CHANNEL, json.dumps(record))
+            # Plain keys kept for readers of the individual values
+            for key, value in measurement.items():
+                pipeline.set(key, value)
+        if objects is not None:
+            pipeline.set("objects", json.dumps(objects))
+        pipeline.set("stream_seq", self.frame_seq)
+        pipeline.execute()
+
+        return self.frame_seq
+
+    def publish_parcels(self, events: list) -> None:
+        """
+        Publishes the ParcelEvents of parcels which left the ROI, all in one transaction
+        """
+        if not events:
+            return
+
+        pipeline = self.valkey_client.pipeline(transaction=True)
+        for event in events:
+            record = event.to_record()
+            pipeline.xadd(self.PARCEL_HISTORY_KEY, record, maxlen=self.history_maxlen, approximate=True)
+            pipeline.publish(self.PARCEL_EVENTS_CHANNEL, json.dumps(record))
+            self.parcel_seq = max(self.parcel_seq, event.parcel_id)
+        pipeline.set("parcel_seq", self.parcel_seq)
+        pipeline.execute()
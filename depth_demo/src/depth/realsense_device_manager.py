@@ -8,6 +8,8 @@
 import pyrealsense2 as rs
 import numpy as np
 
+from warmup import wait_for_stable_devices
+
 """
   _   _        _                      _____                     _    _
  | | | |  ___ | | _ __    ___  _ __  |  ___|_   _  _ __    ___ | |_ (_)  ___   _ __   ___
@@ -254,6 +256,28 @@ class DeviceManager:
                     height = stream.as_video_stream_profile().height()
         return width, height
 
+    def get_stream_profiles(self):
+        """
+        Describe the active stream profiles of every enabled device
+
+        Return:
+        -----------
+        stream_profiles : dict
+        keys  : serial
+                Serial number of the device
+        values: [str]
+                Sorted descriptions like "stream.depth/0 format.z16 1280x720@15"
+        """
+        stream_profiles = {}
+        for (serial, device) in self._enabled_devices.items():
+            descriptions = []
+            for stream in device.pipeline_profile.get_streams():
+                video_profile = stream.as_video_stream_profile()
+                descriptions.append("%s/%d %s %dx%d@%d" % (stream.stream_type(), stream.stream_index(), stream.format(),
+                                                          video_profile.width(), video_profile.height(), stream.fps()))
+            stream_profiles[serial] = sorted(descriptions)
+        return stream_profiles
+
     def get_device_intrinsics(self, frames):
         """
         Get the intrinsics of the imager using its frame delivered by the realsense device
@@ -326,8 +350,7 @@ if __name__ == "__main__":
         c.enable_stream(rs.stream.color, 1280, 720, rs.format.rgb8, 6)
         device_manager = DeviceManager(rs.context(), c)
         device_manager.enable_all_devices()
-        for k in range(150):
-            frames = device_manager.poll_frames()
+        frames, warmup_reports = wait_for_stable_devices(device_manager)
         device_manager.enable_emitter(True)
         device_extrinsics = device_manager.get_depth_to_color_extrinsics(frames)
     finally:
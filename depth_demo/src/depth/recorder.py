@@ -0,0 +1,339 @@
+"""
+Recording of the capture loop for offline replay and re-measurement.
+
+Usage: python recorder.py RECORDING [--start SEQ] [--count N] [--show]
+
+A recording is a directory holding
+    recording.json    ROI, codecs, depth scale, intrinsics and post-processing filter configuration
+    index.bin         one fixed size INDEX_DTYPE record per frame, append-only
+    chunk_NNNNN.bin   depth, colour and measurement of the frames, append-only, a new chunk
+                      is started every chunk_bytes
+
+A frame is only added to the index after its data was written, so the index never points at
+incomplete data, even if the capture process was killed while recording. recording.json is
+written when the recording is started and completed with the frame shapes by the first frame.
+"""
+
+import argparse
+import json
+import mmap
+import os
+import queue
+import threading
+import time
+import typing
+
+import cv2
+import numpy as np
+
+from depth_codec import CODEC_DELTA_ZLIB, decode_depth, encode_depth
+
+RECORDING_VERSION = 1
+
+INDEX_DTYPE = np.dtype([
+    ("seq", "<u8"),
+    ("timestamp", "<f8"),
+    ("chunk", "<u4"),
+    ("depth_length", "<u4"),
+    ("offset", "<u8"),
+    ("color_length", "<u4"),
+    ("measurement_length", "<u4"),
+])
+
+COLOR_RAW = "raw"
+COLOR_PNG = "png"
+COLOR_JPEG = "jpeg"
+
+
+def _chunk_name(chunk):
+    return f"chunk_{chunk:05d}.bin"
+
+
+class RecordedFrame(typing.NamedTuple):
+    seq: int
+    timestamp: float
+    depth: np.ndarray
+    color: np.ndarray
+    # The measurement published for this frame, None if nothing was measured
+    measurement: dict | None
+
+
+class Recorder:
+    """
+    Appends frames to a recording from a background thread, record() only copies the frame into
+    a bounded queue and never blocks the capture loop. When the writer falls behind the queue is
+    full and frames are dropped, counted in `dropped`. Frames which cannot be encoded are skipped
+    and counted there too.
+
+    Writing the archive is stopped by the first OSError (disk full or gone), it is kept in
+    `error` and all later frames are dropped.
+    """
+
+    def __init__(self, path, meta=None, color_codec=COLOR_PNG, depth_codec=CODEC_DELTA_ZLIB, chunk_bytes=256 * 1024 * 1024, queue_size=64):
+        """
+        Parameters:
+        -----------
+        path        : str
+                      Directory of the recording, created if it does not exist, must not hold a recording
+        meta        : dict
+                      Stored in recording.json: depth_scale, intrinsics, roi, filters, ...
+        color_codec : str
+                      COLOR_PNG (lossless), COLOR_JPEG (about five times smaller) or COLOR_RAW (fastest playback)
+        depth_codec : int
+                      Codec of depth_codec.py, the depth is always stored losslessly
+        chunk_bytes : int
+                      Size after which the next chunk file is started
+        queue_size  : int
+                      Frames buffered for the writer thread
+        """
+        self.path = path
+        self.color_codec = color_codec
+        self.depth_codec = depth_codec
+        self.chunk_bytes = chunk_bytes
+        self.meta = dict(meta or {})
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.recorded = 0
+        self.dropped = 0
+        self.error = None
+        # Of the last frame which could not be encoded
+        self.encode_error = None
+
+        os.makedirs(path, exist_ok=True)
+        if os.path.exists(os.path.join(path, "recording.json")):
+            raise FileExistsError(f"{path} already holds a recording")
+        self.created = time.time()
+        # A recording without frames can be opened as well
+        self._write_meta(None, None)
+
+        self.chunk = 0
+        self.chunk_file = None
+        self.index_file = open(os.path.join(path, "index.bin"), "ab")
+        self.thread = threading.Thread(target=self._run, name="Recorder", daemon=True)
+        self.thread.start()
+
+    def record(self, seq, depth_roi, color_roi, measurement=None):
+        """
+        Queues a frame, returns False if it was dropped
+        """
+        if self.error is not None:
+            self.dropped += 1
+            return False
+        try:
+            # Copies, the capture loop reuses the frame buffers
+            self.queue.put_nowait((seq, time.time(), np.array(depth_roi, dtype=np.uint16), np.array(color_roi, dtype=np.uint8), measurement))
+            return True
+        except queue.Full:
+            self.dropped += 1
+            return False
+
+    def close(self):
+        """
+        Writes the queued frames and closes the recording
+        """
+        # The writer drains the queue, unless it died
+        while self.thread.is_alive():
+            try:
+                self.queue.put(None, timeout=0.1)
+                break
+            except queue.Full:
+                pass
+        self.thread.join()
+        self.index_file.close()
+        if self.chunk_file is not None:
+            self.chunk_file.close()
+        if self.error is not None:
+            print("Recorder failed:", self.error)
+        if self.encode_error is not None:
+            print("Recorder skipped frames which could not be encoded:", self.encode_error)
+
+    def _write_meta(self, depth_shape, color_shape):
+        meta = {
+            **self.meta,
+            "version": RECORDING_VERSION,
+            "depth_codec": self.depth_codec,
+            "color_codec": self.color_codec,
+            "depth_shape": list(depth_shape) if depth_shape is not None else None,
+            "color_shape": list(color_shape) if color_shape is not None else None,
+            "created": self.created,
+        }
+        # Replaced at once, a reader never sees a partly written file
+        meta_path = os.path.join(self.path, "recording.json")
+        with open(meta_path + ".tmp", "w") as file:
+            json.dump(meta, file, indent=2)
+        os.replace(meta_path + ".tmp", meta_path)
+
+    def _encode_color(self, color):
+        if self.color_codec == COLOR_RAW:
+            return np.ascontiguousarray(color).tobytes()
+        if self.color_codec == COLOR_PNG:
+            success, encoded = cv2.imencode(".png", color, [cv2.IMWRITE_PNG_COMPRESSION, 1])
+        else:
+            success, encoded = cv2.imencode(".jpg", color, [cv2.IMWRITE_JPEG_QUALITY, 95])
+        if not success:
+            raise ValueError("colour encoding failed")
+        return encoded.tobytes()
+
+    def _run(self):
+        entry = np.zeros(1, dtype=INDEX_DTYPE)
+        while True:
+            item = self.queue.get()
+            if item is None:
+                break
+            if self.error is not None:
+                self.dropped += 1
+                continue
+
+            seq, timestamp, depth, color, measurement = item
+            try:
+                depth_bytes = encode_depth(depth, seq, self.meta.get("depth_scale", 0.001), codec=self.depth_codec, timestamp=timestamp)
+                color_bytes = self._encode_color(color)
+                measurement_bytes = json.dumps(measurement).encode("utf-8") if measurement is not None else b""
+            except Exception as e:
+                # Only this frame is lost, e.g. a measurement which is not JSON serialisable
+                self.encode_error = e
+                self.dropped += 1
+                continue
+
+            try:
+                if self.chunk_file is None:
+                    self._write_meta(depth.shape, color.shape)
+                    self.chunk_file = open(os.path.join(self.path, _chunk_name(self.chunk)), "ab")
+                elif self.chunk_file.tell() >= self.chunk_bytes:
+                    self.chunk_file.close()
+                    self.chunk += 1
+                    self.chunk_file = open(os.path.join(self.path, _chunk_name(self.chunk)), "ab")
+
+                offset = self.chunk_file.tell()
+                self.chunk_file.write(depth_bytes)
+                self.chunk_file.write(color_bytes)
+                self.chunk_file.write(measurement_bytes)
+                self.chunk_file.flush()
+
+                entry[0] = (seq, timestamp, self.chunk, len(depth_bytes), offset, len(color_bytes), len(measurement_bytes))
+                self.index_file.write(entry.tobytes())
+                self.index_file.flush()
+                self.recorded += 1
+            except (OSError, ValueError) as e:
+                # Disk full or gone, or the file closed under the writer, the capture loop keeps
+                # running without recording
+                self.error = e
+                self.dropped += 1
+
+
+class Recording:
+    """
+    Read access to a recording. The index and the chunks are memory mapped, frames are looked up
+    by position or sequence number without reading anything else and decoded on access.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._chunks = {}
+        self.refresh()
+
+    def refresh(self):
+        """
+        Picks up frames appended since the recording was opened
+        """
+        # The frame shapes are only known once the first frame was recorded
+        with open(os.path.join(self.path, "recording.json")) as file:
+            self.meta = json.load(file)
+        if self.meta["version"] != RECORDING_VERSION:
+            raise ValueError(f"{self.path} is not a version {RECORDING_VERSION} recording")
+        self.color_shape = tuple(self.meta["color_shape"]) if self.meta["color_shape"] is not None else None
+        # Chunks grow, the map of the last one has to be renewed
+        self.close()
+        index_path = os.path.join(self.path, "index.bin")
+        # A record being written by the recorder right now is left out
+        count = os.path.getsize(index_path) // INDEX_DTYPE.itemsize
+        self.index = np.memmap(index_path, dtype=INDEX_DTYPE, mode="r", shape=(count,)) if count else np.zeros(0, dtype=INDEX_DTYPE)
+
+    def close(self):
+        for chunk_map in self._chunks.values():
+            chunk_map.close()
+        self._chunks = {}
+
+    def __len__(self):
+        return len(self.index)
+
+    def _chunk(self, chunk):
+        if chunk not in self._chunks:
+            with open(os.path.join(self.path, _chunk_name(chunk)), "rb") as file:
+                self._chunks[chunk] = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        return self._chunks[chunk]
+
+    def position(self, seq):
+        """
+        Position of the frame with the given sequence number, None if it was not recorded
+        """
+        seqs = self.index["seq"]
+        if not len(seqs):
+            return None
+        # Without dropped frames the sequence numbers are consecutive
+        position = seq - int(seqs[0])
+        if 0 <= position < len(seqs) and seqs[position] == seq:
+            return position
+        position = int(np.searchsorted(seqs, seq))
+        if position < len(seqs) and seqs[position] == seq:
+            return position
+        return None
+
+    def _decode_color(self, data):
+        if self.meta["color_codec"] == COLOR_RAW:
+            # Copied, so the chunk map can be closed while frames are still in use
+            return np.frombuffer(data, dtype=np.uint8).reshape(self.color_shape).copy()
+        return cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_COLOR)
+
+    def __getitem__(self, position):
+        entry = self.index[position]
+        chunk_map = memoryview(self._chunk(int(entry["chunk"])))
+        offset = int(entry["offset"])
+        depth_end = offset + int(entry["depth_length"])
+        color_end = depth_end + int(entry["color_length"])
+        measurement_end = color_end + int(entry["measurement_length"])
+
+        depth = decode_depth(chunk_map[offset:depth_end]).depth
+        color = self._decode_color(chunk_map[depth_end:color_end])
+        measurement = json.loads(bytes(chunk_map[color_end:measurement_end])) if measurement_end > color_end else None
+
+        return RecordedFrame(int(entry["seq"]), float(entry["timestamp"]), depth, color, measurement)
+
+    def frames(self, start=0, stop=None):
+        for position in range(start, len(self) if stop is None else min(stop, len(self))):
+            yield self[position]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay a recording of the capture loop")
+    parser.add_argument("recording", help="directory of the recording")
+    parser.add_argument("--start", type=int, help="sequence number of the first frame, the first recorded one by default")
+    parser.add_argument("--count", type=int, help="number of frames, all following ones by default")
+    parser.add_argument("--show", action="store_true", help="show the frames, any key steps to the next one, q quits")
+    args = parser.parse_args()
+
+    recording = Recording(args.recording)
+    start = 0
+    if args.start is not None:
+        start = recording.position(args.start)
+        if start is None:
+            parser.error(f"frame {args.start} is not in the recording")
+    stop = None if args.count is None else start + args.count
+
+    print(f"{len(recording)} frames, {recording.meta['color_codec']} colour, filters: {recording.meta.get('filters')}")
+    replayed = 0
+    started_at = time.perf_counter()
+    for frame in recording.frames(start, stop):
+        replayed += 1
+        if args.show:
+            print(frame.seq, frame.measurement)
+            cv2.imshow("Color", frame.color)
+            cv2.imshow("Depth", np.uint8(cv2.normalize(frame.depth, None, 0, 255, cv2.NORM_MINMAX)))
+            if cv2.waitKey(0) & 0xFF == ord('q'):
+                break
+
+    elapsed = time.perf_counter() - started_at
+    print(f"Replayed {replayed} frames in {elapsed:.2f}s ({replayed / max(elapsed, 1e-9):.0f} frames/s)")
+
+
+if __name__ == "__main__":
+    main()
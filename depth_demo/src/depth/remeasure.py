@@ -0,0 +1,244 @@
+"""
+Offline re-measurement of recorded frames (see recorder.py) on all cores, with an accuracy
+report against ground truth and a throughput report.
+
+Usage: python remeasure.py RECORDINGS... [--ground-truth truth.json] [--workers N]
+                           [--filtering-mode percentile] [--region-percent 5] [--min-object-height 5]
+                           [--ground-calibration ground_calibration.npz]
+
+RECORDINGS are recording directories, directories holding recordings or .tar/.zip archives of
+them. The ground truth file is a list of entries, each applying to a range of sequence numbers
+of one recording (all recordings if "recording" is left out):
+
+    [{"recording": "shift1", "start_seq": 1200, "end_seq": 1350, "width": 212, "length": 305, "height": 70}]
+
+Dimensions are given in the units the measurement publishes: width and length in pixels,
+height in millimetres. The footprint is compared independently of its orientation, the
+shorter measured side against the shorter of width/length.
+
+The heights are measured against the ground plane stored with a recording, if it was made with
+a ground calibration, --ground-calibration replaces it for all recordings. Recordings without
+either are measured against a level table at --ground-distance.
+"""
+
+import argparse
+import concurrent.futures
+import json
+import os
+import tarfile
+import tempfile
+import time
+import zipfile
+
+import numpy as np
+
+import measurement
+from depth_codec import DepthIntrinsics
+from ground_plane import GroundMap, GroundPlane, load_ground_map
+from recorder import Recording
+
+AXES = ("width", "length", "height")
+
+# Per worker process
+_recordings = {}
+_grounds = {}
+_ground_calibration = None
+
+
+def find_recordings(paths, extract_dir):
+    recordings = []
+    for path in paths:
+        if os.path.isfile(path) and (tarfile.is_tarfile(path) or zipfile.is_zipfile(path)):
+            target = os.path.join(extract_dir, os.path.basename(path))
+            if tarfile.is_tarfile(path):
+                with tarfile.open(path) as archive:
+                    archive.extractall(target, filter="data")
+            else:
+                with zipfile.ZipFile(path) as archive:
+                    archive.extractall(target)
+            path = target
+        for (directory, _, files) in os.walk(path):
+            if "recording.json" in files:
+                recordings.append(directory)
+    return sorted(recordings)
+
+
+def load_ground_truth(path):
+    if path is None:
+        return []
+    with open(path) as file:
+        return json.load(file)
+
+
+def truth_for(ground_truth, recording, seq):
+    for entry in ground_truth:
+        if entry.get("recording", recording) != recording:
+            continue
+        if entry.get("start_seq", seq) <= seq <= entry.get("end_seq", seq):
+            return entry
+    return None
+
+
+def _configure(settings, ground_calibration=None):
+    global _ground_calibration
+    # The measurement constants are module globals read on every call
+    for (name, value) in settings.items():
+        setattr(measurement, name, value)
+    _ground_calibration = ground_calibration
+
+
+def _ground_for(recording_path, meta, depth_scale):
+    if recording_path not in _grounds:
+        if _ground_calibration is not None:
+            ground = load_ground_map(_ground_calibration, meta["roi"], depth_scale)
+        elif meta.get("ground_plane") is not None:
+            plane = GroundPlane(**{**meta["ground_plane"], "normal": tuple(meta["ground_plane"]["normal"])})
+            intrinsics = DepthIntrinsics(**{**meta["intrinsics"], "coeffs": tuple(meta["intrinsics"]["coeffs"])})
+            ground = GroundMap.from_plane(plane, intrinsics, meta["roi"], depth_scale)
+        else:
+            ground = None
+        _grounds[recording_path] = ground
+    return _grounds[recording_path]
+
+
+def _measure_range(recording_path, start, stop):
+    recording = _recordings.get(recording_path)
+    if recording is None:
+        recording = _recordings[recording_path] = Recording(recording_path)
+    depth_scale = recording.meta.get("depth_scale", 0.001)
+    ground = _ground_for(recording_path, recording.meta, depth_scale)
+
+    started_at = time.process_time()
+    results = []
+    for frame in recording.frames(start, stop):
+        result = measurement.measure_object(frame.depth, frame.color, depth_scale, verbose=False, ground=ground)
+        results.append((frame.seq, result.measurement, frame.measurement))
+    return results, time.process_time() - started_at
+
+
+def errors_against(measured, truth):
+    """
+    Signed error per axis, footprint sides matched by size
+    """
+    errors = {}
+    if "width" in measured and "length" in measured and "width" in truth and "length" in truth:
+        measured_sides = sorted((measured["width"], measured["length"]))
+        truth_sides = sorted((truth["width"], truth["length"]))
+        errors["width"] = measured_sides[0] - truth_sides[0]
+        errors["length"] = measured_sides[1] - truth_sides[1]
+    if "height" in measured and "height" in truth:
+        errors["height"] = measured["height"] - truth["height"]
+    return errors
+
+
+def accuracy_report(errors, missing):
+    report = {}
+    for axis in AXES:
+        values = np.asarray(errors[axis], dtype=np.float64)
+        if not len(values):
+            report[axis] = {"frames": 0, "missing": missing[axis]}
+            continue
+        report[axis] = {
+            "frames": len(values),
+            "missing": missing[axis],
+            "bias": round(float(values.mean()), 3),
+            "sigma": round(float(values.std(ddof=1)) if len(values) > 1 else 0.0, 3),
+            "p95_abs_error": round(float(np.percentile(np.abs(values), 95)), 3),
+        }
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Re-measure recorded frames and report accuracy and throughput")
+    parser.add_argument("recordings", nargs="+", help="recording directories, directories of recordings or .tar/.zip archives")
+    parser.add_argument("--ground-truth", help="JSON list of ground truth dimensions per sequence range")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="worker processes, all cores by default")
+    parser.add_argument("--batch", type=int, default=64, help="frames per task")
+    parser.add_argument("--filtering-mode", choices=["percentile", "median_region"], default=measurement.FILTERING_MODE)
+    parser.add_argument("--region-percent", type=float, default=measurement.REGION_PERCENT)
+    parser.add_argument("--percentile-min", type=float, default=measurement.PERCENTILE_MIN)
+    parser.add_argument("--ground-distance", type=float, default=measurement.FIXED_GROUND_DISTANCE, help="table surface distance in metres, without ground calibration")
+    parser.add_argument("--ground-calibration", help="ground calibration of ground_plane.py, replaces the ground planes of the recordings")
+    parser.add_argument("--min-object-height", type=float, default=measurement.MIN_OBJECT_HEIGHT, help="height above the table in mm above which a pixel belongs to an object")
+    parser.add_argument("--json", help="also write the report to this file")
+    args = parser.parse_args()
+
+    settings = {
+        "FILTERING_MODE": args.filtering_mode,
+        "REGION_PERCENT": args.region_percent,
+        "PERCENTILE_MIN": args.percentile_min,
+        "FIXED_GROUND_DISTANCE": args.ground_distance,
+        "MIN_OBJECT_HEIGHT": args.min_object_height,
+    }
+    ground_truth = load_ground_truth(args.ground_truth)
+
+    with tempfile.TemporaryDirectory() as extract_dir:
+        recordings = find_recordings(args.recordings, extract_dir)
+        if not recordings:
+            parser.error("no recordings found")
+
+        tasks = []
+        for path in recordings:
+            frame_count = len(Recording(path))
+            tasks += [(path, start, start + args.batch) for start in range(0, frame_count, args.batch)]
+
+        errors = {axis: [] for axis in AXES}
+        missing = {axis: 0 for axis in AXES}
+        frames = 0
+        changed = 0
+        cpu_seconds = 0.0
+        started_at = time.perf_counter()
+        with concurrent.futures.ProcessPoolExecutor(args.workers, initializer=_configure, initargs=(settings, args.ground_calibration)) as pool:
+            futures = {pool.submit(_measure_range, *task): task[0] for task in tasks}
+            for future in concurrent.futures.as_completed(futures):
+                name = os.path.basename(futures[future])
+                results, task_cpu_seconds = future.result()
+                cpu_seconds += task_cpu_seconds
+                for (seq, measured, recorded) in results:
+                    frames += 1
+                    if {key: round(value, 3) for (key, value) in measured.items()} != {key: round(value, 3) for (key, value) in (recorded or {}).items()}:
+                        changed += 1
+                    truth = truth_for(ground_truth, name, seq)
+                    if truth is None:
+                        continue
+                    frame_errors = errors_against(measured, truth)
+                    for axis in AXES:
+                        if axis in frame_errors:
+                            errors[axis].append(frame_errors[axis])
+                        elif axis in truth:
+                            missing[axis] += 1
+        wall_seconds = time.perf_counter() - started_at
+
+    report = {
+        "settings": settings,
+        "ground_calibration": args.ground_calibration,
+        "recordings": len(recordings),
+        "frames": frames,
+        # Frames whose measurement differs from the one published while recording
+        "changed_from_recorded": changed,
+        "accuracy": accuracy_report(errors, missing),
+        "throughput": {
+            "workers": args.workers,
+            "wall_seconds": round(wall_seconds, 3),
+            "frames_per_second": round(frames / wall_seconds, 1),
+            "frames_per_second_per_core": round(frames / cpu_seconds, 1) if cpu_seconds else None,
+        },
+    }
+
+    print(f"{frames} frames of {len(recordings)} recordings, {changed} measured differently than recorded")
+    print(f"{'axis':<8}{'frames':>8}{'missing':>9}{'bias':>10}{'sigma':>10}{'P95 |err|':>11}")
+    for (axis, values) in report["accuracy"].items():
+        if values["frames"]:
+            print(f"{axis:<8}{values['frames']:>8}{values['missing']:>9}{values['bias']:>10.3f}{values['sigma']:>10.3f}{values['p95_abs_error']:>11.3f}")
+        else:
+            print(f"{axis:<8}{0:>8}{values['missing']:>9}{'-':>10}{'-':>10}{'-':>11}")
+    throughput = report["throughput"]
+    print(f"{throughput['frames_per_second']} frames/s on {args.workers} workers, {throughput['frames_per_second_per_core']} frames/s/core")
+
+    if args.json:
+        with open(args.json, "w") as file:
+            json.dump(report, file, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,55 @@
+"""
+Emulator of the part of pyrealsense2 used by this project, for tests, soak tests and
+benchmarks without cameras. N virtual cameras deliver synthetic or recorded frames at their
+configured resolution and frame rate.
+
+    import rs_emulator
+    source = rs_emulator.SyntheticSource(boxes=[Box(0, 0, 0.2, 0.12, 0.07)])
+    rs_emulator.install([rs_emulator.VirtualCamera("000000000001", source)])
+    import pyrealsense2 as rs   # the emulator from here on
+
+install() has to run before the modules importing pyrealsense2 are imported, they keep the
+module they got.
+"""
+
+import sys
+
+from . import device as _device
+from .device import config, context, depth_sensor, device, pipeline, pipeline_profile, pipeline_wrapper, rs400_advanced_mode, sensor
+from .enums import camera_info, distortion, format, frame_metadata_value, option, stream
+from .frames import composite_frame, depth_frame, frame, frameset, stream_profile, video_frame, video_stream_profile
+from .processing import align, decimation_filter, disparity_transform, filter, hdr_merge, spatial_filter, temporal_filter, threshold_filter
+from .sources import RecordingSource, SyntheticSource, VirtualCamera
+from .structs import extrinsics, intrinsics, rs2_deproject_pixel_to_point, rs2_project_point_to_pixel, rs2_transform_point_to_point
+
+# The pyrealsense2 names the emulator provides
+__all__ = [
+    "RecordingSource", "SyntheticSource", "VirtualCamera", "install", "uninstall",
+    "config", "context", "depth_sensor", "device", "pipeline", "pipeline_profile", "pipeline_wrapper", "rs400_advanced_mode", "sensor",
+    "camera_info", "distortion", "format", "frame_metadata_value", "option", "stream",
+    "composite_frame", "depth_frame", "frame", "frameset", "stream_profile", "video_frame", "video_stream_profile",
+    "align", "decimation_filter", "disparity_transform", "filter", "hdr_merge", "spatial_filter", "temporal_filter", "threshold_filter",
+    "extrinsics", "intrinsics", "rs2_deproject_pixel_to_point", "rs2_project_point_to_pixel", "rs2_transform_point_to_point",
+]
+
+
+def install(cameras, realtime=True):
+    """
+    Connects the virtual cameras and registers the emulator as pyrealsense2
+
+    Parameters:
+    -----------
+    cameras  : list
+               VirtualCamera per emulated device
+    realtime : bool
+               Deliver frames at the frame rate of the streams, False delivers them as fast as they are polled
+    """
+    _device.configure(cameras, realtime)
+    sys.modules["pyrealsense2"] = sys.modules[__name__]
+
+
+def uninstall():
+    _device.configure([])
+    _device.pipeline._started.clear()
+    if sys.modules.get("pyrealsense2") is sys.modules[__name__]:
+        del sys.modules["pyrealsense2"]
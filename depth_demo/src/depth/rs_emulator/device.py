@@ -0,0 +1,279 @@
+import json
+import threading
+import time
+
+import cv2
+
+from .enums import camera_info, format, option, stream
+from .frames import composite_frame, make_frame, video_stream_profile
+from .structs import intrinsics
+
+# Set by install()
+_cameras = []
+_realtime = True
+
+
+def configure(cameras, realtime=True):
+    global _cameras, _realtime
+    serials = [camera.serial for camera in cameras]
+    if len(set(serials)) != len(serials):
+        raise ValueError("the serial numbers of the virtual cameras have to be unique")
+    _cameras = list(cameras)
+    _realtime = realtime
+
+
+def _find_camera(serial):
+    for camera in _cameras:
+        if camera.serial == serial:
+            return camera
+    raise RuntimeError(f"No device connected with serial number {serial}")
+
+
+class sensor:
+    def __init__(self, depth_scale):
+        self._options = {option.emitter_enabled: 1.0, option.laser_power: 150.0, option.depth_units: depth_scale}
+
+    def supports(self, opt):
+        return opt in self._options
+
+    def get_supported_options(self):
+        return list(self._options)
+
+    def get_option(self, opt):
+        return self._options[opt]
+
+    def set_option(self, opt, value):
+        if opt not in self._options:
+            raise RuntimeError(f"object doesn't support option #{int(opt)}")
+        self._options[opt] = float(value)
+
+
+class depth_sensor(sensor):
+    def get_depth_scale(self):
+        return self._options[option.depth_units]
+
+
+class device:
+    def __init__(self, camera):
+        self._camera = camera
+        self._depth_sensor = depth_sensor(camera.source.depth_scale)
+
+    def get_info(self, info):
+        return {
+            camera_info.name: self._camera.name,
+            camera_info.serial_number: self._camera.serial,
+            camera_info.product_line: self._camera.product_line,
+            camera_info.firmware_version: "5.16.0.1",
+        }[info]
+
+    def supports(self, info):
+        return info in (camera_info.name, camera_info.serial_number, camera_info.product_line, camera_info.firmware_version)
+
+    def first_depth_sensor(self):
+        return self._depth_sensor
+
+    def query_sensors(self):
+        return [self._depth_sensor]
+
+    @property
+    def sensors(self):
+        return self.query_sensors()
+
+    def hardware_reset(self):
+        pass
+
+
+class rs400_advanced_mode:
+    def __init__(self, dev):
+        self._device = dev
+
+    def is_enabled(self):
+        return True
+
+    def toggle_advanced_mode(self, enable):
+        pass
+
+    def load_json(self, json_content):
+        # Checked, but the presets do not change the emulated data
+        json.loads(json_content)
+
+
+class context:
+    def __init__(self):
+        self._devices = [device(camera) for camera in _cameras]
+
+    @property
+    def devices(self):
+        return self._devices
+
+    def query_devices(self):
+        return self._devices
+
+
+class config:
+    def __init__(self):
+        self._streams = {}
+        self._serial = None
+
+    def enable_stream(self, stream_type, *args):
+        """
+        (stream_type, [index,] [width, height, format, framerate]) like rs.config.enable_stream
+        """
+        index = args[0] if len(args) in (1, 5) else -1
+        if len(args) >= 4:
+            width, height, stream_format, framerate = args[-4:]
+        else:
+            width, height, stream_format, framerate = 0, 0, format.any, 0
+        if index == -1:
+            index = 1 if stream_type == stream.infrared else 0
+        self._streams[(stream_type, index)] = (width, height, stream_format, framerate)
+
+    def disable_stream(self, stream_type, index=-1):
+        for key in [key for key in self._streams if key[0] == stream_type and index in (-1, key[1])]:
+            del self._streams[key]
+
+    def disable_all_streams(self):
+        self._streams = {}
+
+    def enable_device(self, serial):
+        self._serial = serial
+
+    def can_resolve(self, pipeline_wrapper):
+        return bool(_cameras)
+
+    def resolve(self, pipeline_wrapper):
+        camera = _find_camera(self._serial) if self._serial is not None else pipeline_wrapper.pipeline._free_camera()
+        return pipeline_profile(camera, self._streams)
+
+
+class pipeline_profile:
+    def __init__(self, camera, streams):
+        self._camera = camera
+        self._device = device(camera)
+        if not streams:
+            streams = {(stream.depth, 0): (0, 0, format.z16, 0), (stream.color, 0): (0, 0, format.bgr8, 0)}
+
+        self._profiles = []
+        for ((stream_type, index), (width, height, stream_format, framerate)) in streams.items():
+            width, height, framerate = width or camera.width, height or camera.height, framerate or camera.fps
+            if stream_format == format.any:
+                stream_format = {stream.depth: format.z16, stream.color: format.bgr8, stream.infrared: format.y8}[stream_type]
+            intrin = intrinsics()
+            source_intrinsics = camera.source.intrinsics(camera, width, height)
+            intrin.width, intrin.height = width, height
+            intrin.ppx, intrin.ppy, intrin.fx, intrin.fy = source_intrinsics.ppx, source_intrinsics.ppy, source_intrinsics.fx, source_intrinsics.fy
+            self._profiles.append(video_stream_profile(stream_type, index, stream_format, framerate, intrin))
+
+    def get_device(self):
+        return self._device
+
+    def get_streams(self):
+        return list(self._profiles)
+
+    def get_stream(self, stream_type, index=-1):
+        for profile in self._profiles:
+            if profile.stream_type() == stream_type and index in (-1, profile.stream_index()):
+                return profile
+        raise RuntimeError(f"Profile does not contain the requested stream {stream_type}")
+
+
+class pipeline_wrapper:
+    def __init__(self, pipe):
+        self.pipeline = pipe
+
+
+class pipeline:
+    """
+    Delivers the frames of one virtual camera. In real time mode a new frameset is due every
+    1/fps seconds since start() and frames which were not fetched in time are skipped, like on
+    a device. Otherwise every poll delivers the next frameset at once, for throughput tests.
+    """
+
+    _started = set()
+    _started_lock = threading.Lock()
+
+    def __init__(self, ctx=None):
+        self._profile = None
+        self._delivered = 0
+
+    def _free_camera(self):
+        for camera in _cameras:
+            if camera.serial not in pipeline._started:
+                return camera
+        raise RuntimeError("No device connected")
+
+    def start(self, cfg=None):
+        if self._profile is not None:
+            raise RuntimeError("start() cannot be called before stop()")
+        cfg = cfg if cfg is not None else config()
+        with pipeline._started_lock:
+            profile = cfg.resolve(pipeline_wrapper(self))
+            pipeline._started.add(profile._camera.serial)
+        self._profile = profile
+        self._camera = profile._camera
+        self._fps = max(profile_.fps() for profile_ in profile.get_streams())
+        self._started_at = time.perf_counter()
+        self._delivered = 0
+        return profile
+
+    def stop(self):
+        if self._profile is None:
+            raise RuntimeError("stop() cannot be called before start()")
+        with pipeline._started_lock:
+            pipeline._started.discard(self._camera.serial)
+        self._profile = None
+
+    def get_active_profile(self):
+        return self._profile
+
+    def _due(self):
+        if not _realtime:
+            return self._delivered + 1
+        return int((time.perf_counter() - self._started_at) * self._fps) + 1
+
+    def _capture(self, frame_number):
+        self._delivered = frame_number
+        streams = self._profile.get_streams()
+        width, height = streams[0].width(), streams[0].height()
+        depth, color = self._camera.source.render(self._camera, width, height, frame_number)
+        timestamp = self._started_at * 1000 + frame_number * 1000 / self._fps
+        units = self._camera.source.depth_scale
+
+        frames = []
+        for profile in streams:
+            if profile.stream_type() == stream.depth:
+                data = depth
+            elif profile.stream_type() == stream.infrared:
+                data = cv2.cvtColor(color, cv2.COLOR_BGR2GRAY)
+            elif profile.format() == format.rgb8:
+                data = cv2.cvtColor(color, cv2.COLOR_BGR2RGB)
+            else:
+                # A copy, the capture loop draws into its colour frame
+                data = color.copy()
+            frames.append(make_frame(profile, data, frame_number, timestamp, units))
+        return composite_frame(frames, frame_number, timestamp)
+
+    def poll_for_frames(self):
+        if self._profile is None:
+            raise RuntimeError("poll_for_frames() cannot be called before start()")
+        due = self._due()
+        if due <= self._delivered:
+            return composite_frame()
+        return self._capture(due)
+
+    def try_wait_for_frames(self, timeout_ms=5000):
+        deadline = time.perf_counter() + timeout_ms / 1000
+        while True:
+            frames = self.poll_for_frames()
+            if frames:
+                return True, frames
+            wait = self._started_at + self._delivered / self._fps - time.perf_counter()
+            if time.perf_counter() + max(wait, 0) > deadline:
+                return False, composite_frame()
+            time.sleep(max(wait, 0.0005))
+
+    def wait_for_frames(self, timeout_ms=5000):
+        success, frames = self.try_wait_for_frames(timeout_ms)
+        if not success:
+            raise RuntimeError(f"Frame didn't arrive within {timeout_ms}")
+        return frames
@@ -0,0 +1,77 @@
+import enum
+
+
+class _Enum(enum.Enum):
+    # Printed like the pybind11 enums of pyrealsense2, e.g. "stream.depth"
+    def __str__(self):
+        return f"{type(self).__name__}.{self.name}"
+
+    def __int__(self):
+        return self.value
+
+
+class stream(_Enum):
+    any = 0
+    depth = 1
+    color = 2
+    infrared = 3
+
+
+class format(_Enum):
+    any = 0
+    z16 = 1
+    disparity16 = 2
+    xyz32f = 3
+    yuyv = 4
+    rgb8 = 5
+    bgr8 = 6
+    rgba8 = 7
+    bgra8 = 8
+    y8 = 9
+    y16 = 10
+
+
+class distortion(_Enum):
+    none = 0
+    modified_brown_conrady = 1
+    inverse_brown_conrady = 2
+    ftheta = 3
+    brown_conrady = 4
+    kannala_brandt4 = 5
+
+
+class camera_info(_Enum):
+    name = 0
+    serial_number = 1
+    firmware_version = 2
+    recommended_firmware_version = 3
+    physical_port = 4
+    debug_op_code = 5
+    advanced_mode = 6
+    product_id = 7
+    camera_locked = 8
+    usb_type_descriptor = 9
+    product_line = 10
+
+
+class option(_Enum):
+    exposure = 3
+    gain = 4
+    laser_power = 13
+    filter_magnitude = 18
+    depth_units = 26
+    emitter_enabled = 36
+    filter_smooth_alpha = 42
+    filter_smooth_delta = 43
+    holes_fill = 44
+    min_distance = 58
+    max_distance = 59
+
+
+class frame_metadata_value(_Enum):
+    frame_counter = 0
+    frame_timestamp = 1
+    sensor_timestamp = 2
+    actual_exposure = 3
+    gain_level = 4
+    auto_exposure = 5
@@ -0,0 +1,193 @@
+import numpy as np
+
+from .enums import frame_metadata_value, stream
+from .structs import extrinsics
+
+
+class stream_profile:
+    def __init__(self, stream_type, index, stream_format, framerate):
+        self._stream_type = stream_type
+        self._index = index
+        self._format = stream_format
+        self._fps = framerate
+
+    def stream_type(self):
+        return self._stream_type
+
+    def stream_index(self):
+        return self._index
+
+    def stream_name(self):
+        name = self._stream_type.name.capitalize()
+        return f"{name} {self._index}" if self._stream_type == stream.infrared else name
+
+    def format(self):
+        return self._format
+
+    def fps(self):
+        return self._fps
+
+    def is_video_stream_profile(self):
+        return isinstance(self, video_stream_profile)
+
+    def as_video_stream_profile(self):
+        return self
+
+    def get_extrinsics_to(self, to):
+        # All streams of an emulated camera share one viewpoint
+        return extrinsics()
+
+
+class video_stream_profile(stream_profile):
+    def __init__(self, stream_type, index, stream_format, framerate, intrin):
+        super().__init__(stream_type, index, stream_format, framerate)
+        self._intrinsics = intrin
+
+    def width(self):
+        return self._intrinsics.width
+
+    def height(self):
+        return self._intrinsics.height
+
+    def get_intrinsics(self):
+        return self._intrinsics
+
+
+class frame:
+    def __init__(self, data, profile, frame_number, timestamp, metadata=None):
+        self._data = data
+        self._profile = profile
+        self._frame_number = frame_number
+        self._timestamp = timestamp
+        self._metadata = metadata or {}
+
+    def __bool__(self):
+        return self._data is not None
+
+    def get_data(self):
+        return self._data
+
+    def get_profile(self):
+        return self._profile
+
+    def get_frame_number(self):
+        return self._frame_number
+
+    def get_timestamp(self):
+        return self._timestamp
+
+    def supports_frame_metadata(self, value):
+        return value in self._metadata
+
+    def get_frame_metadata(self, value):
+        return self._metadata[value]
+
+    def is_depth_frame(self):
+        return isinstance(self, depth_frame)
+
+    def is_video_frame(self):
+        return isinstance(self, video_frame)
+
+    def is_frameset(self):
+        return isinstance(self, composite_frame)
+
+    def as_depth_frame(self):
+        return self
+
+    def as_video_frame(self):
+        return self
+
+    def as_frameset(self):
+        return self
+
+
+class video_frame(frame):
+    def get_width(self):
+        return self._data.shape[1]
+
+    def get_height(self):
+        return self._data.shape[0]
+
+    def get_bytes_per_pixel(self):
+        return self._data.itemsize * (self._data.shape[2] if self._data.ndim == 3 else 1)
+
+    def get_stride_in_bytes(self):
+        return self._data.strides[0]
+
+
+class depth_frame(video_frame):
+    def __init__(self, data, profile, frame_number, timestamp, metadata=None, units=0.001):
+        super().__init__(data, profile, frame_number, timestamp, metadata)
+        self._units = units
+
+    def get_units(self):
+        return self._units
+
+    def get_distance(self, x, y):
+        return float(self._data[y, x]) * self._units
+
+    def _with_data(self, data):
+        return depth_frame(data, self._profile, self._frame_number, self._timestamp, self._metadata, self._units)
+
+
+class composite_frame(frame):
+    """
+    The frames of all enabled streams of one capture, empty when polled before the next capture
+    """
+
+    def __init__(self, frames=(), frame_number=0, timestamp=0.0):
+        super().__init__(None, None, frame_number, timestamp)
+        self._frames = list(frames)
+
+    def __bool__(self):
+        return bool(self._frames)
+
+    def __len__(self):
+        return len(self._frames)
+
+    def __iter__(self):
+        return iter(self._frames)
+
+    def __getitem__(self, index):
+        return self._frames[index]
+
+    def size(self):
+        return len(self._frames)
+
+    def first_or_default(self, stream_type, stream_format=None):
+        for item in self._frames:
+            if item.get_profile().stream_type() == stream_type:
+                return item
+        return frame(None, None, 0, 0.0)
+
+    def first(self, stream_type, stream_format=None):
+        item = self.first_or_default(stream_type)
+        if not item:
+            raise RuntimeError(f"Frame of requested stream type {stream_type} was not found!")
+        return item
+
+    def get_depth_frame(self):
+        return self.first_or_default(stream.depth)
+
+    def get_color_frame(self):
+        return self.first_or_default(stream.color)
+
+    def get_infrared_frame(self, index=0):
+        for item in self._frames:
+            profile = item.get_profile()
+            if profile.stream_type() == stream.infrared and index in (0, profile.stream_index()):
+                return item
+        return frame(None, None, 0, 0.0)
+
+
+frameset = composite_frame
+
+# Settled auto exposure, see warmup.py
+DEFAULT_METADATA = {frame_metadata_value.actual_exposure: 8500.0, frame_metadata_value.gain_level: 16.0}
+
+
+def make_frame(profile, data, frame_number, timestamp, units):
+    metadata = {**DEFAULT_METADATA, frame_metadata_value.frame_counter: frame_number}
+    if profile.stream_type() == stream.depth:
+        return depth_frame(np.ascontiguousarray(data), profile, frame_number, timestamp, metadata, units)
+    return video_frame(np.ascontiguousarray(data), profile, frame_number, timestamp, metadata)
@@ -0,0 +1,90 @@
+"""
+Post-processing blocks. The emulated depth already carries its noise model, so the smoothing
+filters pass the frames through unchanged, only the decimation and the threshold filter act.
+"""
+
+import numpy as np
+
+from .enums import option
+from .frames import composite_frame
+
+
+class filter:
+    OPTIONS = {}
+
+    def __init__(self, *args):
+        self._options = dict(self.OPTIONS)
+
+    def get_supported_options(self):
+        return list(self._options)
+
+    def supports(self, opt):
+        return opt in self._options
+
+    def get_option(self, opt):
+        return self._options[opt]
+
+    def set_option(self, opt, value):
+        if opt not in self._options:
+            raise RuntimeError(f"object doesn't support option #{int(opt)}")
+        self._options[opt] = float(value)
+
+    def process(self, frame):
+        return frame
+
+
+class decimation_filter(filter):
+    OPTIONS = {option.filter_magnitude: 2.0}
+
+    def process(self, frame):
+        magnitude = int(self._options[option.filter_magnitude])
+        if magnitude < 2 or not frame.is_depth_frame():
+            return frame
+        # Sub-sampling instead of the median of every block, the profile keeps the full resolution
+        return frame._with_data(np.ascontiguousarray(frame.get_data()[::magnitude, ::magnitude]))
+
+
+class threshold_filter(filter):
+    OPTIONS = {option.min_distance: 0.1, option.max_distance: 4.0}
+
+    def __init__(self, min_dist=0.1, max_dist=4.0):
+        super().__init__()
+        self._options[option.min_distance] = min_dist
+        self._options[option.max_distance] = max_dist
+
+    def process(self, frame):
+        if not frame.is_depth_frame():
+            return frame
+        depth = frame.get_data()
+        units = frame.get_units()
+        outside = (depth < self._options[option.min_distance] / units) | (depth > self._options[option.max_distance] / units)
+        return frame._with_data(np.where(outside, 0, depth).astype(depth.dtype))
+
+
+class spatial_filter(filter):
+    OPTIONS = {option.filter_magnitude: 2.0, option.filter_smooth_alpha: 0.5, option.filter_smooth_delta: 20.0, option.holes_fill: 0.0}
+
+
+class temporal_filter(filter):
+    OPTIONS = {option.filter_smooth_alpha: 0.4, option.filter_smooth_delta: 20.0}
+
+
+class hdr_merge(filter):
+    pass
+
+
+class disparity_transform(filter):
+    pass
+
+
+class align(filter):
+    """
+    All streams of an emulated camera are rendered from one viewpoint, they are aligned already
+    """
+
+    def __init__(self, align_to=None):
+        super().__init__()
+        self.align_to = align_to
+
+    def process(self, frames):
+        return composite_frame(list(frames), frames.get_frame_number(), frames.get_timestamp())
@@ -0,0 +1,119 @@
+import threading
+import typing
+import zlib
+
+import numpy as np
+
+from depth_codec import DepthIntrinsics
+from recorder import Recording
+from synthetic_scene import SensorModel, SyntheticScene
+
+
+class VirtualCamera(typing.NamedTuple):
+    serial: str
+    source: typing.Any
+    # Resolution and frame rate of streams enabled without them
+    width: int = 848
+    height: int = 480
+    fps: int = 30
+    # Position on the table plane in metres and rotation around the optical axis in degrees,
+    # the emulated cameras look straight down
+    x: float = 0.0
+    y: float = 0.0
+    yaw: float = 0.0
+    # Horizontal field of view in degrees, shared by all streams
+    hfov: float = 69.0
+    name: str = "Intel RealSense D435"
+    product_line: str = "D400"
+
+
+class SyntheticSource:
+    """
+    Boxes (and a calibration chessboard) on a table, rendered with synthetic_scene.py for every
+    camera from its own position. Only the first bank_size frames of every camera and resolution
+    are rendered, after that they repeat, so the emulator costs next to nothing per frame.
+    """
+
+    def __init__(self, boxes=(), chessboard=None, table_distance=0.730, sensor=SensorModel(), depth_scale=0.001, bank_size=16, seed=0):
+        self.table_distance = table_distance
+        self.sensor = sensor
+        self.depth_scale = depth_scale
+        self.bank_size = bank_size
+        self.seed = seed
+        self._lock = threading.Lock()
+        self._scenes = {}
+        self.set_scene(boxes, chessboard)
+
+    def set_scene(self, boxes=(), chessboard=None):
+        """
+        Replaces what lies on the table, boxes and chessboard in table coordinates
+        """
+        with self._lock:
+            self.boxes = list(boxes)
+            self.chessboard = chessboard
+            self._banks = {}
+
+    def intrinsics(self, camera, width, height):
+        fx = width / 2 / np.tan(np.radians(camera.hfov) / 2)
+        return DepthIntrinsics(width, height, width / 2, height / 2, fx, fx, 0, (0.0,) * 5)
+
+    def _to_camera(self, camera, item):
+        yaw = np.radians(camera.yaw)
+        x, y = item.x - camera.x, item.y - camera.y
+        return item._replace(x=np.cos(yaw) * x + np.sin(yaw) * y, y=-np.sin(yaw) * x + np.cos(yaw) * y, yaw=item.yaw - camera.yaw)
+
+    def render(self, camera, width, height, frame_number):
+        """
+        Return:
+        ----------
+        depth : array
+                uint16 depth in units of depth_scale
+        color : array
+                BGR colour, the infrared image is its grey scale
+        """
+        key = (camera.serial, width, height)
+        with self._lock:
+            bank = self._banks.setdefault(key, {})
+            slot = frame_number % self.bank_size
+            if slot not in bank:
+                scene = self._scenes.get(key)
+                if scene is None:
+                    scene = self._scenes[key] = SyntheticScene(self.intrinsics(camera, width, height), self.table_distance, self.depth_scale, self.sensor)
+                boxes = [self._to_camera(camera, box) for box in self.boxes]
+                chessboard = self._to_camera(camera, self.chessboard) if self.chessboard is not None else None
+                # crc32, not hash(): string hashes change with every process
+                rng = np.random.default_rng((self.seed, slot, zlib.crc32(camera.serial.encode())))
+                frame = scene.render(boxes, rng, chessboard)
+                bank[slot] = (frame.depth, frame.color)
+            return bank[slot]
+
+
+class RecordingSource:
+    """
+    Replays a recording of the capture loop (see recorder.py) in a loop. The recorded ROI is
+    the whole image of the virtual camera, the resolution has to match it.
+    """
+
+    def __init__(self, path):
+        self.recording = Recording(path)
+        if not len(self.recording):
+            raise ValueError(f"{path} does not hold any frames")
+        self.depth_scale = self.recording.meta.get("depth_scale", 0.001)
+        self.height, self.width = self.recording.meta["depth_shape"]
+        self._lock = threading.Lock()
+
+    def intrinsics(self, camera, width, height):
+        if (width, height) != (self.width, self.height):
+            raise RuntimeError(f"the recording holds {self.width}x{self.height} frames, not {width}x{height}")
+        recorded = self.recording.meta.get("intrinsics")
+        if recorded is None:
+            fx = width / 2 / np.tan(np.radians(camera.hfov) / 2)
+            return DepthIntrinsics(width, height, width / 2, height / 2, fx, fx, 0, (0.0,) * 5)
+        roi_x, roi_y = self.recording.meta.get("roi", (0, 0))[:2]
+        # The intrinsics were recorded for the full frame, the ROI is shifted to the origin
+        return DepthIntrinsics(width, height, recorded["ppx"] - roi_x, recorded["ppy"] - roi_y, recorded["fx"], recorded["fy"], 0, (0.0,) * 5)
+
+    def render(self, camera, width, height, frame_number):
+        with self._lock:
+            frame = self.recording[(frame_number - 1) % len(self.recording)]
+        return frame.depth, frame.color
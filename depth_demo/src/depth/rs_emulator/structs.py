@@ -0,0 +1,46 @@
+from .enums import distortion
+
+
+class intrinsics:
+    def __init__(self):
+        self.width = 0
+        self.height = 0
+        self.ppx = 0.0
+        self.ppy = 0.0
+        self.fx = 0.0
+        self.fy = 0.0
+        self.model = distortion.none
+        self.coeffs = [0.0] * 5
+
+    def __repr__(self):
+        return f"[ {self.width}x{self.height}  p[{self.ppx} {self.ppy}]  f[{self.fx} {self.fy}]  {self.model.name}  {self.coeffs} ]"
+
+
+class extrinsics:
+    def __init__(self):
+        # Column major 3x3 rotation, like librealsense
+        self.rotation = [1.0, 0.0, 0.0, 0.0, 1.0, 0.0, 0.0, 0.0, 1.0]
+        self.translation = [0.0, 0.0, 0.0]
+
+    def __repr__(self):
+        return f"rotation: {self.rotation}\ntranslation: {self.translation}"
+
+
+def rs2_transform_point_to_point(extrin, from_point):
+    r, t = extrin.rotation, extrin.translation
+    x, y, z = from_point
+    return [r[0] * x + r[3] * y + r[6] * z + t[0], r[1] * x + r[4] * y + r[7] * z + t[1], r[2] * x + r[5] * y + r[8] * z + t[2]]
+
+
+def rs2_project_point_to_pixel(intrin, point):
+    """
+    Pinhole projection, the emulated cameras have no distortion
+    """
+    x, y, z = point
+    return [x / z * intrin.fx + intrin.ppx, y / z * intrin.fy + intrin.ppy]
+
+
+def rs2_deproject_pixel_to_point(intrin, pixel, depth):
+    x = (pixel[0] - intrin.ppx) / intrin.fx
+    y = (pixel[1] - intrin.ppy) / intrin.fy
+    return [depth * x, depth * y, depth]
@@ -0,0 +1,266 @@
+"""
+Soak test and throughput benchmark of the capture and measurement loops on emulated cameras
+(see rs_emulator), no RealSense device needed.
+
+Usage: python soak_multicam.py [--mode multicam] [--cameras 2] [--width 1280] [--height 720] [--fps 15]
+                               [--duration 60] [--report-interval 10] [--max-throughput] [--recording DIR]
+
+multicam runs the loop of box_dimensioner_multicam_demo.py: the devices are calibrated on a
+chessboard, then a box is put on the table and measured with the point clouds of all cameras.
+single runs the CapturePipeline of main.py on one camera, on synthetic frames or, with
+--recording, replaying a recording made with main.py --record.
+
+The cameras deliver their frames in real time at --fps, --max-throughput delivers them as fast
+as the loop polls them to find its throughput ceiling. Every --report-interval seconds the
+frame rate, the p50/p99 latency of the loop, the resident memory and the last measurement are
+printed.
+"""
+
+import argparse
+import os
+import time
+from collections import defaultdict
+
+import numpy as np
+
+import rs_emulator
+from synthetic_scene import Box, Chessboard
+
+# Chessboard of box_dimensioner_multicam_demo.py
+CHESSBOARD_PARAMS = [9, 6, 0.0253]
+# Measured in the multicam mode, in the chessboard centre
+SOAK_BOX = Box(0.0, 0.0, 0.120, 0.080, 0.070, yaw=20.0)
+
+
+def resident_memory():
+    """
+    Resident set size of this process in bytes, None if it cannot be read
+    """
+    try:
+        import psutil
+        return psutil.Process().memory_info().rss
+    except ImportError:
+        pass
+
+    try:
+        with open("/proc/self/statm") as statm:
+            return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except OSError:
+        return None
+
+
+def virtual_cameras(source, count, width, height, fps, spacing=0.03):
+    """
+    count cameras side by side above the table centre, every one turned a little further
+    """
+    return [rs_emulator.VirtualCamera("%012d" % (index + 1), source, width, height, fps,
+                                      x=spacing * (index - (count - 1) / 2), yaw=10.0 * index)
+            for index in range(count)]
+
+
+class SoakStatistics:
+    def __init__(self):
+        self.started_at = time.perf_counter()
+        self.latencies = []
+        self.interval_started_at = self.started_at
+        self.interval_frames = 0
+        self.peak_memory = 0
+        self.last_measurement = None
+
+    def add(self, latency, measurement):
+        self.latencies.append(latency)
+        self.interval_frames += 1
+        self.last_measurement = measurement
+
+    def report(self, final=False):
+        now = time.perf_counter()
+        memory = resident_memory()
+        self.peak_memory = max(self.peak_memory, memory or 0)
+        if final:
+            latencies, seconds, frames = self.latencies, now - self.started_at, len(self.latencies)
+        else:
+            latencies, seconds, frames = self.latencies[-self.interval_frames:], now - self.interval_started_at, self.interval_frames
+        report = {
+            "elapsed_seconds": round(now - self.started_at, 1),
+            "frames": frames,
+            "fps": round(frames / seconds, 2) if seconds > 0 else 0.0,
+            "latency_p50_ms": round(float(np.percentile(latencies, 50)) * 1000, 2) if latencies else None,
+            "latency_p99_ms": round(float(np.percentile(latencies, 99)) * 1000, 2) if latencies else None,
+            "rss_mb": round(memory / 2**20, 1) if memory is not None else None,
+            "measurement": self.last_measurement,
+        }
+        if final:
+            report["peak_rss_mb"] = round(self.peak_memory / 2**20, 1)
+        self.interval_started_at = now
+        self.interval_frames = 0
+        return report
+
+
+def soak(step, duration, report_interval, frames=None):
+    """
+    Calls step() until duration seconds (or frames calls) passed, step returns the measurement
+
+    Return:
+    ----------
+    report : dict
+             Frame rate, latency and memory over the whole run
+    """
+    statistics = SoakStatistics()
+    next_report = statistics.started_at + report_interval
+    while time.perf_counter() - statistics.started_at < duration and (frames is None or len(statistics.latencies) < frames):
+        start = time.perf_counter()
+        measurement = step()
+        statistics.add(time.perf_counter() - start, measurement)
+        if time.perf_counter() >= next_report:
+            print(statistics.report())
+            next_report += report_interval
+    return statistics.report(final=True)
+
+
+def calibrate(device_manager, intrinsics_devices, frames_per_device=3):
+    """
+    Chessboard calibration of all devices like box_dimensioner_multicam_demo.py, without the cache and the ICP refinement
+
+    Return:
+    ----------
+    transformation_devices : dict
+                             Transformation from the device to the chessboard coordinates per serial number
+    roi_2d                 : list
+                             Bounds of the chessboard on the table, the measured volume
+    """
+    from calibration_kabsch import PoseEstimation
+    from helper_functions import get_boundary_corners_2D
+
+    pose_estimator = PoseEstimation(None, intrinsics_devices, CHESSBOARD_PARAMS, frames_per_device)
+    try:
+        while not pose_estimator.is_ready():
+            pose_estimator.add_frames(device_manager.poll_frames())
+        transformation_result_kabsch = pose_estimator.perform_pose_estimation()
+        object_point = pose_estimator.get_chessboard_corners_in3d()
+    finally:
+        pose_estimator.close()
+
+    transformation_devices = {}
+    chessboard_points_3d = []
+    for (serial, result) in transformation_result_kabsch.items():
+        if not result[0]:
+            raise RuntimeError(f"Calibration of device {serial} failed")
+        transformation_devices[serial] = result[1].inverse()
+        points3D = object_point[serial][2][:, object_point[serial][3]]
+        chessboard_points_3d.append(transformation_devices[serial].apply_transformation(points3D))
+    return transformation_devices, get_boundary_corners_2D(np.column_stack(chessboard_points_3d))
+
+
+def run_multicam(cameras=2, width=1280, height=720, fps=15, duration=60.0, report_interval=10.0, realtime=True, frames=None):
+    """
+    Calibrates the emulated devices on the chessboard and measures SOAK_BOX until duration passed
+
+    Return:
+    ----------
+    report : dict
+             As soak(), with the true box dimensions in millimetres
+    """
+    source = rs_emulator.SyntheticSource(chessboard=Chessboard(0.0, 0.0))
+    rs_emulator.install(virtual_cameras(source, cameras, width, height, fps), realtime)
+
+    # Imported after the emulator was installed, they bind pyrealsense2 on import
+    import pyrealsense2 as rs
+    from measurement_task import calculate_boundingbox_points, calculate_cumulative_pointcloud
+    from realsense_device_manager import DeviceManager
+    from warmup import wait_for_stable_devices
+
+    rs_config = rs.config()
+    rs_config.enable_stream(rs.stream.depth, width, height, rs.format.z16, fps)
+    rs_config.enable_stream(rs.stream.infrared, 1, width, height, rs.format.y8, fps)
+    rs_config.enable_stream(rs.stream.color, width, height, rs.format.bgr8, fps)
+    device_manager = DeviceManager(rs.context(), rs_config)
+    device_manager.enable_all_devices()
+    try:
+        frames_devices, _ = wait_for_stable_devices(device_manager)
+        intrinsics_devices = device_manager.get_device_intrinsics(frames_devices)
+        extrinsics_devices = device_manager.get_depth_to_color_extrinsics(frames_devices)
+        transformation_devices, roi_2d = calibrate(device_manager, intrinsics_devices)
+
+        calibration_info_devices = defaultdict(list)
+        for calibration_info in (transformation_devices, intrinsics_devices, extrinsics_devices):
+            for (key, value) in calibration_info.items():
+                calibration_info_devices[key].append(value)
+
+        source.set_scene([SOAK_BOX])
+
+        def step():
+            frames_devices = device_manager.poll_frames()
+            point_cloud = calculate_cumulative_pointcloud(frames_devices, calibration_info_devices, roi_2d)
+            _, length, width, height = calculate_boundingbox_points(point_cloud, calibration_info_devices)
+            return {"length": round(float(length) * 1000, 1), "width": round(float(width) * 1000, 1), "height": round(float(height) * 1000, 1)}
+
+        report = soak(step, duration, report_interval, frames)
+    finally:
+        device_manager.disable_streams()
+        rs_emulator.uninstall()
+    report["truth"] = {"length": SOAK_BOX.length * 1000, "width": SOAK_BOX.width * 1000, "height": SOAK_BOX.height * 1000}
+    return report
+
+
+def run_single(width=848, height=480, fps=30, duration=60.0, report_interval=10.0, realtime=True, recording=None, frames=None):
+    """
+    Runs the CapturePipeline of main.py on one emulated camera until duration passed
+
+    Return:
+    ----------
+    report : dict
+             As soak()
+    """
+    if recording is not None:
+        source = rs_emulator.RecordingSource(recording)
+        width, height = source.width, source.height
+    else:
+        source = rs_emulator.SyntheticSource([SOAK_BOX])
+    rs_emulator.install(virtual_cameras(source, 1, width, height, fps), realtime)
+
+    from capture_pipeline import CapturePipeline
+
+    # The emulated table is level, a ground calibration of the real camera does not apply to it
+    if recording is not None:
+        # The recorded frames are the ROI of the recording camera
+        capture = CapturePipeline(roi=(0, 0, width, height), width=width, height=height, fps=fps, verbose=False, ground_calibration=None)
+    else:
+        capture = CapturePipeline(width=width, height=height, fps=fps, verbose=False, ground_calibration=None)
+    capture.start()
+    try:
+        def step():
+            result = capture.process_next()
+            return result.measurement if result is not None else None
+
+        return soak(step, duration, report_interval, frames)
+    finally:
+        capture.stop()
+        rs_emulator.uninstall()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Soak test of the measurement loops on emulated RealSense cameras")
+    parser.add_argument("--mode", choices=("multicam", "single"), default="multicam")
+    parser.add_argument("--cameras", type=int, default=2, help="number of emulated cameras in the multicam mode")
+    parser.add_argument("--width", type=int, help="stream width, 1280 for multicam and 848 for single by default")
+    parser.add_argument("--height", type=int, help="stream height, 720 for multicam and 480 for single by default")
+    parser.add_argument("--fps", type=int, help="stream frame rate, 15 for multicam and 30 for single by default")
+    parser.add_argument("--duration", type=float, default=60.0, help="seconds to run")
+    parser.add_argument("--report-interval", type=float, default=10.0, help="seconds between reports")
+    parser.add_argument("--max-throughput", action="store_true", help="deliver frames as fast as they are polled instead of at --fps")
+    parser.add_argument("--recording", help="single mode: replay this recording instead of synthetic frames")
+    args = parser.parse_args()
+
+    if args.mode == "multicam":
+        if args.recording is not None:
+            parser.error("--recording needs --mode single, the multicam mode calibrates on a synthetic chessboard")
+        report = run_multicam(args.cameras, args.width or 1280, args.height or 720, args.fps or 15,
+                              args.duration, args.report_interval, not args.max_throughput)
+    else:
+        report = run_single(args.width or 848, args.height or 480, args.fps or 30,
+                            args.duration, args.report_interval, not args.max_throughput, args.recording)
+    print("Total:", report)
+
+
+if __name__ == "__main__":
+    main()
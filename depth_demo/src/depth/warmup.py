@@ -0,0 +1,140 @@
+import collections
+import time
+
+import numpy as np
+import pyrealsense2 as rs
+
+
+class WarmupDetector:
+    """
+    Decides when a freshly started stream has settled, instead of discarding a fixed number of
+    frames. The stream is ready once, over the last `window` frames, the auto exposure and gain
+    reported in the frame metadata and the fraction of valid depth pixels in the ROI have stopped
+    changing. Signals a device does not report (e.g. metadata disabled in the driver) are left
+    out. After `timeout` seconds the stream is declared ready anyway, flagged as timed out.
+    """
+
+    def __init__(self, roi=None, window=5, exposure_tolerance=0.05, gain_tolerance=0.05, fill_rate_tolerance=0.02, timeout=10.0):
+        """
+        Parameters:
+        -----------
+        roi                 : tuple
+                              (start_x, start_y, end_x, end_y) in which the depth fill rate is measured, the whole image by default
+        window              : int
+                              Number of consecutive frames which have to agree
+        exposure_tolerance  : double
+                              Allowed relative spread of the exposure within the window
+        gain_tolerance      : double
+                              Allowed relative spread of the gain within the window
+        fill_rate_tolerance : double
+                              Allowed absolute spread of the depth fill rate within the window
+        timeout             : double
+                              Seconds after which the stream is declared ready regardless
+        """
+        self.roi = roi
+        self.window = window
+        self.tolerances = {
+            "depth_exposure": exposure_tolerance,
+            "depth_gain": gain_tolerance,
+            "color_exposure": exposure_tolerance,
+            "color_gain": gain_tolerance,
+        }
+        self.fill_rate_tolerance = fill_rate_tolerance
+        self.timeout = timeout
+        self.history = collections.defaultdict(lambda: collections.deque(maxlen=window))
+        self.started_at = time.perf_counter()
+        self.frames = 0
+        self.ready_after = None
+        self.timed_out = False
+
+    @staticmethod
+    def _metadata(frame, value):
+        if frame and frame.supports_frame_metadata(value):
+            return float(frame.get_frame_metadata(value))
+        return None
+
+    def _fill_rate(self, depth_frame):
+        depth_image = np.asanyarray(depth_frame.get_data())
+        if self.roi is not None:
+            start_x, start_y, end_x, end_y = self.roi
+            depth_image = depth_image[start_y:end_y, start_x:end_x]
+        return float(np.count_nonzero(depth_image) / depth_image.size)
+
+    def _is_stable(self):
+        if self.frames < self.window:
+            return False
+        for (name, values) in self.history.items():
+            spread = max(values) - min(values)
+            if name == "fill_rate":
+                if spread > self.fill_rate_tolerance:
+                    return False
+            elif spread > self.tolerances[name] * max(abs(max(values)), 1e-9):
+                return False
+        return True
+
+    def update(self, depth_frame, color_frame=None):
+        """
+        Adds the next frames of the stream
+
+        Return:
+        ----------
+        ready : bool
+                True once the stream settled or the timeout passed
+        """
+        if self.ready_after is not None:
+            return True
+
+        self.frames += 1
+        signals = {
+            "depth_exposure": self._metadata(depth_frame, rs.frame_metadata_value.actual_exposure),
+            "depth_gain": self._metadata(depth_frame, rs.frame_metadata_value.gain_level),
+            "color_exposure": self._metadata(color_frame, rs.frame_metadata_value.actual_exposure),
+            "color_gain": self._metadata(color_frame, rs.frame_metadata_value.gain_level),
+            "fill_rate": self._fill_rate(depth_frame) if depth_frame else None,
+        }
+        for (name, value) in signals.items():
+            if value is not None:
+                self.history[name].append(value)
+
+        elapsed = time.perf_counter() - self.started_at
+        if self._is_stable() or elapsed >= self.timeout:
+            self.ready_after = elapsed
+            self.timed_out = not self._is_stable()
+        return self.ready_after is not None
+
+    def is_ready(self):
+        return self.ready_after is not None
+
+    def report(self):
+        return {
+            "frames": self.frames,
+            "seconds": round(self.ready_after if self.ready_after is not None else time.perf_counter() - self.started_at, 3),
+            "timed_out": self.timed_out,
+            "signals": {name: round(values[-1], 4) for (name, values) in self.history.items()},
+        }
+
+
+def wait_for_stable_devices(device_manager, timeout=10.0, window=5):
+    """
+    Polls the devices of a DeviceManager until the streams of all of them settled
+
+    Return:
+    ----------
+    frames  : dict
+              The last frames as returned by DeviceManager.poll_frames()
+    reports : dict
+              WarmupDetector.report() per serial number
+    """
+    detectors = {}
+    while True:
+        frames = device_manager.poll_frames()
+        for (device_info, frameset) in frames.items():
+            detector = detectors.setdefault(device_info[0], WarmupDetector(window=window, timeout=timeout))
+            detector.update(frameset.get(rs.stream.depth), frameset.get(rs.stream.color))
+        if detectors and all(detector.is_ready() for detector in detectors.values()):
+            break
+
+    reports = {serial: detector.report() for (serial, detector) in detectors.items()}
+    for (serial, report) in reports.items():
+        print(f"Device {serial} settled after {report['frames']} frames / {report['seconds']}s" + (" (timed out)" if report["timed_out"] else ""))
+    return frames, reports
@@ -0,0 +1,328 @@
+"""
+Load test of the API: starts uvicorn with main:app against a Valkey stand-in, publishes
+synthetic frames and measurements like the capture loop, and drives concurrent MJPEG stream,
+/dimension poll and /dimension long-poll clients.
+
+By default an in-memory fakeredis server is started on a free port (pip install -e .[loadtest]),
+--valkey-host/--valkey-port use a running Valkey instead. Every run appends one JSON line with
+the commit, the parameters and the results to --output, so runs can be compared across commits.
+
+Usage: python loadtest.py [--streams 10] [--pollers 20] [--long-pollers 20] [--duration 20]
+"""
+
+import argparse
+import asyncio
+import dataclasses
+import json
+import os
+import platform
+import socket
+import subprocess
+import sys
+import threading
+import time
+
+import cv2
+import httpx
+import numpy as np
+import valkey
+
+# Appended, src/depth/main.py must not shadow src/main.py
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "depth"))
+from publisher import ValkeyPublisher
+
+SRC_DIR = os.path.dirname(os.path.abspath(__file__))
+FRAME_MARKER = b"--frame\r\n"
+
+
+@dataclasses.dataclass
+class ClientStats:
+    latencies: list[float] = dataclasses.field(default_factory=list)
+    statuses: dict[int, int] = dataclasses.field(default_factory=dict)
+    errors: int = 0
+    frames: int = 0
+    bytes: int = 0
+    missed: int = 0
+
+
+class Window:
+    """
+    Measurement window, everything before start (warm-up) and after end is not counted
+    """
+
+    def __init__(self):
+        self.start: float = float("inf")
+        self.end: float = float("inf")
+
+    def active(self) -> bool:
+        return self.start <= time.perf_counter() < self.end
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def process_cpu_seconds(pid: int) -> float | None:
+    try:
+        import psutil
+        cpu_times = psutil.Process(pid).cpu_times()
+        return cpu_times.user + cpu_times.system
+    except ImportError:
+        pass
+
+    try:
+        with open(f"/proc/{pid}/stat") as stat:
+            fields = stat.read().rsplit(")", 1)[1].split()
+        return (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+    except OSError:
+        return None
+
+
+def git_commit() -> str | None:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=SRC_DIR, capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def synthetic_frame() -> bytes:
+    # Deterministic 848x480 image with some texture, so the JPEG size is close to a real overlay
+    rng = np.random.default_rng(0)
+    gradient = np.linspace(0, 255, 848, dtype=np.float32)[np.newaxis, :, np.newaxis]
+    image = np.clip(gradient + rng.normal(0, 20, size=(480, 848, 3)), 0, 255).astype(np.uint8)
+    cv2.rectangle(image, (300, 150), (550, 350), (0, 255, 0), 3)
+    return_value, encoded_image = cv2.imencode(".jpg", image)
+
+    return encoded_image.tobytes()
+
+
+def run_publisher(valkey_client: valkey.Valkey, fps: float, stop: threading.Event, published: list[float]) -> None:
+    publisher = ValkeyPublisher(valkey_client)
+    frame = synthetic_frame()
+    rng = np.random.default_rng(1)
+    start = time.perf_counter()
+    frame_index = 0
+
+    while not stop.is_set():
+        publisher.publish_frame(frame, {
+            "width": float(300 + rng.normal(0, 1)),
+            "length": float(400 + rng.normal(0, 1)),
+            "height": float(70 + rng.normal(0, 0.5))
+        })
+        published.append(time.perf_counter())
+        frame_index += 1
+        time.sleep(max(0.0, start + frame_index / fps - time.perf_counter()))
+
+
+async def stream_client(client: httpx.AsyncClient, window: Window, stats: ClientStats, query: str) -> None:
+    async with client.stream("GET", "/capture/streaming" + query) as response:
+        tail = b""
+        async for chunk in response.aiter_bytes():
+            data = tail + chunk
+            if window.active():
+                stats.frames += data.count(FRAME_MARKER) - tail.count(FRAME_MARKER)
+                stats.bytes += len(chunk)
+            tail = data[-(len(FRAME_MARKER) - 1):]
+
+
+async def poll_client(client: httpx.AsyncClient, window: Window, stats: ClientStats, interval: float) -> None:
+    etag: str | None = None
+    while True:
+        start = time.perf_counter()
+        try:
+            response = await client.get("/dimension", headers={"If-None-Match": etag} if etag else {})
+            etag = response.headers.get("etag", etag)
+            status = response.status_code
+        except httpx.HTTPError:
+            status = None
+
+        if window.active():
+            stats.latencies.append(time.perf_counter() - start)
+            if status is None:
+                stats.errors += 1
+            else:
+                stats.statuses[status] = stats.statuses.get(status, 0) + 1
+        await asyncio.sleep(max(0.0, start + interval - time.perf_counter()))
+
+
+async def long_poll_client(client: httpx.AsyncClient, window: Window, stats: ClientStats) -> None:
+    seq: int = 0
+    while True:
+        start = time.perf_counter()
+        try:
+            response = await client.get("/dimension", params={"after_seq": seq, "timeout": 5})
+            status = response.status_code
+        except httpx.HTTPError:
+            status = None
+            await asyncio.sleep(0.1)
+
+        if status == 200:
+            new_seq = int(response.headers["etag"].strip('"'))
+            if window.active() and seq:
+                stats.frames += 1
+                stats.missed += max(0, new_seq - seq - 1)
+            seq = new_seq
+
+        if window.active():
+            stats.latencies.append(time.perf_counter() - start)
+            if status is None:
+                stats.errors += 1
+            else:
+                stats.statuses[status] = stats.statuses.get(status, 0) + 1
+
+
+def percentile_ms(values: list[float], q: float) -> float | None:
+    return round(float(np.percentile(values, q)) * 1000, 2) if values else None
+
+
+def summarize_requests(stats: list[ClientStats], duration: float) -> dict:
+    latencies = [latency for client in stats for latency in client.latencies]
+    statuses: dict[int, int] = {}
+    for client in stats:
+        for (status, count) in client.statuses.items():
+            statuses[status] = statuses.get(status, 0) + count
+
+    return {
+        "clients": len(stats),
+        "requests_per_s": round(len(latencies) / duration, 1),
+        "p50_ms": percentile_ms(latencies, 50),
+        "p99_ms": percentile_ms(latencies, 99),
+        "statuses": {str(status): count for (status, count) in sorted(statuses.items())},
+        "errors": sum(client.errors for client in stats)
+    }
+
+
+async def drive(args: argparse.Namespace, base_url: str, server_pid: int) -> dict:
+    window = Window()
+    stream_stats = [ClientStats() for _ in range(args.streams)]
+    poll_stats = [ClientStats() for _ in range(args.pollers)]
+    long_poll_stats = [ClientStats() for _ in range(args.long_pollers)]
+    query = "?" + "&".join(f"{key}={value}" for (key, value) in (("width", args.stream_width), ("fps", args.stream_fps)) if value) if (args.stream_width or args.stream_fps) else ""
+
+    limits = httpx.Limits(max_connections=None, max_keepalive_connections=None)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=httpx.Timeout(30.0)) as client:
+        tasks = [asyncio.create_task(stream_client(client, window, stats, query)) for stats in stream_stats]
+        tasks += [asyncio.create_task(poll_client(client, window, stats, args.poll_interval)) for stats in poll_stats]
+        tasks += [asyncio.create_task(long_poll_client(client, window, stats)) for stats in long_poll_stats]
+
+        await asyncio.sleep(args.warmup)
+        server_cpu_start = process_cpu_seconds(server_pid)
+        driver_cpu_start = time.process_time()
+        window.start = time.perf_counter()
+        window.end = window.start + args.duration
+        await asyncio.sleep(args.duration)
+        server_cpu = process_cpu_seconds(server_pid)
+        driver_cpu = time.process_time() - driver_cpu_start
+
+        for task in tasks:
+            task.cancel()
+        results = await asyncio.gather(*tasks, return_exceptions=True)
+
+    failed = [result for result in results if isinstance(result, Exception) and not isinstance(result, asyncio.CancelledError)]
+    stream_fps = [stats.frames / args.duration for stats in stream_stats]
+    long_poll_updates = sum(stats.frames for stats in long_poll_stats)
+
+    return {
+        "server_cpu_percent": round((server_cpu - server_cpu_start) / args.duration * 100, 1) if server_cpu is not None and server_cpu_start is not None else None,
+        "driver_cpu_percent": round(driver_cpu / args.duration * 100, 1),
+        "failed_clients": len(failed),
+        "stream": {
+            "clients": args.streams,
+            "fps_mean": round(float(np.mean(stream_fps)), 2) if stream_fps else None,
+            "fps_min": round(float(np.min(stream_fps)), 2) if stream_fps else None,
+            "mbit_per_s": round(sum(stats.bytes for stats in stream_stats) * 8 / args.duration / 1e6, 2)
+        },
+        "poll": summarize_requests(poll_stats, args.duration),
+        "long_poll": {
+            **summarize_requests(long_poll_stats, args.duration),
+            "updates_per_s_per_client": round(long_poll_updates / args.duration / max(1, args.long_pollers), 2),
+            "missed_ratio": round(sum(stats.missed for stats in long_poll_stats) / max(1, long_poll_updates + sum(stats.missed for stats in long_poll_stats)), 4)
+        }
+    }
+
+
+def wait_until_ready(base_url: str, server: subprocess.Popen, timeout: float = 30.0) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if server.poll() is not None:
+            raise RuntimeError("the API server exited during start up")
+        try:
+            httpx.get(base_url + "/openapi.json", timeout=1.0).raise_for_status()
+            return
+        except httpx.HTTPError:
+            time.sleep(0.2)
+
+    raise RuntimeError("the API server did not start within %.0f s" % timeout)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test of the API against a Valkey stand-in")
+    parser.add_argument("--valkey-host", help="use this Valkey instead of an in-memory fakeredis server")
+    parser.add_argument("--valkey-port", type=int, default=6379)
+    parser.add_argument("--port", type=int, default=0, help="API port, a free one by default")
+    parser.add_argument("--fps", type=float, default=30.0, help="frames and measurements published per second")
+    parser.add_argument("--streams", type=int, default=10, help="MJPEG /capture/streaming clients")
+    parser.add_argument("--stream-width", type=int, help="width variant requested by the stream clients")
+    parser.add_argument("--stream-fps", type=float, help="fps requested by the stream clients")
+    parser.add_argument("--pollers", type=int, default=20, help="/dimension clients polling with If-None-Match")
+    parser.add_argument("--poll-interval", type=float, default=0.2, help="seconds between the polls of a client")
+    parser.add_argument("--long-pollers", type=int, default=20, help="/dimension?after_seq= clients")
+    parser.add_argument("--warmup", type=float, default=3.0, help="seconds before the measurement starts")
+    parser.add_argument("--duration", type=float, default=20.0, help="seconds measured")
+    parser.add_argument("--output", default="loadtest_results.jsonl", help="JSON lines file the result is appended to")
+    args = parser.parse_args()
+
+    fake_server = None
+    if args.valkey_host is None:
+        import fakeredis
+        args.valkey_host, args.valkey_port = "127.0.0.1", free_port()
+        fake_server = fakeredis.TcpFakeServer((args.valkey_host, args.valkey_port))
+        threading.Thread(target=fake_server.serve_forever, daemon=True).start()
+    backend = "fakeredis" if fake_server is not None else "valkey"
+
+    stop = threading.Event()
+    published: list[float] = []
+    publisher = threading.Thread(target=run_publisher, args=(valkey.Valkey(host=args.valkey_host, port=args.valkey_port), args.fps, stop, published))
+
+    port = args.port or free_port()
+    base_url = f"http://127.0.0.1:{port}"
+    env = dict(os.environ, VALKEY_HOST=args.valkey_host, VALKEY_PORT=str(args.valkey_port))
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(port), "--log-level", "warning"],
+        cwd=SRC_DIR, env=env
+    )
+
+    try:
+        wait_until_ready(base_url, server)
+        publisher.start()
+        results = asyncio.run(drive(args, base_url, server.pid))
+    finally:
+        stop.set()
+        if publisher.is_alive():
+            publisher.join()
+        server.terminate()
+        server.wait()
+        if fake_server is not None:
+            fake_server.shutdown()
+
+    measured = [timestamp for timestamp in published if timestamp >= published[0] + args.warmup] if published else []
+    results["publisher_fps"] = round((len(measured) - 1) / (measured[-1] - measured[0]), 2) if len(measured) > 1 else None
+    record = {
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "commit": git_commit(),
+        "backend": backend,
+        "python": platform.python_version(),
+        "cpu_count": os.cpu_count(),
+        "parameters": {key: value for (key, value) in vars(args).items() if key not in ("valkey_host", "valkey_port", "port", "output")},
+        "results": results
+    }
+
+    print(json.dumps(record, indent=2))
+    with open(args.output, "a") as output:
+        output.write(json.dumps(record) + "\n")
+
+
+if __name__ == "__main__":
+    main()
\ No newline at end of file
@@ -1,12 +1,39 @@
+import contextlib
+
 import fastapi
 import uvicorn
 
 import routers.dimension
 import routers.capture
+import routers.live
+import services.embedded_capture
+import services.frame_broadcaster
+import services.measurement_events
+
+
+@contextlib.asynccontextmanager
+async def lifespan(app: fastapi.FastAPI):
+    if services.embedded_capture.EMBEDDED_CAPTURE:
+        # The capture worker feeds the broadcaster and the measurement holders directly
+        embedded_capture = services.embedded_capture.EmbeddedCapture.get_instance()
+        await embedded_capture.start()
+        yield
+        await embedded_capture.stop()
+        return
+
+    broadcaster = services.frame_broadcaster.FrameBroadcaster.get_instance()
+    measurement_events = services.measurement_events.MeasurementEventHub.get_instance()
+    await broadcaster.start()
+    await measurement_events.start()
+    yield
+    await measurement_events.stop()
+    await broadcaster.stop()
+
 
-app = fastapi.FastAPI()
+app = fastapi.FastAPI(lifespan=lifespan)
 app.include_router(routers.dimension.router)
 app.include_router(routers.capture.router)
+app.include_router(routers.live.router)
 
 if __name__ == "__main__":
     uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
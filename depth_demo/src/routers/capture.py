@@ -1,16 +1,46 @@
 import fastapi
 
+import schemas.capture
 import services.capture
+import services.conditional
+import services.transcode
 
 router = fastapi.APIRouter()
 
-@router.get("/capture")
-async def capture() -> str:
-    return services.capture.CaptureService.get_capture_image()
+@router.get("/capture", responses={404: {"model": schemas.capture.NoCapture}})
+async def capture(
+    request: fastapi.Request,
+    width: int | None = fastapi.Query(None, ge=16, le=4096),
+    quality: int | None = fastapi.Query(None, ge=1, le=100),
+    after_seq: int | None = fastapi.Query(None, ge=0),
+    timeout: float = fastapi.Query(30.0, gt=0, le=60)
+) -> str:
+    variant = services.transcode.Variant(width, quality)
+    frame = await services.capture.CaptureService.get_capture_frame(variant, after_seq, timeout)
+    if frame is None:
+        # Nothing broadcast yet, answer from Valkey directly, variants are only made of broadcast frames
+        image = services.capture.CaptureService.get_capture_image() if variant == services.transcode.Variant() else None
+        if image is None:
+            return fastapi.responses.JSONResponse(schemas.capture.NoCapture().model_dump(), status_code=404)
+        return image
+
+    etag = services.conditional.make_etag(frame.seq, *(["" if part is None else part for part in variant] if variant != services.transcode.Variant() else []))
+    if (after_seq is not None and frame.seq <= after_seq) or services.conditional.is_not_modified(request, etag):
+        return services.conditional.not_modified_response(etag)
+
+    return fastapi.responses.JSONResponse(
+        services.capture.CaptureService.encode_capture_image(frame),
+        headers={"ETag": etag, "Cache-Control": "no-cache"}
+    )
 
 @router.get("/capture/streaming")
-async def capture_streaming(request: fastapi.Request) -> str:
+async def capture_streaming(
+    request: fastapi.Request,
+    width: int | None = fastapi.Query(None, ge=16, le=4096),
+    quality: int | None = fastapi.Query(None, ge=1, le=100),
+    fps: float | None = fastapi.Query(None, gt=0, le=60)
+) -> str:
     return fastapi.responses.StreamingResponse(
-        services.capture.CaptureService.get_capture_streaming(request),
+        services.capture.CaptureService.get_capture_streaming(request, services.transcode.Variant(width, quality), fps),
         media_type="multipart/x-mixed-replace; boundary=frame"
-    )
+    )
\ No newline at end of file
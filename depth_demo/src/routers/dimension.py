@@ -1,9 +1,58 @@
 import fastapi
 
+import schemas.dimension
+import services.conditional
 import services.dimension
+import services.history
+import services.measurement_events
 
 router = fastapi.APIRouter()
 
-@router.get("/dimension")
-async def get_dimension():
-    return services.dimension.DimensionService.get_dimension()
\ No newline at end of file
+@router.get("/dimension", response_model=schemas.dimension.Dimension, responses={404: {"model": schemas.dimension.NoMeasurement}})
+async def get_dimension(
+    request: fastapi.Request,
+    after_seq: int | None = fastapi.Query(None, ge=0),
+    timeout: float = fastapi.Query(30.0, gt=0, le=60)
+):
+    if after_seq is not None:
+        await services.dimension.DimensionService.wait_for_measurement(after_seq, timeout)
+
+    seq, dimension = await services.dimension.DimensionService.get_measurement(after_seq)
+    if dimension is None:
+        return fastapi.responses.JSONResponse(schemas.dimension.NoMeasurement().model_dump(), status_code=404)
+    if seq is None:
+        return dimension
+
+    etag = services.conditional.make_etag(seq)
+    if (after_seq is not None and seq <= after_seq) or services.conditional.is_not_modified(request, etag):
+        return services.conditional.not_modified_response(etag)
+
+    return fastapi.responses.JSONResponse(dimension.model_dump(), headers={"ETag": etag, "Cache-Control": "no-cache"})
+
+@router.get("/dimension/events")
+async def get_dimension_events(
+    request: fastapi.Request,
+    last_event_id: int | None = fastapi.Header(None, ge=0),
+    after_seq: int | None = fastapi.Query(None, ge=0, description="Resume point for clients which cannot set Last-Event-ID")
+):
+    return fastapi.responses.StreamingResponse(
+        services.measurement_events.MeasurementEventService.get_events(request, last_event_id if last_event_id is not None else after_seq),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+# Plain def, FastAPI runs it in the thread pool so long range scans do not block the event loop
+@router.get("/dimension/history")
+def get_dimension_history(
+    start: float | None = fastapi.Query(None, description="Unix time in seconds"),
+    end: float | None = fastapi.Query(None, description="Unix time in seconds"),
+    start_seq: int | None = fastapi.Query(None, ge=0),
+    end_seq: int | None = fastapi.Query(None, ge=0),
+    cursor: str | None = fastapi.Query(None, pattern=r"^\d+-\d+$", description="next_cursor of the previous page"),
+    limit: int = fastapi.Query(1000, ge=1, le=10000),
+    bucket: float | None = fastapi.Query(None, gt=0, description="Aggregate into buckets of this many seconds")
+):
+    if bucket is not None:
+        return services.history.HistoryService.get_history_aggregated(bucket, start, end, start_seq, end_seq, cursor, limit)
+
+    return services.history.HistoryService.get_history(start, end, start_seq, end_seq, cursor, limit)
\ No newline at end of file
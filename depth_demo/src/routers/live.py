@@ -0,0 +1,9 @@
+import fastapi
+
+import services.live
+
+router = fastapi.APIRouter()
+
+@router.websocket("/ws/live")
+async def live(websocket: fastapi.WebSocket, max_fps: float = services.live.LiveService.DEFAULT_MAX_FPS):
+    await services.live.LiveService.stream_live(websocket, max_fps)
\ No newline at end of file
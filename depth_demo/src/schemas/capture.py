@@ -0,0 +1,8 @@
+import typing
+
+import pydantic
+
+
+class NoCapture(pydantic.BaseModel):
+    status: typing.Literal["no_capture"] = "no_capture"
+    detail: str = "No frame has been captured yet"
\ No newline at end of file
@@ -0,0 +1,14 @@
+import typing
+
+import pydantic
+
+
+class Dimension(pydantic.BaseModel):
+    height: float | None = None
+    width: float | None = None
+    length: float | None = None
+
+
+class NoMeasurement(pydantic.BaseModel):
+    status: typing.Literal["no_measurement"] = "no_measurement"
+    detail: str = "No measurement has been taken yet"
\ No newline at end of file
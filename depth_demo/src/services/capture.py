@@ -1,12 +1,12 @@
-import base64
-import io
-import time
 import asyncio
+import base64
 
 import fastapi
 import valkey
 
 import stores.valkey
+import services.frame_broadcaster
+import services.transcode
 
 
 class CaptureService:
@@ -19,21 +19,64 @@ class CaptureService:
         return stream_image_base64_string
 
     @staticmethod
-    async def get_capture_streaming(request: fastapi.Request):
-        while True:
-            try:
-                if await request.is_disconnected():
-                    break
+    async def get_capture_frame(
+        variant: services.transcode.Variant = services.transcode.Variant(),
+        after_seq: int | None = None,
+        timeout: float = 30.0
+    ) -> services.frame_broadcaster.Frame | None:
+        """
+        Returns the latest frame held by the broadcaster, None before the first frame arrived.
+        With after_seq the call waits up to timeout seconds for a frame newer than after_seq and
+        returns the latest frame either way.
+        """
+        broadcaster = services.frame_broadcaster.FrameBroadcaster.get_instance()
+        if after_seq is not None:
+            await broadcaster.wait_for_newer(lambda: broadcaster.latest.seq if broadcaster.latest else None, after_seq, timeout)
+
+        frame = broadcaster.latest
+        if frame is None:
+            return None
+
+        return await services.transcode.TranscodeCache.get_instance().get(frame, variant)
+
+    @staticmethod
+    def encode_capture_image(frame: services.frame_broadcaster.Frame) -> str:
+        return base64.b64encode(frame.jpeg).decode("utf-8")
 
-                base64_string = CaptureService.get_capture_image()
-                stream = io.BytesIO(base64.b64decode(base64_string)).getvalue()
-                
-                yield (
-                    b'--frame\r\n'
-                    b'Content-Type: image/jpeg\r\n\r\n' + stream + b'\r\n'
-                )
+    @staticmethod
+    async def get_capture_streaming(request: fastapi.Request, variant: services.transcode.Variant = services.transcode.Variant(), fps: float | None = None):
+        broadcaster = services.frame_broadcaster.FrameBroadcaster.get_instance()
+        transcode_cache = services.transcode.TranscodeCache.get_instance()
+        queue: asyncio.Queue = broadcaster.subscribe()
+        loop = asyncio.get_running_loop()
+        last_sent: float = 0.0
+
+        try:
+            while True:
+                try:
+                    if await request.is_disconnected():
+                        break
+
+                    # Frames arriving while waiting replace each other in the queue
+                    if fps is not None:
+                        wait = last_sent + 1.0 / fps - loop.time()
+                        if wait > 0:
+                            await asyncio.sleep(wait)
+
+                    try:
+                        frame = await asyncio.wait_for(queue.get(), timeout=1.0)
+                    except asyncio.TimeoutError:
+                        continue
 
-                await asyncio.sleep(0.01)
+                    last_sent = loop.time()
+
+                    # The multipart chunk is built once per frame and variant and shared by all viewers
+                    frame = await transcode_cache.get(frame, variant)
+                    yield frame.multipart
+
+                except ConnectionResetError as e:
+                    print("ConnectionResetError")
+                    break
 
-            except ConnectionResetError as e:
-                print("ConnectionResetError")
\ No newline at end of file
+        finally:
+            broadcaster.unsubscribe(queue)
\ No newline at end of file
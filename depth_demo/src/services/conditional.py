@@ -0,0 +1,20 @@
+import fastapi
+
+
+def make_etag(*parts) -> str:
+    return '"' + "-".join(str(part) for part in parts) + '"'
+
+
+def is_not_modified(request: fastapi.Request, etag: str) -> bool:
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is None:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+
+    # Weak and strong comparison are the same here, the tags are sequence numbers
+    return etag in (tag.strip().removeprefix("W/") for tag in if_none_match.split(","))
+
+
+def not_modified_response(etag: str) -> fastapi.Response:
+    return fastapi.Response(status_code=304, headers={"ETag": etag, "Cache-Control": "no-cache"})
\ No newline at end of file
@@ -1,19 +1,123 @@
-import valkey
+import asyncio
+import json
 
+import valkey.asyncio
+
+import schemas.dimension
 import stores.valkey
+import services.frame_broadcaster
 
 class DimensionService:
-    @staticmethod  
-    def get_dimension() -> dict[str, float]:
-        valkey_client: valkey.Valkey = stores.valkey.ValkeyStore().get_valkey_client()
-        
-        height: float = float(valkey_client.get("height"))
-        width: float = float(valkey_client.get("width"))
-        length: float = float(valkey_client.get("length"))
-        
-        return {
-            "height": height,
-            "width": width,
-            "length": length
-        }
-    
\ No newline at end of file
+    """
+    Keeps the latest measurement per API process.
+
+    Within CACHE_TTL seconds the cached measurement is returned without asking Valkey, unless
+    the FrameBroadcaster already saw a newer one or a long-poll waits for a newer one. After
+    that only the cheap "measurement_seq" key is read, and the measurement itself is fetched
+    again only when the sequence number changed. Concurrent requests needing a refresh share a
+    single fetch.
+    """
+
+    CACHE_TTL: float = 0.05
+
+    _cached: tuple[int | None, schemas.dimension.Dimension | None] | None = None
+    _cached_at: float = 0.0
+    _refresh: asyncio.Future | None = None
+    # Set in embedded capture mode, where there is nothing to refresh from
+    _pushed: bool = False
+
+    @staticmethod
+    async def _fetch(cached: tuple[int | None, schemas.dimension.Dimension | None] | None) -> tuple[int | None, schemas.dimension.Dimension | None]:
+        valkey_client: valkey.asyncio.Valkey = stores.valkey.ValkeyStore().get_async_valkey_client()
+
+        measurement_seq = await valkey_client.get("measurement_seq")
+        if cached is not None and measurement_seq is not None and int(measurement_seq) == cached[0]:
+            return cached
+
+        measurement, height, width, length = await valkey_client.mget("measurement", "height", "width", "length")
+        if height is None and width is None and length is None:
+            return None, None
+
+        seq: int | None = json.loads(measurement)["seq"] if measurement is not None else None
+
+        return seq, schemas.dimension.Dimension(
+            height=float(height) if height is not None else None,
+            width=float(width) if width is not None else None,
+            length=float(length) if length is not None else None
+        )
+
+    @staticmethod
+    def _is_current(cached: tuple[int | None, schemas.dimension.Dimension | None], after_seq: int | None) -> bool:
+        seq = cached[0]
+        # A long-poll woke up for a measurement newer than after_seq
+        if after_seq is not None and (seq is None or seq <= after_seq):
+            return False
+        measurement_seq = services.frame_broadcaster.FrameBroadcaster.get_instance().measurement_seq
+        return seq is None or measurement_seq is None or measurement_seq <= seq
+
+    @staticmethod
+    async def get_measurement(after_seq: int | None = None) -> tuple[int | None, schemas.dimension.Dimension | None]:
+        """
+        Returns the sequence number of the frame the last measurement was taken on (None if the
+        capture loop never published a measurement record) and the dimensions, None if there was
+        no measurement yet.
+
+        With after_seq (a long-poll) neither the cache nor a refresh already in flight are taken
+        unless they hold a measurement newer than after_seq.
+        """
+        loop = asyncio.get_running_loop()
+        if DimensionService._pushed:
+            return DimensionService._cached if DimensionService._cached is not None else (None, None)
+        if (DimensionService._cached is not None and loop.time() - DimensionService._cached_at < DimensionService.CACHE_TTL
+                and DimensionService._is_current(DimensionService._cached, after_seq)):
+            return DimensionService._cached
+
+        if DimensionService._refresh is not None:
+            result = await asyncio.shield(DimensionService._refresh)
+            # The shared fetch may have started before the awaited measurement was written
+            if after_seq is None or DimensionService._is_current(result, after_seq):
+                return result
+
+        refresh: asyncio.Future = loop.create_future()
+        DimensionService._refresh = refresh
+        try:
+            result = await DimensionService._fetch(DimensionService._cached)
+            DimensionService._cached = result
+            DimensionService._cached_at = loop.time()
+            refresh.set_result(result)
+
+        except Exception as e:
+            refresh.set_exception(e)
+            # Nobody else may be waiting, mark the exception as retrieved
+            refresh.exception()
+            raise
+
+        finally:
+            if DimensionService._refresh is refresh:
+                DimensionService._refresh = None
+
+        return result
+
+    @staticmethod
+    def enable_push_mode() -> None:
+        """
+        Embedded capture mode: the measurements are pushed by the capture worker and requests
+        are answered from memory only, without asking Valkey.
+        """
+        DimensionService._pushed = True
+
+    @staticmethod
+    def push_measurement(record: dict) -> None:
+        """
+        Sets the latest measurement from the embedded capture worker (on the event loop thread).
+        Dimensions missing from the record keep their previous value, like the Valkey keys do.
+        """
+        previous = DimensionService._cached[1] if DimensionService._cached is not None and DimensionService._cached[1] is not None else schemas.dimension.Dimension()
+        dimension = previous.model_copy(update={key: record[key] for key in ("height", "width", "length") if key in record})
+        DimensionService._cached = (record["seq"], dimension)
+
+    @staticmethod
+    async def wait_for_measurement(after_seq: int, timeout: float) -> bool:
+        broadcaster = services.frame_broadcaster.FrameBroadcaster.get_instance()
+
+        return await broadcaster.wait_for_newer(lambda: broadcaster.measurement_seq, after_seq, timeout)
\ No newline at end of file
@@ -0,0 +1,158 @@
+import asyncio
+import json
+import os
+import threading
+import time
+
+import valkey
+
+import services.dimension
+import services.frame_broadcaster
+import services.measurement_events
+import stores.valkey
+
+# Opt-in: run the camera loop of depth/main.py inside the API process (single camera stations)
+EMBEDDED_CAPTURE: bool = os.environ.get("EMBEDDED_CAPTURE", "0") == "1"
+# Keep writing the results to Valkey for other hosts, /dimension/history and other API processes
+EMBEDDED_CAPTURE_MIRROR_VALKEY: bool = os.environ.get("EMBEDDED_CAPTURE_MIRROR_VALKEY", "1") == "1"
+# The options of depth/main.py: --multi-object, --track (implies multi object) and --record DIRECTORY
+EMBEDDED_CAPTURE_MULTI_OBJECT: bool = os.environ.get("EMBEDDED_CAPTURE_MULTI_OBJECT", "0") == "1"
+EMBEDDED_CAPTURE_TRACK: bool = os.environ.get("EMBEDDED_CAPTURE_TRACK", "0") == "1"
+EMBEDDED_CAPTURE_RECORD: str | None = os.environ.get("EMBEDDED_CAPTURE_RECORD") or None
+
+
+class EmbeddedCapture:
+    """
+    Runs the capture and measurement pipeline on a worker thread of the API process and hands
+    every result directly to the in-memory holders the routers read from: the FrameBroadcaster
+    (frames), the DimensionService cache (latest measurement) and the MeasurementEventHub (SSE).
+    Optionally the results are mirrored to Valkey exactly like depth/main.py publishes them.
+
+    The parcel events of the conveyor tracking are only published to Valkey, tracking needs the
+    mirror and is rejected without it.
+    """
+
+    _instance: "EmbeddedCapture | None" = None
+    _lock: threading.Lock = threading.Lock()
+
+    def __init__(self, mirror_valkey: bool = EMBEDDED_CAPTURE_MIRROR_VALKEY, multi_object: bool = EMBEDDED_CAPTURE_MULTI_OBJECT,
+                 track: bool = EMBEDDED_CAPTURE_TRACK, record: str | None = EMBEDDED_CAPTURE_RECORD):
+        if track and not mirror_valkey:
+            raise ValueError("EMBEDDED_CAPTURE_TRACK=1 needs the Valkey mirror, the parcel events are published to Valkey only")
+        self.mirror_valkey: bool = mirror_valkey
+        self.multi_object: bool = multi_object or track
+        self.track: bool = track
+        self.record: str | None = record
+        self._stop: threading.Event = threading.Event()
+        self._thread: threading.Thread | None = None
+        self._loop: asyncio.AbstractEventLoop | None = None
+
+    @classmethod
+    def get_instance(cls) -> "EmbeddedCapture":
+        if cls._instance is None:
+            with cls._lock:
+                if cls._instance is None:
+                    cls._instance = EmbeddedCapture()
+
+        return cls._instance
+
+    async def start(self) -> None:
+        if self._thread is None:
+            self._loop = asyncio.get_running_loop()
+            self._stop.clear()
+            services.dimension.DimensionService.enable_push_mode()
+            self._thread = threading.Thread(target=self._run, name="embedded-capture", daemon=True)
+            self._thread.start()
+
+    async def stop(self) -> None:
+        if self._thread is not None:
+            self._stop.set()
+            # Returns once the pending wait_for_frames() finished and the camera was stopped
+            await asyncio.to_thread(self._thread.join)
+            self._thread = None
+
+    def _deliver(self, seq: int, jpeg: bytes, record: dict | None) -> None:
+        # Runs on the event loop thread
+        services.frame_broadcaster.FrameBroadcaster.get_instance().publish_jpeg(seq, jpeg, json.dumps(record) if record is not None else None)
+        if record is not None:
+            services.dimension.DimensionService.push_measurement(record)
+            services.measurement_events.MeasurementEventHub.get_instance().publish(record)
+
+    def _run(self) -> None:
+        # Imported here, the camera modules are only needed in embedded mode
+        import depth.capture_pipeline
+        import depth.parcel_tracker
+        import depth.publisher
+        import depth.recorder
+
+        publisher = None
+        frame_seq = 0
+        if self.mirror_valkey:
+            publisher = depth.publisher.ValkeyPublisher(stores.valkey.ValkeyStore().get_valkey_client())
+            frame_seq = publisher.frame_seq
+
+        capture = depth.capture_pipeline.CapturePipeline(verbose=False, multi_object=self.multi_object)
+        try:
+            capture.start()
+        except Exception as e:
+            # Nothing to stop, stop() would only hide this error
+            print("EmbeddedCapture: the camera could not be started:", e)
+            return
+
+        tracker = None
+        recorder = None
+        try:
+            if publisher is not None:
+                # Mirrors the raw depth too, like the standalone capture process
+                publisher.depth_encoder = capture.depth_encoder()
+            if self.track:
+                start_x, start_y, end_x, end_y = capture.roi
+                tracker = depth.parcel_tracker.ParcelTracker((end_y - start_y, end_x - start_x), first_id=publisher.parcel_seq + 1)
+            if self.record is not None:
+                recorder = depth.recorder.Recorder(self.record, capture.recording_meta())
+
+            while not self._stop.is_set():
+                try:
+                    result = capture.process_next()
+                except RuntimeError as e:
+                    # wait_for_frames() timed out
+                    print("EmbeddedCapture:", e)
+                    continue
+
+                if result is None:
+                    continue
+
+                frame_seq += 1
+                measurement = result.measurement or None
+                record = {"seq": frame_seq, "timestamp": time.time(), **measurement} if measurement is not None else None
+                if record is not None and result.objects is not None:
+                    record["objects"] = result.objects
+                self._loop.call_soon_threadsafe(self._deliver, frame_seq, result.jpeg, record)
+
+                if publisher is not None:
+                    events = tracker.update(result.objects, result.rects, frame_seq, time.time()) if tracker is not None else []
+                    try:
+                        publisher.publish_frame(result.jpeg, measurement, result.depth_roi, result.objects)
+                        publisher.publish_parcels(events)
+                    except valkey.exceptions.ConnectionError as e:
+                        # The local holders are already updated, the mirror catches up with the next frame
+                        print("EmbeddedCapture: Valkey connection error:", e)
+                    # Keep the numbering of the mirror and of the local holders in step
+                    publisher.frame_seq = frame_seq
+                if recorder is not None:
+                    recorder.record(frame_seq, result.depth_roi, result.color_roi, measurement)
+
+        except Exception as e:
+            print("EmbeddedCapture stopped:", e)
+
+        finally:
+            if tracker is not None:
+                # The parcels still in view get their events too
+                try:
+                    publisher.publish_parcels(tracker.flush())
+                except valkey.exceptions.ValkeyError as e:
+                    print("EmbeddedCapture: parcel events not published:", e)
+            capture.stop()
+            if recorder is not None:
+                recorder.close()
+                print(f"EmbeddedCapture: recorded {recorder.recorded} frames, dropped {recorder.dropped}")
\ No newline at end of file
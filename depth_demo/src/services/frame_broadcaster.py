@@ -0,0 +1,214 @@
+import asyncio
+import base64
+import json
+import threading
+import typing
+from collections.abc import Callable
+
+import valkey.asyncio
+
+import depth.frame_ring
+import stores.valkey
+
+
+class Frame(typing.NamedTuple):
+    seq: int
+    jpeg: bytes
+    multipart: bytes
+    # Measurement record published together with this frame as JSON text, None when there is none
+    measurement: str | None = None
+    # Binary WebSocket message: 8 byte big-endian sequence number followed by the JPEG
+    binary: bytes = b''
+    # Text WebSocket message {"type": "measurement", ...} sent before the frame, None without a measurement
+    measurement_message: str | None = None
+
+
+class FrameBroadcaster:
+    """
+    Reads every new frame from Valkey once per API process and fans the same immutable
+    bytes out to all connected viewers.
+
+    Each viewer owns a queue holding at most one frame. When a viewer is too slow to take
+    a frame before the next one arrives, the old frame is replaced, so slow viewers skip
+    frames instead of buffering them.
+
+    When the capture process runs on the same host, the frames are copied out of its shared
+    memory frame ring instead of being fetched from Valkey. Valkey is used whenever the ring
+    does not exist or has not advanced for RING_STALE_TIMEOUT seconds.
+
+    Unexpected errors of the polling are logged and it is restarted after RESTART_DELAY seconds,
+    doubled up to RESTART_DELAY_MAX while it keeps failing.
+    """
+
+    RING_ATTACH_INTERVAL: float = 1.0
+    RING_STALE_TIMEOUT: float = 2.0
+    RESTART_DELAY: float = 1.0
+    RESTART_DELAY_MAX: float = 30.0
+
+    _instance: "FrameBroadcaster | None" = None
+    _lock: threading.Lock = threading.Lock()
+
+    def __init__(self, poll_interval: float = 0.01):
+        self.poll_interval: float = poll_interval
+        self.latest: Frame | None = None
+        # Sequence number of the frame the last measurement was taken on
+        self.measurement_seq: int | None = None
+        self._subscribers: set[asyncio.Queue] = set()
+        # Replaced by a new event on every frame, waiters of the old one are woken up
+        self._changed: asyncio.Event = asyncio.Event()
+        self._task: asyncio.Task | None = None
+
+    @classmethod
+    def get_instance(cls) -> "FrameBroadcaster":
+        if cls._instance is None:
+            with cls._lock:
+                if cls._instance is None:
+                    cls._instance = FrameBroadcaster()
+
+        return cls._instance
+
+    async def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def subscribe(self) -> asyncio.Queue:
+        queue: asyncio.Queue = asyncio.Queue(maxsize=1)
+        if self.latest is not None:
+            queue.put_nowait(self.latest)
+        self._subscribers.add(queue)
+
+        return queue
+
+    def unsubscribe(self, queue: asyncio.Queue) -> None:
+        self._subscribers.discard(queue)
+
+    async def wait_for_newer(self, current_seq: Callable[[], int | None], after_seq: int, timeout: float) -> bool:
+        """
+        Waits until current_seq() (e.g. the frame or the measurement sequence number) is greater
+        than after_seq. Returns False when the timeout passed first.
+        """
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+
+        while (seq := current_seq()) is None or seq <= after_seq:
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                return False
+            try:
+                await asyncio.wait_for(self._changed.wait(), timeout=remaining)
+            except asyncio.TimeoutError:
+                return False
+
+        return True
+
+    def _publish(self, frame: Frame) -> None:
+        self.latest = frame
+        for queue in self._subscribers:
+            if queue.full():
+                queue.get_nowait()
+            queue.put_nowait(frame)
+
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    def publish_jpeg(self, seq: int, jpeg: bytes, measurement: str | bytes | None) -> None:
+        """
+        Hands a new frame and the latest measurement record (JSON) to all viewers. Called by the
+        polling task, or directly by the embedded capture worker (on the event loop thread).
+        """
+        # The measurement key keeps the last record, only attach it to the frame it was taken from
+        if isinstance(measurement, bytes):
+            measurement = measurement.decode("utf-8")
+        record = None
+        if measurement is not None:
+            record = json.loads(measurement)
+            self.measurement_seq = record.get("seq")
+            if self.measurement_seq != seq:
+                measurement = record = None
+
+        self._publish(Frame(
+            seq=seq,
+            jpeg=jpeg,
+            multipart=b'--frame\r\nContent-Type: image/jpeg\r\n\r\n' + jpeg + b'\r\n',
+            measurement=measurement,
+            binary=seq.to_bytes(8, "big") + jpeg,
+            measurement_message=json.dumps({"type": "measurement", **record}) if record is not None else None
+        ))
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        delay = self.RESTART_DELAY
+        while True:
+            started_at = loop.time()
+            try:
+                await self._poll()
+            except Exception as e:
+                if loop.time() - started_at > self.RESTART_DELAY_MAX:
+                    # It ran fine for a while, this is no repeated failure
+                    delay = self.RESTART_DELAY
+                print(f"FrameBroadcaster: polling failed, restarting in {delay:.0f}s:", repr(e))
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, self.RESTART_DELAY_MAX)
+
+    async def _poll(self) -> None:
+        valkey_client: valkey.asyncio.Valkey = stores.valkey.ValkeyStore().get_async_valkey_client()
+        loop = asyncio.get_running_loop()
+        # A restarted poll does not publish the latest frame again
+        last_seq: int | None = self.latest.seq if self.latest is not None else None
+        frame_ring: depth.frame_ring.FrameRing | None = None
+        next_attach: float = 0.0
+        last_ring_frame: float = 0.0
+
+        try:
+            while True:
+                if frame_ring is None and loop.time() >= next_attach:
+                    try:
+                        frame_ring = depth.frame_ring.FrameRing.attach()
+                        last_ring_frame = loop.time()
+                    except (FileNotFoundError, ValueError):
+                        # No ring, or its header is not written yet by FrameRing.create()
+                        next_attach = loop.time() + self.RING_ATTACH_INTERVAL
+
+                if frame_ring is not None:
+                    # Same host: a memory read of the latest sequence number and a copy of the slot
+                    seq = frame_ring.latest_seq()
+                    ring_frame = frame_ring.read(seq, with_depth=False) if seq and seq != last_seq else None
+                    if ring_frame is not None:
+                        last_seq = ring_frame.seq
+                        last_ring_frame = loop.time()
+                        measurement = json.dumps(ring_frame.measurement) if ring_frame.measurement is not None else None
+                        self.publish_jpeg(last_seq, ring_frame.jpeg, measurement)
+                    elif loop.time() - last_ring_frame > self.RING_STALE_TIMEOUT:
+                        # The capture process stopped or was restarted with a new ring
+                        frame_ring.close()
+                        frame_ring = None
+                        next_attach = loop.time() + self.RING_ATTACH_INTERVAL
+
+                else:
+                    try:
+                        # Poll the cheap sequence key and only fetch the image when it changed
+                        seq = await valkey_client.get("stream_seq")
+                        if seq is not None and int(seq) != last_seq:
+                            base64_string, measurement = await valkey_client.mget("stream_image", "measurement")
+                            if base64_string is not None:
+                                last_seq = int(seq)
+                                self.publish_jpeg(last_seq, base64.b64decode(base64_string), measurement)
+
+                    except valkey.exceptions.ConnectionError as e:
+                        print("FrameBroadcaster: Valkey connection error:", e)
+                        await asyncio.sleep(1.0)
+
+                await asyncio.sleep(self.poll_interval)
+
+        finally:
+            if frame_ring is not None:
+                frame_ring.close()
\ No newline at end of file
@@ -0,0 +1,178 @@
+import json
+import math
+
+import numpy as np
+import valkey
+import valkey.asyncio
+
+import stores.valkey
+
+DIMENSIONS: tuple[str, ...] = ("width", "length", "height")
+
+
+class HistoryService:
+    """
+    Range queries over the "measurement_history" stream written by the capture loop.
+
+    The stream entry IDs are the Valkey server times in milliseconds, time ranges are therefore
+    served by XRANGE directly. The frame sequence numbers increase with the entry IDs, so a
+    sequence range is a filter which stops reading as soon as it has been passed.
+    """
+
+    HISTORY_KEY: str = "measurement_history"
+    # Entries fetched per XRANGE round trip
+    READ_BATCH: int = 5000
+
+    @staticmethod
+    def _range_bounds(start: float | None, end: float | None, cursor: str | None) -> tuple[str, str]:
+        if cursor is not None:
+            # Exclusive start, the cursor is the last entry already returned
+            range_start = "(" + cursor
+        elif start is not None:
+            range_start = str(math.floor(start * 1000))
+        else:
+            range_start = "-"
+
+        range_end = str(math.floor(end * 1000)) if end is not None else "+"
+
+        return range_start, range_end
+
+    @staticmethod
+    def _read_entries(range_start: str, range_end: str, start_seq: int | None, end_seq: int | None):
+        """
+        Yields (entry_id, seq, timestamp, {dimension: value}) in stream order
+        """
+        valkey_client: valkey.Valkey = stores.valkey.ValkeyStore().get_valkey_client()
+
+        while True:
+            entries = valkey_client.xrange(HistoryService.HISTORY_KEY, range_start, range_end, count=HistoryService.READ_BATCH)
+            for (entry_id, fields) in entries:
+                entry_id = entry_id.decode("utf-8") if isinstance(entry_id, bytes) else entry_id
+                fields = {(key.decode("utf-8") if isinstance(key, bytes) else key): value for (key, value) in fields.items()}
+                seq = int(fields["seq"])
+                if end_seq is not None and seq > end_seq:
+                    return
+                if start_seq is not None and seq < start_seq:
+                    continue
+
+                yield entry_id, seq, float(fields["timestamp"]), {key: float(fields[key]) for key in DIMENSIONS if key in fields}
+
+            if len(entries) < HistoryService.READ_BATCH:
+                return
+            range_start = "(" + entry_id
+
+    @staticmethod
+    def get_history(
+        start: float | None = None,
+        end: float | None = None,
+        start_seq: int | None = None,
+        end_seq: int | None = None,
+        cursor: str | None = None,
+        limit: int = 1000
+    ) -> dict:
+        """
+        Return:
+        ----------
+        {"items": [{"id", "seq", "timestamp", "width", "length", "height"}, ...], "next_cursor": str | None}
+        next_cursor is the ID of the last returned entry if the range holds more entries
+        """
+        items: list[dict] = []
+        entries = HistoryService._read_entries(*HistoryService._range_bounds(start, end, cursor), start_seq, end_seq)
+        for (entry_id, seq, timestamp, dimension) in entries:
+            if len(items) == limit:
+                return {"items": items, "next_cursor": items[-1]["id"]}
+            items.append({"id": entry_id, "seq": seq, "timestamp": timestamp, **dimension})
+
+        return {"items": items, "next_cursor": None}
+
+    @staticmethod
+    async def get_records_after(after_seq: int, max_records: int = 1000) -> list[dict]:
+        """
+        Returns the measurement records (as published) newer than after_seq in stream order, at
+        most the newest max_records. Reads backwards from the end of the stream, so the cost only
+        depends on the number of records returned.
+        """
+        valkey_client: valkey.asyncio.Valkey = stores.valkey.ValkeyStore().get_async_valkey_client()
+
+        records: list[dict] = []
+        range_end = "+"
+        while len(records) < max_records:
+            entries = await valkey_client.xrevrange(HistoryService.HISTORY_KEY, range_end, "-", count=min(HistoryService.READ_BATCH, max_records - len(records)))
+            for (entry_id, fields) in entries:
+                record = {}
+                for (key, value) in fields.items():
+                    key = key.decode("utf-8") if isinstance(key, bytes) else key
+                    # The multi object mode stores the object list as JSON, all other fields are numbers
+                    record[key] = json.loads(value) if key == "objects" else float(value)
+                record["seq"] = int(record["seq"])
+                if record["seq"] <= after_seq:
+                    return records[::-1]
+                records.append(record)
+
+            if not entries:
+                break
+            entry_id = entry_id.decode("utf-8") if isinstance(entry_id, bytes) else entry_id
+            range_end = "(" + entry_id
+
+        return records[::-1]
+
+    @staticmethod
+    def _aggregate_bucket(bucket_start: float, bucket: float, rows: list[tuple]) -> dict:
+        values = np.array([[dimension.get(key, np.nan) for key in DIMENSIONS] for (_, _, _, dimension) in rows])
+        valid = ~np.isnan(values)
+        count = valid.sum(axis=0)
+        result = {
+            "start": bucket_start,
+            "end": bucket_start + bucket,
+            "count": len(rows),
+            "first_seq": rows[0][1],
+            "last_seq": rows[-1][1]
+        }
+        for (index, key) in enumerate(DIMENSIONS):
+            column = values[valid[:, index], index]
+            result[key] = {
+                "min": float(column.min()),
+                "max": float(column.max()),
+                "mean": float(column.mean())
+            } if count[index] else None
+
+        return result
+
+    @staticmethod
+    def get_history_aggregated(
+        bucket: float,
+        start: float | None = None,
+        end: float | None = None,
+        start_seq: int | None = None,
+        end_seq: int | None = None,
+        cursor: str | None = None,
+        limit: int = 1000
+    ) -> dict:
+        """
+        Aggregates the entries into buckets of bucket seconds (aligned to multiples of bucket on
+        the measurement timestamps) with min/max/mean per dimension. Empty buckets are left out.
+
+        Return:
+        ----------
+        {"buckets": [{"start", "end", "count", "first_seq", "last_seq", "width": {"min", "max", "mean"}, ...}, ...],
+         "next_cursor": str | None}
+        next_cursor is the ID of the last entry of the last returned bucket if the range holds more entries
+        """
+        buckets: list[dict] = []
+        rows: list[tuple] = []
+        current_bucket: float | None = None
+        entries = HistoryService._read_entries(*HistoryService._range_bounds(start, end, cursor), start_seq, end_seq)
+        for row in entries:
+            bucket_start = math.floor(row[2] / bucket) * bucket
+            if rows and bucket_start != current_bucket:
+                buckets.append(HistoryService._aggregate_bucket(current_bucket, bucket, rows))
+                if len(buckets) == limit:
+                    return {"buckets": buckets, "next_cursor": rows[-1][0]}
+                rows = []
+            current_bucket = bucket_start
+            rows.append(row)
+
+        if rows:
+            buckets.append(HistoryService._aggregate_bucket(current_bucket, bucket, rows))
+
+        return {"buckets": buckets, "next_cursor": None}
\ No newline at end of file
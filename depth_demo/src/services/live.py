@@ -0,0 +1,73 @@
+import asyncio
+import json
+
+import fastapi
+import starlette.websockets
+
+import services.frame_broadcaster
+
+
+class LiveService:
+    DEFAULT_MAX_FPS: float = 15.0
+    MAX_FPS_LIMIT: float = 60.0
+
+    @staticmethod
+    def _clamp_fps(max_fps: float) -> float:
+        return min(max(float(max_fps), 0.1), LiveService.MAX_FPS_LIMIT)
+
+    @staticmethod
+    async def _receive_controls(websocket: fastapi.WebSocket, settings: dict[str, float]) -> None:
+        # Clients may change their frame rate at any time with {"max_fps": 5}
+        while True:
+            message = await websocket.receive_text()
+            try:
+                control = json.loads(message)
+                if "max_fps" in control:
+                    settings["max_fps"] = LiveService._clamp_fps(control["max_fps"])
+            except (ValueError, TypeError, AttributeError):
+                await websocket.send_text(json.dumps({"type": "error", "detail": "invalid control message"}))
+
+    @staticmethod
+    async def stream_live(websocket: fastapi.WebSocket, max_fps: float) -> None:
+        """
+        Pushes every frame as a binary message (8 byte big-endian sequence number + JPEG), preceded
+        by a text message {"type": "measurement", "seq": ..., ...} when a measurement was taken on
+        that frame.
+
+        Backpressure is latest-wins: the viewer holds at most one pending frame, and a frame is only
+        taken from it after the previous one was sent and the max_fps interval has passed, so slow
+        clients skip frames instead of queuing them.
+        """
+        await websocket.accept()
+
+        broadcaster = services.frame_broadcaster.FrameBroadcaster.get_instance()
+        queue: asyncio.Queue = broadcaster.subscribe()
+        settings: dict[str, float] = {"max_fps": LiveService._clamp_fps(max_fps)}
+        controls = asyncio.create_task(LiveService._receive_controls(websocket, settings))
+        loop = asyncio.get_running_loop()
+        last_sent: float = 0.0
+
+        try:
+            while not controls.done():
+                wait = last_sent + 1.0 / settings["max_fps"] - loop.time()
+                if wait > 0:
+                    await asyncio.sleep(wait)
+
+                try:
+                    frame = await asyncio.wait_for(queue.get(), timeout=1.0)
+                except asyncio.TimeoutError:
+                    continue
+
+                last_sent = loop.time()
+                if frame.measurement_message is not None:
+                    await websocket.send_text(frame.measurement_message)
+                await websocket.send_bytes(frame.binary)
+
+        except (starlette.websockets.WebSocketDisconnect, RuntimeError):
+            pass
+
+        finally:
+            controls.cancel()
+            broadcaster.unsubscribe(queue)
+            # The control task ends with the disconnect or the cancellation, both are expected here
+            await asyncio.gather(controls, return_exceptions=True)
\ No newline at end of file
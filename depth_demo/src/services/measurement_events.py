@@ -0,0 +1,139 @@
+import asyncio
+import json
+import threading
+
+import fastapi
+import valkey.asyncio
+
+import stores.valkey
+import services.history
+
+
+class MeasurementEventHub:
+    """
+    Holds the single subscription of the API process to the "measurement_events" channel and
+    fans every record out to the connected SSE clients.
+
+    Records missed while the subscription was down are read back from the history stream after
+    reconnecting, so clients see every sequence number exactly once and in order.
+    """
+
+    _instance: "MeasurementEventHub | None" = None
+    _lock: threading.Lock = threading.Lock()
+
+    EVENTS_CHANNEL: str = "measurement_events"
+    # A client lagging this many records behind is disconnected, it can resume with Last-Event-ID
+    MAX_PENDING: int = 256
+
+    def __init__(self):
+        self.last_seq: int | None = None
+        self._subscribers: set[asyncio.Queue] = set()
+        self._task: asyncio.Task | None = None
+
+    @classmethod
+    def get_instance(cls) -> "MeasurementEventHub":
+        if cls._instance is None:
+            with cls._lock:
+                if cls._instance is None:
+                    cls._instance = MeasurementEventHub()
+
+        return cls._instance
+
+    async def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def subscribe(self) -> asyncio.Queue:
+        queue: asyncio.Queue = asyncio.Queue(maxsize=self.MAX_PENDING)
+        self._subscribers.add(queue)
+
+        return queue
+
+    def unsubscribe(self, queue: asyncio.Queue) -> None:
+        self._subscribers.discard(queue)
+
+    def publish(self, record: dict) -> None:
+        if self.last_seq is not None and record["seq"] <= self.last_seq:
+            return
+        self.last_seq = record["seq"]
+
+        for queue in list(self._subscribers):
+            if queue.full():
+                # None tells the client stream to close
+                self._subscribers.discard(queue)
+                queue.get_nowait()
+                queue.put_nowait(None)
+            else:
+                queue.put_nowait(record)
+
+    async def _run(self) -> None:
+        valkey_client: valkey.asyncio.Valkey = stores.valkey.ValkeyStore().get_async_valkey_client()
+
+        while True:
+            try:
+                async with valkey_client.pubsub() as pubsub:
+                    await pubsub.subscribe(self.EVENTS_CHANNEL)
+                    # Fill the gap of a previous disconnect now that new records are buffered
+                    if self.last_seq is not None:
+                        for record in await services.history.HistoryService.get_records_after(self.last_seq):
+                            self.publish(record)
+
+                    async for message in pubsub.listen():
+                        if message["type"] == "message":
+                            self.publish(json.loads(message["data"]))
+
+            except valkey.exceptions.ConnectionError as e:
+                print("MeasurementEventHub: Valkey connection error:", e)
+                await asyncio.sleep(1.0)
+
+
+class MeasurementEventService:
+    KEEP_ALIVE_INTERVAL: float = 15.0
+
+    @staticmethod
+    def _format_event(record: dict) -> str:
+        return f"id: {record['seq']}\nevent: measurement\ndata: {json.dumps(record)}\n\n"
+
+    @staticmethod
+    async def get_events(request: fastapi.Request, last_event_id: int | None):
+        hub = MeasurementEventHub.get_instance()
+        # Subscribe before reading the history, records arriving meanwhile are buffered
+        queue: asyncio.Queue = hub.subscribe()
+        last_seq: int = -1
+
+        try:
+            # Reconnect quickly, the resume is handled with Last-Event-ID
+            yield "retry: 1000\n\n"
+
+            if last_event_id is not None:
+                for record in await services.history.HistoryService.get_records_after(last_event_id):
+                    last_seq = record["seq"]
+                    yield MeasurementEventService._format_event(record)
+
+            while True:
+                if await request.is_disconnected():
+                    break
+
+                try:
+                    record = await asyncio.wait_for(queue.get(), timeout=MeasurementEventService.KEEP_ALIVE_INTERVAL)
+                except asyncio.TimeoutError:
+                    yield ": keep-alive\n\n"
+                    continue
+
+                if record is None:
+                    break
+                if record["seq"] > last_seq:
+                    last_seq = record["seq"]
+                    yield MeasurementEventService._format_event(record)
+
+        finally:
+            hub.unsubscribe(queue)
\ No newline at end of file
@@ -0,0 +1,107 @@
+import asyncio
+import collections
+import threading
+import typing
+
+import cv2
+import numpy as np
+
+import services.frame_broadcaster
+
+
+class Variant(typing.NamedTuple):
+    width: int | None = None
+    quality: int | None = None
+
+
+class TranscodeCache:
+    """
+    Scaled / recompressed variants of the broadcast frames, shared by all clients asking for
+    the same variant.
+
+    A variant of a frame is only transcoded when a client asks for it, at most once: concurrent
+    requests for the same (seq, variant) wait for the first transcode instead of starting their
+    own. The results are kept in a small LRU, so variants nobody asks for any more fall out of it
+    and stop being produced.
+    """
+
+    _instance: "TranscodeCache | None" = None
+    _lock: threading.Lock = threading.Lock()
+
+    DEFAULT_QUALITY: int = 80
+
+    def __init__(self, max_entries: int = 32):
+        self.max_entries: int = max_entries
+        self._entries: collections.OrderedDict[tuple[int, Variant], services.frame_broadcaster.Frame] = collections.OrderedDict()
+        self._pending: dict[tuple[int, Variant], asyncio.Future] = {}
+
+    @classmethod
+    def get_instance(cls) -> "TranscodeCache":
+        if cls._instance is None:
+            with cls._lock:
+                if cls._instance is None:
+                    cls._instance = TranscodeCache()
+
+        return cls._instance
+
+    async def get(self, frame: services.frame_broadcaster.Frame, variant: Variant) -> services.frame_broadcaster.Frame:
+        if variant == Variant():
+            return frame
+
+        key = (frame.seq, variant)
+        cached = self._entries.get(key)
+        if cached is not None:
+            self._entries.move_to_end(key)
+            return cached
+
+        pending = self._pending.get(key)
+        if pending is not None:
+            return await asyncio.shield(pending)
+
+        future: asyncio.Future = asyncio.get_running_loop().create_future()
+        self._pending[key] = future
+        try:
+            jpeg = await asyncio.to_thread(self._transcode, frame.jpeg, variant)
+            if jpeg is frame.jpeg:
+                transcoded = frame
+            else:
+                transcoded = frame._replace(
+                    jpeg=jpeg,
+                    multipart=b'--frame\r\nContent-Type: image/jpeg\r\n\r\n' + jpeg + b'\r\n',
+                    binary=frame.seq.to_bytes(8, "big") + jpeg
+                )
+            self._entries[key] = transcoded
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            future.set_result(transcoded)
+
+        except Exception as e:
+            future.set_exception(e)
+            # Nobody else may be waiting, mark the exception as retrieved
+            future.exception()
+            raise
+
+        finally:
+            del self._pending[key]
+
+        return transcoded
+
+    @staticmethod
+    def _transcode(jpeg: bytes, variant: Variant) -> bytes:
+        image = cv2.imdecode(np.frombuffer(jpeg, dtype=np.uint8), cv2.IMREAD_COLOR)
+        if image is None:
+            raise ValueError("frame is not a valid JPEG")
+
+        height, width = image.shape[:2]
+        if variant.quality is None and (variant.width is None or variant.width >= width):
+            # Nothing to scale and no quality asked for: re-encoding would only lose quality
+            return jpeg
+
+        if variant.width is not None and variant.width < width:
+            size = (variant.width, max(1, round(height * variant.width / width)))
+            image = cv2.resize(image, size, interpolation=cv2.INTER_AREA)
+
+        quality = variant.quality if variant.quality is not None else TranscodeCache.DEFAULT_QUALITY
+        return_value, encoded_image = cv2.imencode('.jpg', image, [cv2.IMWRITE_JPEG_QUALITY, quality])
+
+        return encoded_image.tobytes()
\ No newline at end of file
@@ -1,9 +1,16 @@
+import os
 import threading
 
 import valkey
+import valkey.asyncio
+
+# Defaults match the docker compose setup, overridden e.g. by the load test
+VALKEY_HOST: str = os.environ.get("VALKEY_HOST", "localhost")
+VALKEY_PORT: int = int(os.environ.get("VALKEY_PORT", "6379"))
 
 class ValkeyStore:
     _instance: "valkey.Valkey | None" = None
+    _async_instance: "valkey.asyncio.Valkey | None" = None
     _lock: threading.Lock = threading.Lock()
 
     @classmethod
@@ -11,6 +18,15 @@ class ValkeyStore:
         if cls._instance is None:
             with cls._lock:
                 if cls._instance is None:
-                    cls._instance = valkey.Valkey()
+                    cls._instance = valkey.Valkey(host=VALKEY_HOST, port=VALKEY_PORT)
+        
+        return cls._instance
+
+    @classmethod
+    def get_async_valkey_client(cls) -> "valkey.asyncio.Valkey":
+        if cls._async_instance is None:
+            with cls._lock:
+                if cls._async_instance is None:
+                    cls._async_instance = valkey.asyncio.Valkey(host=VALKEY_HOST, port=VALKEY_PORT)
         
-        return cls._instance
\ No newline at end of file
+        return cls._async_instance
\ No newline at end of file
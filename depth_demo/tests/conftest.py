@@ -0,0 +1,35 @@
+import os
+import sys
+
+import numpy as np
+import pytest
+
+# The depth modules import each other as top level modules, like when run from src/depth
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src", "depth"))
+# The API modules import each other from src, and the depth package from there (src/depth/depth.py must not shadow it)
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src"))
+
+from synthetic_scene import SyntheticScene  # noqa: E402
+
+# ROI of CapturePipeline
+MEASUREMENT_ROI = (254, 56, 602, 404)
+
+
+def pytest_collection_modifyitems(config, items):
+    # Latency budgets fail randomly on shared runners, they are only checked on request
+    if os.environ.get("RUN_PERF") == "1":
+        return
+    skip = pytest.mark.skip(reason="latency budget, set RUN_PERF=1 to check it")
+    for item in items:
+        if "benchmark" in item.keywords:
+            item.add_marker(skip)
+
+
+@pytest.fixture
+def rng():
+    return np.random.default_rng(0)
+
+
+@pytest.fixture(scope="session")
+def scene():
+    return SyntheticScene(roi=MEASUREMENT_ROI)
@@ -0,0 +1,34 @@
+import asyncio
+
+import fakeredis
+import pytest
+import starlette.requests
+
+import routers.capture
+import services.frame_broadcaster
+import stores.valkey
+
+
+@pytest.fixture
+def valkey_client(monkeypatch):
+    client = fakeredis.FakeRedis()
+    monkeypatch.setattr(stores.valkey.ValkeyStore, "_instance", client)
+    monkeypatch.setattr(services.frame_broadcaster.FrameBroadcaster, "_instance", None)
+    return client
+
+
+def get_capture(width=None, quality=None):
+    request = starlette.requests.Request({"type": "http", "headers": []})
+    return asyncio.run(routers.capture.capture(request, width=width, quality=quality, after_seq=None, timeout=1.0))
+
+
+def test_no_frame_yet_is_not_found(valkey_client):
+    assert get_capture().status_code == 404
+    assert get_capture(width=320).status_code == 404
+
+
+def test_variant_needs_a_broadcast_frame(valkey_client):
+    valkey_client.set("stream_image", "aW1hZ2U=")
+
+    assert get_capture() == b"aW1hZ2U="
+    assert get_capture(width=320, quality=50).status_code == 404
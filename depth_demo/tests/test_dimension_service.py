@@ -0,0 +1,63 @@
+import asyncio
+import json
+
+import fakeredis
+import pytest
+import starlette.requests
+
+import routers.dimension
+import services.dimension
+import services.frame_broadcaster
+import stores.valkey
+
+FRAME_INTERVAL = 1 / 30
+LONG_POLL_TIMEOUT = 5.0
+
+
+@pytest.fixture
+def valkey_client(monkeypatch):
+    client = fakeredis.aioredis.FakeRedis()
+    monkeypatch.setattr(stores.valkey.ValkeyStore, "_async_instance", client)
+    monkeypatch.setattr(services.frame_broadcaster.FrameBroadcaster, "_instance", None)
+    monkeypatch.setattr(services.dimension.DimensionService, "_cached", None)
+    monkeypatch.setattr(services.dimension.DimensionService, "_cached_at", 0.0)
+    return client
+
+
+async def capture_loop(valkey_client, frames):
+    """
+    Publishes a measurement per frame like the capture process and the FrameBroadcaster polling it
+    """
+    broadcaster = services.frame_broadcaster.FrameBroadcaster.get_instance()
+    for seq in range(1, frames + 1):
+        record = json.dumps({"seq": seq, "width": 100.0, "length": 200.0, "height": 70.0})
+        await valkey_client.mset({"measurement": record, "measurement_seq": seq, "width": 100.0, "length": 200.0, "height": 70.0})
+        broadcaster.publish_jpeg(seq, b"jpeg", record)
+        await asyncio.sleep(FRAME_INTERVAL)
+
+
+async def long_poller(polls):
+    request = starlette.requests.Request({"type": "http", "headers": []})
+    after_seq = 0
+    loop = asyncio.get_running_loop()
+    statuses = []
+    for _ in range(polls):
+        started_at = loop.time()
+        response = await routers.dimension.get_dimension(request, after_seq=after_seq, timeout=LONG_POLL_TIMEOUT)
+        statuses.append((response.status_code, loop.time() - started_at))
+        if response.status_code == 200:
+            after_seq = int(response.headers["ETag"].strip('"'))
+    return statuses
+
+
+def test_long_poll_waits_for_a_newer_measurement(valkey_client):
+    async def run():
+        capture = asyncio.create_task(capture_loop(valkey_client, 60))
+        results = await asyncio.gather(*[long_poller(40) for _ in range(5)])
+        capture.cancel()
+        return [status for statuses in results for status in statuses]
+
+    statuses = asyncio.run(run())
+
+    # Frames keep arriving, no long-poll may end with 304 before its timeout
+    assert not [elapsed for (status, elapsed) in statuses if status == 304 and elapsed < LONG_POLL_TIMEOUT]
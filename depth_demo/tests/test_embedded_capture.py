@@ -0,0 +1,72 @@
+import asyncio
+import sys
+
+import fakeredis
+import pytest
+
+import rs_emulator
+import services.dimension
+import services.embedded_capture
+import services.frame_broadcaster
+import services.measurement_events
+import stores.valkey
+from synthetic_scene import Box
+
+FRAMES = 8
+
+
+@pytest.fixture(autouse=True)
+def emulator(monkeypatch):
+    """
+    As in test_rs_emulator.py, the modules imported with the emulator installed are unloaded again
+    """
+    monkeypatch.setattr(services.dimension.DimensionService, "_pushed", False)
+    monkeypatch.setattr(services.dimension.DimensionService, "_cached", None)
+    monkeypatch.setattr(services.frame_broadcaster.FrameBroadcaster, "_instance", None)
+    monkeypatch.setattr(services.measurement_events.MeasurementEventHub, "_instance", None)
+    modules = set(sys.modules)
+    yield
+    rs_emulator.uninstall()
+    for name in set(sys.modules) - modules:
+        del sys.modules[name]
+
+
+def test_tracking_needs_the_valkey_mirror():
+    with pytest.raises(ValueError):
+        services.embedded_capture.EmbeddedCapture(mirror_valkey=False, track=True)
+
+
+def test_failed_start_is_not_hidden(capsys):
+    # No camera connected
+    rs_emulator.install([], realtime=False)
+
+    services.embedded_capture.EmbeddedCapture(mirror_valkey=False)._run()
+
+    output = capsys.readouterr().out
+    assert "could not be started" in output
+    assert "stop() cannot be called" not in output
+
+
+def test_tracks_the_parcels_like_main(monkeypatch):
+    source = rs_emulator.SyntheticSource([Box(0.0, 0.0, 0.12, 0.08, 0.07)], bank_size=2)
+    rs_emulator.install([rs_emulator.VirtualCamera("000000000001", source)], realtime=False)
+    valkey_client = fakeredis.FakeRedis()
+    monkeypatch.setattr(stores.valkey.ValkeyStore, "_instance", valkey_client)
+
+    async def run():
+        capture = services.embedded_capture.EmbeddedCapture(mirror_valkey=True, track=True)
+        broadcaster = services.frame_broadcaster.FrameBroadcaster.get_instance()
+        await capture.start()
+        try:
+            while broadcaster.latest is None or broadcaster.latest.seq < FRAMES:
+                await asyncio.sleep(0.01)
+        finally:
+            await capture.stop()
+        return broadcaster.measurement_seq
+
+    assert asyncio.run(run()) is not None
+    _, record = services.dimension.DimensionService._cached
+    assert record.height == pytest.approx(70.0, abs=3.0)
+    # The box never left the ROI, its event comes with the stop
+    assert valkey_client.xlen("parcel_history") == 1
+    assert valkey_client.get("objects") is not None
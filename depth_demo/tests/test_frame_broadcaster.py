@@ -0,0 +1,88 @@
+import asyncio
+import base64
+import uuid
+from multiprocessing import shared_memory
+
+import fakeredis
+import pytest
+
+import depth.frame_ring
+import services.frame_broadcaster
+import stores.valkey
+
+
+@pytest.fixture
+def valkey_client(monkeypatch):
+    client = fakeredis.aioredis.FakeRedis()
+    monkeypatch.setattr(stores.valkey.ValkeyStore, "_async_instance", client)
+    return client
+
+
+def no_ring():
+    raise FileNotFoundError("depth_frame_ring")
+
+
+async def wait_for_frame(broadcaster, timeout=2.0):
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+    while broadcaster.latest is None and loop.time() < deadline:
+        await asyncio.sleep(0.01)
+    return broadcaster.latest
+
+
+def test_ring_without_header_is_not_attached():
+    shm = shared_memory.SharedMemory(name=f"test_ring_{uuid.uuid4().hex[:8]}", create=True, size=4096)
+    try:
+        # Created by FrameRing.create(), the header is not packed yet
+        with pytest.raises(ValueError):
+            depth.frame_ring.FrameRing.attach(shm.name)
+    finally:
+        shm.close()
+        shm.unlink()
+
+
+def test_ring_race_falls_back_to_valkey(valkey_client, monkeypatch):
+    def attach():
+        raise ValueError("not a version 1 frame ring")
+
+    monkeypatch.setattr(depth.frame_ring.FrameRing, "attach", attach)
+
+    async def run():
+        await valkey_client.mset({"stream_seq": 3, "stream_image": base64.b64encode(b"jpeg")})
+        broadcaster = services.frame_broadcaster.FrameBroadcaster()
+        await broadcaster.start()
+        try:
+            return await wait_for_frame(broadcaster)
+        finally:
+            await broadcaster.stop()
+
+    frame = asyncio.run(run())
+    assert (frame.seq, frame.jpeg) == (3, b"jpeg")
+
+
+def test_polling_is_restarted_after_an_error(valkey_client, monkeypatch):
+    polls = []
+    poll = services.frame_broadcaster.FrameBroadcaster._poll
+
+    async def failing_poll(self):
+        polls.append(None)
+        if len(polls) == 1:
+            raise RuntimeError("unexpected")
+        await poll(self)
+
+    monkeypatch.setattr(services.frame_broadcaster.FrameBroadcaster, "_poll", failing_poll)
+    monkeypatch.setattr(services.frame_broadcaster.FrameBroadcaster, "RESTART_DELAY", 0.01)
+    monkeypatch.setattr(depth.frame_ring.FrameRing, "attach", no_ring)
+
+    async def run():
+        await valkey_client.mset({"stream_seq": 5, "stream_image": base64.b64encode(b"jpeg")})
+        broadcaster = services.frame_broadcaster.FrameBroadcaster()
+        await broadcaster.start()
+        try:
+            return await wait_for_frame(broadcaster)
+        finally:
+            await broadcaster.stop()
+
+    frame = asyncio.run(run())
+    assert len(polls) == 2
+    assert frame.seq == 5
@@ -0,0 +1,86 @@
+import numpy as np
+import pytest
+
+from ground_plane import GroundMap, fit_ground_plane, load_ground_map, median_depth
+from measurement import measure_object, measure_objects
+from synthetic_scene import D435_COLOR_INTRINSICS, Box, SyntheticScene
+
+DEPTH_SCALE = 0.001
+# ROI of CapturePipeline
+MEASUREMENT_ROI = (254, 56, 602, 404)
+TILT = (-5.0, 4.0)
+
+HEIGHT_TOLERANCE_MM = 3.0
+DISTANCE_TOLERANCE = 0.001
+NORMAL_TOLERANCE = 0.002
+
+
+@pytest.fixture(scope="module")
+def tilted_scene():
+    return SyntheticScene(roi=MEASUREMENT_ROI, tilt=TILT)
+
+
+def calibrate(scene, rng, frames=5):
+    depth = median_depth([scene.render([], rng).depth for _ in range(frames)])
+    plane = fit_ground_plane(depth, D435_COLOR_INTRINSICS, MEASUREMENT_ROI[:2], DEPTH_SCALE)
+    return GroundMap.from_plane(plane, D435_COLOR_INTRINSICS, MEASUREMENT_ROI, DEPTH_SCALE)
+
+
+def test_fits_the_plane_of_a_tilted_table(tilted_scene, rng):
+    plane = calibrate(tilted_scene, rng).plane
+
+    # The table normal in camera coordinates
+    assert plane.normal == pytest.approx(tuple(tilted_scene.rotation[2]), abs=NORMAL_TOLERANCE)
+    assert plane.distance == pytest.approx(tilted_scene.table_distance, abs=DISTANCE_TOLERANCE)
+    assert plane.tilt_degrees == pytest.approx(np.degrees(np.arccos(tilted_scene.rotation[2, 2])), abs=0.1)
+    assert plane.inlier_ratio > 0.99
+
+
+def test_boxes_on_the_table_are_outliers(tilted_scene, rng):
+    frame = tilted_scene.render([Box(0.03, 0.02, 0.15, 0.10, 0.08, 20)], rng)
+    plane = fit_ground_plane(frame.depth, D435_COLOR_INTRINSICS, MEASUREMENT_ROI[:2], DEPTH_SCALE)
+
+    assert plane.normal == pytest.approx(tuple(tilted_scene.rotation[2]), abs=NORMAL_TOLERANCE)
+    assert plane.distance == pytest.approx(tilted_scene.table_distance, abs=DISTANCE_TOLERANCE)
+    assert plane.inlier_ratio < 0.95
+
+
+def test_measures_against_the_calibrated_table(tilted_scene, rng):
+    ground = calibrate(tilted_scene, rng)
+    boxes = [Box(0.0, 0.0, 0.20, 0.12, 0.07, 15), Box(0.05, -0.04, 0.10, 0.08, 0.04, -30)]
+    for box in boxes:
+        frame = tilted_scene.render([box], rng)
+        single = measure_object(frame.depth, frame.color, DEPTH_SCALE, verbose=False, ground=ground).measurement
+        multi = measure_objects(frame.depth, frame.color, DEPTH_SCALE, verbose=False, ground=ground).measurements
+        # The fixed table distance is off by up to 20 mm across the ROI
+        level = measure_object(frame.depth, frame.color, DEPTH_SCALE, verbose=False).measurement
+
+        assert abs(single["height"] - box.height * 1000) <= HEIGHT_TOLERANCE_MM
+        assert len(multi) == 1
+        assert abs(multi[0]["height"] - box.height * 1000) <= HEIGHT_TOLERANCE_MM
+        assert abs(level["height"] - box.height * 1000) > HEIGHT_TOLERANCE_MM
+
+
+def test_level_table_map_matches_the_fixed_ground():
+    ground = GroundMap.flat(0.730, DEPTH_SCALE)
+    heights = ground.heights_mm(np.array([[725, 724, 0, 731]], dtype=np.uint16))
+
+    assert heights[0, :2].tolist() == [5.0, 6.0]
+    assert np.isnan(heights[0, 2])
+    assert heights[0, 3] == -1.0
+
+
+def test_calibration_round_trip(tilted_scene, rng, tmp_path):
+    ground = calibrate(tilted_scene, rng)
+    path = str(tmp_path / "ground_calibration.npz")
+    ground.save(path)
+
+    loaded = load_ground_map(path, MEASUREMENT_ROI, DEPTH_SCALE)
+    assert loaded.plane == ground.plane
+    assert loaded.intrinsics == D435_COLOR_INTRINSICS
+    np.testing.assert_array_equal(loaded.table_depth, ground.table_depth)
+    np.testing.assert_array_equal(loaded.mm_per_unit, ground.mm_per_unit)
+
+    assert load_ground_map(str(tmp_path / "missing.npz"), MEASUREMENT_ROI, DEPTH_SCALE) is None
+    with pytest.raises(ValueError):
+        load_ground_map(path, (0, 0, 348, 348), DEPTH_SCALE)
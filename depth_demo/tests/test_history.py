@@ -0,0 +1,63 @@
+import asyncio
+import json
+
+import fakeredis
+import pytest
+
+import services.history
+import services.measurement_events
+import stores.valkey
+from publisher import ValkeyPublisher
+
+OBJECTS = [
+    {"width": 110.0, "length": 180.0, "x": 120.0, "y": 90.0, "height": 70.0},
+    {"width": 50.0, "length": 60.0, "x": 250.0, "y": 240.0},
+]
+
+
+class DisconnectingRequest:
+    """
+    Stands in for the request of an SSE client, disconnects once the history was replayed
+    """
+
+    async def is_disconnected(self):
+        return True
+
+
+@pytest.fixture
+def server(monkeypatch):
+    server = fakeredis.FakeServer()
+    monkeypatch.setattr(stores.valkey.ValkeyStore, "_async_instance", fakeredis.aioredis.FakeRedis(server=server))
+    monkeypatch.setattr(services.measurement_events.MeasurementEventHub, "_instance", None)
+    return server
+
+
+def publish(server, frames):
+    publisher = ValkeyPublisher(fakeredis.FakeRedis(server=server))
+    for index in range(frames):
+        # Single object frames between the multi object ones, as when the mode was switched
+        objects = OBJECTS if index % 2 else None
+        publisher.publish_frame(b"jpeg", {"width": 110.0, "length": 180.0, "height": 70.0}, objects=objects)
+
+
+def test_records_after_hold_the_object_lists(server):
+    publish(server, 6)
+
+    records = asyncio.run(services.history.HistoryService.get_records_after(2))
+
+    assert [record["seq"] for record in records] == [3, 4, 5, 6]
+    assert [record.get("objects") for record in records] == [None, OBJECTS, None, OBJECTS]
+    assert all(record["height"] == 70.0 for record in records)
+
+
+def test_event_stream_resumes_over_multi_object_records(server):
+    publish(server, 4)
+
+    async def resume():
+        return [event async for event in services.measurement_events.MeasurementEventService.get_events(DisconnectingRequest(), 1)]
+
+    events = asyncio.run(resume())
+
+    records = [json.loads(event.split("data: ", 1)[1]) for event in events if event.startswith("id: ")]
+    assert [record["seq"] for record in records] == [2, 3, 4]
+    assert records[0]["objects"] == OBJECTS
@@ -0,0 +1,146 @@
+import sys
+import time
+
+import cv2
+import numpy as np
+import pytest
+
+import rs_emulator
+from synthetic_scene import Box
+
+# The refinement of four cameras has to take well under a second
+REFINEMENT_BUDGET = 1.0
+# The chessboard calibration errors below move the table by about 1cm, the voxels are 1cm
+ALIGNMENT_TOLERANCE = 0.005
+
+BOXES = [
+    Box(0.02, 0.03, 0.16, 0.10, 0.08, 25),
+    Box(-0.08, -0.04, 0.10, 0.08, 0.12, -40),
+    Box(0.09, -0.07, 0.12, 0.07, 0.05, 70),
+]
+# Position (x, y) and yaw of the cameras, all looking straight down
+CAMERAS = [(0.0, 0.0, 0.0), (0.06, 0.0, 15.0), (0.0, 0.05, -20.0), (0.05, 0.05, 40.0)]
+
+
+@pytest.fixture(autouse=True)
+def emulator():
+    """
+    As in test_rs_emulator.py, the modules imported with the emulator installed are unloaded again
+    """
+    modules = set(sys.modules)
+    yield
+    rs_emulator.uninstall()
+    for name in set(sys.modules) - modules:
+        del sys.modules[name]
+
+
+def camera_to_table(x, y, yaw):
+    """
+    True transformation of an emulated camera into table coordinates, z is the depth below the cameras
+    """
+    from calibration_kabsch import Transformation
+
+    cos, sin = np.cos(np.radians(yaw)), np.sin(np.radians(yaw))
+    return Transformation(np.array([[cos, -sin, 0], [sin, cos, 0], [0, 0, 1]]), np.array([x, y, 0.0]))
+
+
+def perturbed(transformation, rotation_degrees, translation):
+    from calibration_kabsch import Transformation
+
+    rotation = cv2.Rodrigues(np.radians(np.asarray(rotation_degrees, dtype=np.float64)))[0]
+    pose_mat = transformation.pose_mat
+    return Transformation(np.matmul(rotation, pose_mat[:3, :3]), np.matmul(rotation, pose_mat[:3, 3]) + translation)
+
+
+def start_cameras():
+    source = rs_emulator.SyntheticSource(BOXES, bank_size=1)
+    cameras = [rs_emulator.VirtualCamera("%012d" % (index + 1), source, x=x, y=y, yaw=yaw) for (index, (x, y, yaw)) in enumerate(CAMERAS)]
+    rs_emulator.install(cameras, realtime=False)
+
+    import pyrealsense2 as rs
+    from realsense_device_manager import DeviceManager
+
+    rs_config = rs.config()
+    rs_config.enable_stream(rs.stream.depth, 848, 480, rs.format.z16, 30)
+    device_manager = DeviceManager(rs.context(), rs_config)
+    device_manager.enable_all_devices()
+    return device_manager
+
+
+def refine_perturbed_calibration():
+    """
+    Refines the true calibration of the four cameras with chessboard calibration errors added,
+    returns the calibrations, the refinement and its duration
+    """
+    device_manager = start_cameras()
+    from icp_refinement import refine_transformations_icp
+
+    frames = device_manager.poll_frames()
+    intrinsics = device_manager.get_device_intrinsics(frames)
+    serials = sorted(intrinsics)
+    truth = {serial: camera_to_table(*camera) for (serial, camera) in zip(serials, CAMERAS)}
+    # Chessboard calibration errors of the devices after the first, which is kept fixed
+    errors = [((0, 0, 0), (0, 0, 0)), ((0.4, -0.3, 0.5), (0.004, -0.003, 0.002)),
+              ((-0.3, 0.2, -0.6), (-0.003, 0.004, -0.002)), ((0.2, 0.4, 0.3), (0.003, 0.002, 0.003))]
+    calibration = {serial: perturbed(truth[serial], *error) for (serial, error) in zip(serials, errors)}
+
+    started_at = time.perf_counter()
+    refined, statistics = refine_transformations_icp(frames, calibration, intrinsics)
+    elapsed = time.perf_counter() - started_at
+    device_manager.disable_streams()
+    return truth, calibration, refined, statistics, elapsed
+
+
+def test_refinement_aligns_four_cameras():
+    truth, calibration, refined, statistics, _ = refine_perturbed_calibration()
+
+    # Corners of the table area with the boxes
+    points = np.array([[-0.1, 0.1, -0.1, 0.1], [-0.1, -0.1, 0.1, 0.1], [0.73, 0.73, 0.73, 0.73]])
+    for serial in sorted(truth)[1:]:
+        before = np.abs(calibration[serial].apply_transformation(points) - truth[serial].apply_transformation(points)).max()
+        after = np.abs(refined[serial].apply_transformation(points) - truth[serial].apply_transformation(points)).max()
+        assert after < ALIGNMENT_TOLERANCE < before
+        assert statistics[serial]["rmse_after"] < statistics[serial]["rmse_before"]
+
+
+@pytest.mark.benchmark
+def test_refinement_budget():
+    elapsed = refine_perturbed_calibration()[-1]
+
+    assert elapsed < REFINEMENT_BUDGET
+
+
+def test_rmse_after_is_measured_on_the_returned_pose():
+    start_cameras()
+    from icp_refinement import VoxelHashIndex, point_to_plane_icp
+
+    rng = np.random.default_rng(0)
+    # A box corner: three perpendicular planes fix all six degrees of freedom
+    planes = [np.vstack((rng.uniform(0, 0.2, (2, 3000)), np.zeros((1, 3000))))[order] for order in ([0, 1, 2], [0, 2, 1], [2, 0, 1])]
+    target = np.hstack(planes)
+    source = perturbed(camera_to_table(0.0, 0.0, 0.0), (1.0, -0.5, 0.8), (0.004, 0.003, -0.002)).apply_transformation(target)
+    index = VoxelHashIndex(target, 0.01)
+
+    pose_mat, statistics = point_to_plane_icp(source, index, max_iterations=1)
+
+    aligned = np.matmul(pose_mat[:3, :3], source) + pose_mat[:3, [3]]
+    _, final = point_to_plane_icp(aligned, index, max_iterations=1)
+    assert statistics["iterations"] == 1
+    assert statistics["rmse_after"] < statistics["rmse_before"]
+    assert statistics["rmse_after"] == pytest.approx(final["rmse_before"])
+
+
+def test_empty_reference_cloud_keeps_the_calibration():
+    device_manager = start_cameras()
+    from icp_refinement import refine_transformations_icp
+
+    frames = device_manager.poll_frames()
+    intrinsics = device_manager.get_device_intrinsics(frames)
+    serials = sorted(intrinsics)
+    calibration = {serial: camera_to_table(*camera) for (serial, camera) in zip(serials, CAMERAS)}
+    # Only the cameras themselves lie within this region, none of their points
+    refined, statistics = refine_transformations_icp(frames, calibration, intrinsics, roi_2d=[5.0, 6.0, 5.0, 6.0])
+    device_manager.disable_streams()
+
+    assert all(refined[serial] is calibration[serial] for serial in serials)
+    assert all(statistics[serial]["iterations"] == 0 for serial in serials)
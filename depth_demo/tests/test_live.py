@@ -0,0 +1,42 @@
+import json
+
+import fastapi
+import fastapi.testclient
+import pytest
+
+import routers.live
+import services.frame_broadcaster
+
+
+@pytest.fixture
+def broadcaster(monkeypatch):
+    monkeypatch.setattr(services.frame_broadcaster.FrameBroadcaster, "_instance", None)
+    return services.frame_broadcaster.FrameBroadcaster.get_instance()
+
+
+@pytest.fixture
+def client():
+    app = fastapi.FastAPI()
+    app.include_router(routers.live.router)
+    with fastapi.testclient.TestClient(app) as client:
+        yield client
+
+
+def test_measurement_precedes_its_frame(broadcaster, client):
+    record = {"seq": 7, "width": 100.0, "length": 200.0, "height": 70.0, "objects": [{"label": "a}b"}]}
+    broadcaster.publish_jpeg(7, b"jpeg", json.dumps(record, indent=1))
+
+    with client.websocket_connect("/ws/live") as websocket:
+        assert json.loads(websocket.receive_text()) == {"type": "measurement", **record}
+        assert websocket.receive_bytes() == (7).to_bytes(8, "big") + b"jpeg"
+        # The subscription ends with the connection
+        websocket.close()
+    assert not broadcaster._subscribers
+
+
+def test_frame_without_its_measurement_is_sent_alone(broadcaster, client):
+    broadcaster.publish_jpeg(8, b"jpeg", json.dumps({"seq": 7, "height": 70.0}))
+
+    assert broadcaster.latest.measurement_message is None
+    with client.websocket_connect("/ws/live") as websocket:
+        assert websocket.receive_bytes() == (8).to_bytes(8, "big") + b"jpeg"
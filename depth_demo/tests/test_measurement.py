@@ -0,0 +1,142 @@
+import time
+
+import numpy as np
+import pytest
+
+from measurement import measure_object, measure_objects
+from synthetic_scene import Box
+
+DEPTH_SCALE = 0.001
+
+# Accuracy bounds of a single frame
+HEIGHT_TOLERANCE_MM = 3.0
+FOOTPRINT_TOLERANCE_PX = 5.0
+# Per frame latency budget of measure_object(), of the 33 ms a frame at 30 fps leaves
+LATENCY_BUDGET_MEDIAN = 0.010
+LATENCY_BUDGET_P95 = 0.020
+
+
+def random_boxes(scene, count, seed=0):
+    rng = np.random.default_rng(seed)
+    # Boxes which fit into the ROI at any yaw
+    return [scene.random_box(rng, max_offset=0.02, size_range=(0.06, 0.16), height_range=(0.03, 0.15)) for _ in range(count)]
+
+
+def measure(scene, boxes, rng):
+    frame = scene.render(boxes, rng)
+    return measure_object(frame.depth, frame.color, DEPTH_SCALE, verbose=False).measurement
+
+
+@pytest.mark.parametrize("yaw", [0, 15, 45, 80])
+def test_measures_a_single_box(scene, rng, yaw):
+    box = Box(0.0, 0.0, 0.20, 0.12, 0.07, yaw)
+    measurement = measure(scene, [box], rng)
+
+    length, width = scene.footprint_pixels(box)
+    assert abs(max(measurement["width"], measurement["length"]) - length) <= FOOTPRINT_TOLERANCE_PX
+    assert abs(min(measurement["width"], measurement["length"]) - width) <= FOOTPRINT_TOLERANCE_PX
+    assert abs(measurement["height"] - 70) <= HEIGHT_TOLERANCE_MM
+
+
+def test_accuracy_over_random_boxes(scene, rng):
+    height_errors = []
+    footprint_errors = []
+    for box in random_boxes(scene, 40):
+        measurement = measure(scene, [box], rng)
+        length, width = scene.footprint_pixels(box)
+        height_errors.append(measurement["height"] - box.height * 1000)
+        footprint_errors.append(max(measurement["width"], measurement["length"]) - length)
+        footprint_errors.append(min(measurement["width"], measurement["length"]) - width)
+
+    height_errors = np.array(height_errors)
+    footprint_errors = np.array(footprint_errors)
+    assert np.all(np.abs(height_errors) <= HEIGHT_TOLERANCE_MM)
+    assert np.all(np.abs(footprint_errors) <= FOOTPRINT_TOLERANCE_PX)
+    # The contour runs around the outer pixels and takes in the visible side faces, the
+    # footprint comes out 2-3 px too large
+    assert abs(height_errors.mean()) < 2.0
+    assert 0 < footprint_errors.mean() < 3.5
+
+
+def test_empty_table_measures_nothing(scene, rng):
+    assert measure(scene, [], rng) == {}
+
+
+def test_measures_the_largest_of_several_boxes(scene, rng):
+    small = Box(-0.07, -0.07, 0.06, 0.05, 0.05, 10)
+    large = Box(0.05, 0.04, 0.14, 0.10, 0.10, -20)
+    measurement = measure(scene, [small, large], rng)
+
+    assert abs(measurement["height"] - 100) <= HEIGHT_TOLERANCE_MM
+    assert abs(max(measurement["width"], measurement["length"]) - scene.footprint_pixels(large)[0]) <= FOOTPRINT_TOLERANCE_PX
+
+
+def test_measures_every_box_on_the_table(scene, rng):
+    boxes = [
+        Box(0.05, 0.04, 0.12, 0.08, 0.10, -20),
+        Box(-0.06, -0.06, 0.08, 0.05, 0.05, 10),
+        Box(-0.06, 0.07, 0.07, 0.06, 0.03, 45),
+    ]
+    frame = scene.render(boxes, rng)
+    measurements = measure_objects(frame.depth, frame.color, DEPTH_SCALE, verbose=False).measurements
+
+    # Largest first, the boxes above are listed by footprint
+    assert len(measurements) == len(boxes)
+    for (box, measurement) in zip(boxes, measurements):
+        length, width = scene.footprint_pixels(box)
+        assert abs(max(measurement["width"], measurement["length"]) - length) <= FOOTPRINT_TOLERANCE_PX
+        assert abs(min(measurement["width"], measurement["length"]) - width) <= FOOTPRINT_TOLERANCE_PX
+        assert abs(measurement["height"] - box.height * 1000) <= HEIGHT_TOLERANCE_MM
+
+
+def test_multi_object_mode_agrees_with_the_single_object_mode(scene, rng):
+    for box in random_boxes(scene, 10, seed=2):
+        frame = scene.render([box], rng)
+        single = measure_object(frame.depth, frame.color, DEPTH_SCALE, verbose=False).measurement
+        multi = measure_objects(frame.depth, frame.color, DEPTH_SCALE, verbose=False).measurements
+
+        assert len(multi) == 1
+        assert abs(multi[0]["height"] - single["height"]) <= 1.0
+        assert abs(max(multi[0]["width"], multi[0]["length"]) - max(single["width"], single["length"])) <= FOOTPRINT_TOLERANCE_PX
+
+
+def test_multi_object_mode_ignores_holes_and_small_regions(scene, rng):
+    frame = scene.render([], rng)
+    depth = frame.depth.copy()
+    # A patch without depth and a small raised speck
+    depth[10:60, 10:60] = 0
+    depth[300:310, 300:310] = 700
+
+    assert measure_objects(depth, frame.color, DEPTH_SCALE, verbose=False).measurements == []
+
+
+@pytest.mark.benchmark
+def test_latency_budget(scene, rng):
+    frames = [scene.render([box], rng) for box in random_boxes(scene, 30, seed=1)]
+    measure_object(frames[0].depth, frames[0].color, DEPTH_SCALE, verbose=False)
+
+    timings = []
+    for frame in frames:
+        started_at = time.perf_counter()
+        measure_object(frame.depth, frame.color, DEPTH_SCALE, verbose=False)
+        timings.append(time.perf_counter() - started_at)
+
+    assert np.median(timings) < LATENCY_BUDGET_MEDIAN
+    assert np.percentile(timings, 95) < LATENCY_BUDGET_P95
+
+
+@pytest.mark.benchmark
+def test_multi_object_latency_budget(scene, rng):
+    # The same budget for a frame with several objects as for one object in the single object mode
+    frames = [scene.render([Box(-0.06, -0.06, 0.08, 0.05, 0.05, 10), Box(0.05, 0.04, 0.12, 0.08, 0.10, -20), box], rng)
+              for box in [Box(-0.06, 0.07, 0.07, 0.06, 0.03, yaw) for yaw in range(0, 90, 3)]]
+    measure_objects(frames[0].depth, frames[0].color, DEPTH_SCALE, verbose=False)
+
+    timings = []
+    for frame in frames:
+        started_at = time.perf_counter()
+        measure_objects(frame.depth, frame.color, DEPTH_SCALE, verbose=False)
+        timings.append(time.perf_counter() - started_at)
+
+    assert np.median(timings) < LATENCY_BUDGET_MEDIAN
+    assert np.percentile(timings, 95) < LATENCY_BUDGET_P95
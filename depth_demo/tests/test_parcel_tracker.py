@@ -0,0 +1,147 @@
+import time
+
+import numpy as np
+
+from measurement import measure_objects
+from parcel_tracker import ParcelTracker
+from synthetic_scene import Box
+
+DEPTH_SCALE = 0.001
+ROI_SHAPE = (348, 348)
+
+HEIGHT_TOLERANCE_MM = 3.0
+FOOTPRINT_TOLERANCE_PX = 5.0
+# Per frame budget of the tracking with several parcels in view
+UPDATE_BUDGET = 0.001
+
+
+def conveyor(scene, rng, parcels, frames, speed=0.006):
+    """
+    Runs parcels given as (Box at the ROI centre, first frame) through the ROI along x, speed in metres per frame
+    """
+    tracker = ParcelTracker(ROI_SHAPE)
+    events = []
+    for frame_index in range(frames):
+        boxes = []
+        for (box, first_frame) in parcels:
+            x = -0.30 + speed * (frame_index - first_frame)
+            if -0.30 < x < 0.30:
+                boxes.append(box._replace(x=box.x + x))
+        frame = scene.render(boxes, rng)
+        result = measure_objects(frame.depth, frame.color, DEPTH_SCALE, verbose=False)
+        events += tracker.update(result.measurements, result.rects, frame_index + 1, frame_index / 30)
+    return events, tracker
+
+
+def linear_objects(count, frame_index, speed=3.0):
+    """
+    count 50x70 pixel objects side by side moving along x, as measure_objects() would report them
+    """
+    objects, rects = [], []
+    for index in range(count):
+        x, y = -40 + speed * frame_index, 40.0 + 80 * index
+        objects.append({"width": 50.0, "length": 70.0, "height": 60.0, "x": x, "y": y})
+        rects.append(((x, y), (50.0, 70.0), 0.0))
+    return objects, rects
+
+
+def test_one_event_per_parcel(scene, rng):
+    # The depth footprint takes in the side faces turned towards the optical axis, the lanes are
+    # kept close enough to it for the single frame tolerance
+    parcels = [
+        (Box(0.0, 0.10, 0.12, 0.08, 0.07, 10), 0),
+        (Box(0.0, 0.0, 0.10, 0.07, 0.05, -15), 25),
+        (Box(0.0, -0.09, 0.09, 0.09, 0.06, 40), 45),
+    ]
+    events, tracker = conveyor(scene, rng, parcels, 150)
+
+    assert [event.parcel_id for event in events] == [1, 2, 3]
+    assert len(tracker) == 0
+    for (event, (box, _)) in zip(events, parcels):
+        length, width = scene.footprint_pixels(box)
+        assert event.samples > 10
+        assert abs(event.measurement["length"] - length) <= FOOTPRINT_TOLERANCE_PX
+        assert abs(event.measurement["width"] - width) <= FOOTPRINT_TOLERANCE_PX
+        assert abs(event.measurement["height"] - box.height * 1000) <= HEIGHT_TOLERANCE_MM
+
+
+def test_parcel_is_only_measured_fully_inside_the_roi():
+    tracker = ParcelTracker(ROI_SHAPE)
+    events = []
+    for frame_index in range(150):
+        objects, rects = linear_objects(1, frame_index)
+        # Cut off at the ROI border, the measured footprint shrinks
+        (x, y), (width, length), angle = rects[0]
+        visible = min(x + width / 2, 348) - max(x - width / 2, 0)
+        if visible <= 0:
+            objects, rects = [], []
+        elif visible < width:
+            objects[0]["width"] = visible
+            rects[0] = ((min(x + width / 2, 348) - visible / 2, y), (visible, length), angle)
+        events += tracker.update(objects, rects, frame_index + 1, frame_index / 30)
+
+    # x runs from -40 to 407, the 50 pixels wide object is fully inside for x from 27 to 321
+    (event,) = events
+    assert event.samples == len(range(23, 121))
+    assert event.measurement["width"] == 50.0
+
+
+def test_parcel_larger_than_the_roi_gets_no_event():
+    tracker = ParcelTracker(ROI_SHAPE)
+    events = []
+    for frame_index in range(100):
+        # 400 pixels wide, cut off at both ROI borders while it passes
+        x = -200 + 8 * frame_index
+        x0, x1 = max(x - 200, 0), min(x + 200, 348)
+        if x1 - x0 > 0:
+            objects = [{"width": float(x1 - x0), "length": 70.0, "height": 60.0, "x": (x0 + x1) / 2, "y": 170.0}]
+            rects = [(((x0 + x1) / 2, 170.0), (float(x1 - x0), 70.0), 0.0)]
+        else:
+            objects, rects = [], []
+        events += tracker.update(objects, rects, frame_index + 1, frame_index / 30)
+    events += tracker.flush()
+
+    assert events == []
+    assert tracker.unmeasured == 1
+
+
+def test_events_survive_dropped_frames_and_continue_the_ids():
+    tracker = ParcelTracker(ROI_SHAPE, first_id=41)
+    events = []
+    for frame_index in range(0, 150, 2):
+        objects, rects = linear_objects(2, frame_index)
+        # Gone once past the ROI
+        keep = [index for (index, rect) in enumerate(rects) if rect[0][0] - 35 < 348]
+        events += tracker.update([objects[index] for index in keep], [rects[index] for index in keep], frame_index + 1, frame_index / 30)
+
+    assert [event.parcel_id for event in events] == [41, 42]
+    for event in events:
+        assert event.measurement == {"width": 50.0, "length": 70.0, "height": 60.0}
+
+
+def test_short_tracks_are_noise():
+    tracker = ParcelTracker(ROI_SHAPE, min_frames=3)
+    objects, rects = linear_objects(1, 60)
+    events = tracker.update(objects, rects, 1, 0.0) + tracker.update(objects, rects, 2, 0.03)
+    for seq in range(3, 10):
+        events += tracker.update([], [], seq, seq / 30)
+
+    assert events == []
+    assert len(tracker) == 0
+    # The ID was not handed out to an event, but it is not reused either
+    assert tracker.next_id == 2
+
+
+def test_update_budget():
+    tracker = ParcelTracker(ROI_SHAPE)
+    for frame_index in range(20):
+        tracker.update(*linear_objects(4, frame_index), frame_index + 1, frame_index / 30)
+
+    timings = []
+    for frame_index in range(20, 120):
+        objects, rects = linear_objects(4, frame_index)
+        started_at = time.perf_counter()
+        tracker.update(objects, rects, frame_index + 1, frame_index / 30)
+        timings.append(time.perf_counter() - started_at)
+
+    assert np.median(timings) < UPDATE_BUDGET
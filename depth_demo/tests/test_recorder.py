@@ -0,0 +1,63 @@
+import numpy as np
+
+from recorder import Recorder, Recording
+
+
+def test_records_and_replays_frames(tmp_path, rng):
+    recorder = Recorder(str(tmp_path / "recording"), {"depth_scale": 0.001})
+    depth = rng.integers(600, 800, (48, 64), dtype=np.uint16)
+    color = rng.integers(0, 256, (48, 64, 3), dtype=np.uint8)
+    for seq in range(3):
+        recorder.record(seq, depth, color, {"height": seq} if seq else None)
+    recorder.close()
+
+    recording = Recording(str(tmp_path / "recording"))
+    assert len(recording) == 3
+    frame = recording[recording.position(2)]
+    np.testing.assert_array_equal(frame.depth, depth)
+    np.testing.assert_array_equal(frame.color, color)
+    assert frame.measurement == {"height": 2}
+    assert recording[0].measurement is None
+    recording.close()
+
+
+def test_frame_which_cannot_be_encoded_is_skipped(tmp_path):
+    recorder = Recorder(str(tmp_path / "recording"), queue_size=16)
+    depth = np.zeros((48, 64), dtype=np.uint16)
+    color = np.zeros((48, 64, 3), dtype=np.uint8)
+    for seq in range(1, 6):
+        # Not JSON serialisable, only this frame is lost
+        recorder.record(seq, depth, color, {"height": object()} if seq == 2 else None)
+    recorder.close()
+
+    assert isinstance(recorder.encode_error, TypeError)
+    assert recorder.error is None
+    assert (recorder.recorded, recorder.dropped) == (4, 1)
+    recording = Recording(str(tmp_path / "recording"))
+    assert [frame.seq for frame in recording.frames()] == [1, 3, 4, 5]
+    recording.close()
+
+
+def test_archive_error_stops_recording(tmp_path):
+    recorder = Recorder(str(tmp_path / "recording"), queue_size=2)
+    depth = np.zeros((48, 64), dtype=np.uint16)
+    color = np.zeros((48, 64, 3), dtype=np.uint8)
+    # The archive is gone, e.g. a removed disk
+    recorder.index_file.close()
+    for seq in range(1, 10):
+        recorder.record(seq, depth, color)
+    recorder.close()
+
+    assert recorder.error is not None
+    assert (recorder.recorded, recorder.dropped) == (0, 9)
+    assert not recorder.thread.is_alive()
+
+
+def test_empty_recording_can_be_opened(tmp_path):
+    recorder = Recorder(str(tmp_path / "recording"), {"depth_scale": 0.001})
+    recorder.close()
+
+    recording = Recording(str(tmp_path / "recording"))
+    assert len(recording) == 0
+    assert recording.meta["depth_scale"] == 0.001
+    assert recording.color_shape is None
@@ -0,0 +1,124 @@
+import concurrent.futures
+import os
+import subprocess
+import sys
+import time
+
+import numpy as np
+import pytest
+
+import rs_emulator
+import soak_multicam
+from recorder import Recorder
+from synthetic_scene import Box
+
+HEIGHT_TOLERANCE_MM = 3.0
+# The bounding box of the merged point clouds includes the noisy box edges of every camera
+MULTICAM_FOOTPRINT_TOLERANCE_MM = 15.0
+
+
+@pytest.fixture(autouse=True)
+def emulator():
+    """
+    The modules imported while the emulator is installed keep it as their pyrealsense2, they are
+    unloaded again so that no other test gets the emulator
+    """
+    modules = set(sys.modules)
+    yield
+    rs_emulator.uninstall()
+    for name in set(sys.modules) - modules:
+        del sys.modules[name]
+
+
+def start_camera(fps=30, realtime=True):
+    source = rs_emulator.SyntheticSource([Box(0.0, 0.0, 0.12, 0.08, 0.07)], bank_size=2)
+    rs_emulator.install([rs_emulator.VirtualCamera("000000000001", source, 424, 240, fps)], realtime)
+    pipeline = rs_emulator.pipeline()
+    config = rs_emulator.config()
+    config.enable_stream(rs_emulator.stream.depth, 424, 240, rs_emulator.format.z16, fps)
+    config.enable_stream(rs_emulator.stream.color, 424, 240, rs_emulator.format.bgr8, fps)
+    pipeline.start(config)
+    return pipeline
+
+
+def test_realtime_pipeline_delivers_at_frame_rate():
+    pipeline = start_camera(fps=30)
+    started_at = time.perf_counter()
+    frame_numbers = [pipeline.wait_for_frames().get_frame_number() for _ in range(10)]
+    elapsed = time.perf_counter() - started_at
+
+    assert frame_numbers == sorted(set(frame_numbers))
+    # The first frameset is due at start, the next nine 1/30 s apart
+    assert elapsed >= 8 / 30
+    assert not pipeline.poll_for_frames()
+    pipeline.stop()
+
+
+def test_frameset_matches_the_enabled_streams():
+    pipeline = start_camera(realtime=False)
+    frames = pipeline.wait_for_frames()
+
+    assert frames.size() == 2
+    depth_frame = frames.get_depth_frame()
+    assert depth_frame.is_depth_frame()
+    assert np.asanyarray(depth_frame.get_data()).shape == (240, 424)
+    assert np.asanyarray(frames.get_color_frame().get_data()).shape == (240, 424, 3)
+    assert depth_frame.get_distance(212, 120) == pytest.approx(0.73 - 0.07, abs=0.01)
+    intrinsics = depth_frame.get_profile().as_video_stream_profile().get_intrinsics()
+    assert (intrinsics.width, intrinsics.height, intrinsics.ppx) == (424, 240, 212)
+    pipeline.stop()
+
+
+def test_noise_is_the_same_in_every_process():
+    # String hashes differ between processes with PYTHONHASHSEED, the noise must not
+    script = ("import sys; sys.path.insert(0, sys.argv[1])\n"
+              "import rs_emulator, synthetic_scene\n"
+              "source = rs_emulator.SyntheticSource([synthetic_scene.Box(0.0, 0.0, 0.12, 0.08, 0.07)], bank_size=1)\n"
+              "print(int(source.render(rs_emulator.VirtualCamera('000000000001', source), 424, 240, 0)[0].sum()))")
+    sums = [subprocess.run([sys.executable, "-c", script, os.path.dirname(rs_emulator.__path__[0])], env={**os.environ, "PYTHONHASHSEED": seed},
+                           capture_output=True, text=True, check=True).stdout for seed in ("1", "2")]
+
+    assert sums[0] == sums[1]
+
+
+def test_unknown_serial_is_rejected():
+    start_camera(realtime=False)
+    config = rs_emulator.config()
+    config.enable_device("999999999999")
+    with pytest.raises(RuntimeError):
+        rs_emulator.pipeline().start(config)
+
+
+def test_multicam_soak_calibrates_and_measures_the_box(monkeypatch):
+    stopped = []
+    shutdown = concurrent.futures.ThreadPoolExecutor.shutdown
+
+    def record_shutdown(executor, *args, **kwargs):
+        stopped.append(executor._thread_name_prefix)
+        shutdown(executor, *args, **kwargs)
+
+    monkeypatch.setattr(concurrent.futures.ThreadPoolExecutor, "shutdown", record_shutdown)
+
+    report = soak_multicam.run_multicam(cameras=2, realtime=False, duration=120, report_interval=120, frames=3)
+
+    assert report["frames"] == 3
+    measurement, truth = report["measurement"], report["truth"]
+    assert measurement["height"] == pytest.approx(truth["height"], abs=HEIGHT_TOLERANCE_MM)
+    measured_sides = sorted((measurement["length"], measurement["width"]))
+    true_sides = sorted((truth["length"], truth["width"]))
+    assert measured_sides == pytest.approx(true_sides, abs=MULTICAM_FOOTPRINT_TOLERANCE_MM)
+    # The chessboard search threads end with the calibration
+    assert "PoseEstimation" in stopped
+
+
+def test_single_soak_replays_a_recording(tmp_path, scene, rng):
+    recorder = Recorder(str(tmp_path / "recording"), {"roi": [0, 0, 348, 348], "depth_scale": 0.001})
+    for seq in range(1, 4):
+        frame = scene.render([Box(0.0, 0.0, 0.12, 0.08, 0.07)], rng)
+        recorder.record(seq, frame.depth, frame.color)
+    recorder.close()
+
+    report = soak_multicam.run_single(realtime=False, duration=60, report_interval=60, recording=str(tmp_path / "recording"), frames=10)
+
+    assert report["frames"] == 10
+    assert report["measurement"]["height"] == pytest.approx(70, abs=HEIGHT_TOLERANCE_MM)
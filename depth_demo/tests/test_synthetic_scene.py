@@ -0,0 +1,63 @@
+import time
+
+import numpy as np
+import pytest
+
+from synthetic_scene import NOISELESS, Box, SyntheticScene
+
+
+def test_noiseless_depth_of_table_and_box_top():
+    scene = SyntheticScene(sensor=NOISELESS)
+    frame = scene.render([Box(0.0, 0.0, 0.20, 0.12, 0.07)])
+
+    intrinsics = scene.intrinsics
+    assert frame.depth[0, 0] == 730
+    assert frame.depth[int(intrinsics.ppy), int(intrinsics.ppx)] == 660
+    assert frame.box_ids[0, 0] == -1
+    assert frame.box_ids[int(intrinsics.ppy), int(intrinsics.ppx)] == 0
+
+
+def test_box_top_covers_its_projected_footprint():
+    scene = SyntheticScene(sensor=NOISELESS)
+    box = Box(0.02, -0.01, 0.20, 0.12, 0.07, yaw=30)
+    frame = scene.render([box])
+
+    length, width = scene.footprint_pixels(box)
+    top_pixels = np.count_nonzero(frame.depth == 660)
+    assert abs(top_pixels - length * width) / (length * width) < 0.02
+
+
+def test_sensor_model_adds_noise_and_holes(rng):
+    scene = SyntheticScene()
+    frame = scene.render([Box(0.0, 0.0, 0.20, 0.12, 0.07)], rng)
+
+    table = frame.depth[frame.box_ids == -1]
+    valid = table[table > 0]
+    assert 0.002 < 1 - len(valid) / len(table) < 0.02
+    # About 0.8 mm at 730 mm, quantised to the disparity steps
+    assert 0.3 < valid.std() < 2.0
+    assert abs(np.median(valid) - 730) <= 1
+
+
+def test_render_is_seeded():
+    scene = SyntheticScene()
+    boxes = [Box(0.0, 0.0, 0.20, 0.12, 0.07)]
+    first = scene.render(boxes, np.random.default_rng(1))
+    second = scene.render(boxes, np.random.default_rng(1))
+
+    assert np.array_equal(first.depth, second.depth)
+    assert np.array_equal(first.color, second.color)
+
+
+@pytest.mark.benchmark
+def test_rendering_speed(scene, rng):
+    box = Box(0.0, 0.0, 0.20, 0.12, 0.07, yaw=20)
+    scene.render([box], rng)
+
+    started_at = time.perf_counter()
+    for _ in range(50):
+        scene.render([box], rng)
+    per_frame = (time.perf_counter() - started_at) / 50
+
+    # Thousands of ROI frames per minute
+    assert per_frame < 0.030
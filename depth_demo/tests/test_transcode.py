@@ -0,0 +1,38 @@
+import asyncio
+
+import cv2
+import numpy as np
+import pytest
+
+import services.frame_broadcaster
+import services.transcode
+
+
+@pytest.fixture
+def frame():
+    image = np.random.default_rng(0).integers(0, 256, (48, 64, 3), dtype=np.uint8)
+    jpeg = cv2.imencode('.jpg', image, [cv2.IMWRITE_JPEG_QUALITY, 95])[1].tobytes()
+    return services.frame_broadcaster.Frame(
+        seq=3,
+        jpeg=jpeg,
+        multipart=b'--frame\r\nContent-Type: image/jpeg\r\n\r\n' + jpeg + b'\r\n',
+        binary=(3).to_bytes(8, "big") + jpeg
+    )
+
+
+def test_variant_which_does_not_change_the_frame_keeps_its_bytes(frame):
+    cache = services.transcode.TranscodeCache()
+
+    transcoded = asyncio.run(cache.get(frame, services.transcode.Variant(width=64)))
+
+    assert transcoded is frame
+
+
+def test_variant_is_scaled(frame):
+    cache = services.transcode.TranscodeCache()
+
+    transcoded = asyncio.run(cache.get(frame, services.transcode.Variant(width=32)))
+
+    image = cv2.imdecode(np.frombuffer(transcoded.jpeg, dtype=np.uint8), cv2.IMREAD_COLOR)
+    assert image.shape == (24, 32, 3)
+    assert transcoded.binary == (3).to_bytes(8, "big") + transcoded.jpeg